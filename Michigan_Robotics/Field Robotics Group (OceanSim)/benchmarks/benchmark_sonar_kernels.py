@@ -0,0 +1,373 @@
+"""Throughput benchmark of the sonar kernel chains on synthetic point clouds.
+
+Runs without Isaac Sim: point clouds, normals, semantics and view transforms are generated with
+numpy and pushed through the same kernels the sensors launch, on the Warp CPU device and on every
+CUDA device that is present.
+
+    python benchmarks/benchmark_sonar_kernels.py                       # run and compare against the baseline
+    python benchmarks/benchmark_sonar_kernels.py --save-baseline       # store the current numbers as baseline
+    python benchmarks/benchmark_sonar_kernels.py --sizes 10000 100000 --devices cpu
+    python benchmarks/benchmark_sonar_kernels.py --chains binning_atomic binning_privatized binning_sorted \
+        binning_atomic_flat binning_privatized_flat binning_sorted_flat    # binning engines
+
+Baselines are stored per device in baseline.json next to this script (points/s of every chain and
+point count). Throughput depends on the machine, so save the baseline on the machine that runs the
+comparison. The script exits with status 1 when a chain is slower than its baseline by more than
+--tolerance.
+"""
+import argparse
+import json
+import os
+import sys
+import time
+
+import numpy as np
+import warp as wp
+
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(SCRIPT_DIR))
+
+from imaging_sonar_kernels import *
+from side_scan_pipeline import SideScanProcessor, BinningEngine, ReductionEngine
+
+DEFAULT_SIZES = [10_000, 100_000, 1_000_000, 5_000_000]
+DEFAULT_BASELINE = os.path.join(SCRIPT_DIR, "baseline.json")
+
+# Reflectivity per semantic id, ids 0 and 1 are BACKGROUND and UNLABELLED
+INDEX_TO_REFL = np.array([0.0, 0.0, 0.5, 1.0, 1.2], dtype=np.float32)
+
+
+def make_view_transform(sensor_pos: np.ndarray, pitch: float) -> np.ndarray:
+    """World-to-sensor matrix of a sensor at sensor_pos rotated by pitch about x."""
+    rot = np.array([[1.0, 0.0, 0.0],
+                    [0.0, np.cos(pitch), -np.sin(pitch)],
+                    [0.0, np.sin(pitch), np.cos(pitch)]])
+    view = np.eye(4)
+    view[:3, :3] = rot
+    view[:3, 3] = -rot @ sensor_pos
+    return view.astype(np.float32)
+
+
+def make_synthetic_ping(num_points: int,
+                        min_range: float,
+                        max_range: float,
+                        seed: int = 0,
+                        nan_fraction: float = 0.01,
+                        range_band: float = None) -> dict:
+    """Points scattered around a sensor with ranges slightly wider than [min_range, max_range].
+
+    Normals face the sensor with some jitter, semantic ids cover labelled and unlabelled points and
+    a small fraction of points are NaN like rays that hit nothing. With range_band the ranges are
+    squeezed into [min_range, min_range + range_band] instead, like a flat seabed that fills only a
+    few range bins.
+    """
+    rng = np.random.default_rng(seed)
+    sensor_pos = np.array([1.0, 2.0, 3.0])
+    directions = rng.normal(size=(num_points, 3)).astype(np.float32)
+    directions /= np.linalg.norm(directions, axis=1, keepdims=True)
+    if range_band is None:
+        margin = 0.05 * (max_range - min_range)
+        ranges = rng.uniform(min_range - margin, max_range + margin, size=num_points).astype(np.float32)
+    else:
+        ranges = rng.uniform(min_range, min_range + range_band, size=num_points).astype(np.float32)
+
+    pcl = (sensor_pos + directions * ranges[:, None]).astype(np.float32)
+    pcl[rng.random(num_points) < nan_fraction] = np.nan
+    normals = -directions + 0.3 * rng.normal(size=(num_points, 3)).astype(np.float32)
+    normals /= np.linalg.norm(normals, axis=1, keepdims=True)
+    semantics = rng.integers(0, len(INDEX_TO_REFL), size=num_points).astype(np.uint32)
+
+    return {
+        "pcl": pcl,
+        "normals": normals.astype(np.float32),
+        "semantics": semantics,
+        "viewTransform": make_view_transform(sensor_pos, pitch=0.3),
+    }
+
+
+def make_imaging_ping(num_points: int, seed: int = 0) -> dict:
+    """Forward-looking fan for the imaging sonar chain, 130 deg azimuth and 20 deg elevation, 1-5 m."""
+    rng = np.random.default_rng(seed)
+    ranges = rng.uniform(1.0, 5.0, size=num_points)
+    azimuth = np.deg2rad(rng.uniform(-65.0, 65.0, size=num_points))
+    elevation = np.deg2rad(rng.uniform(-10.0, 10.0, size=num_points))
+    # Camera frame: -z forward, x right, y up. Identity view transform, so world == camera frame.
+    pcl = np.stack([ranges * np.cos(elevation) * np.sin(azimuth),
+                    ranges * np.sin(elevation),
+                    -ranges * np.cos(elevation) * np.cos(azimuth)], axis=1).astype(np.float32)
+    normals = -pcl / np.linalg.norm(pcl, axis=1, keepdims=True)
+    semantics = rng.integers(0, len(INDEX_TO_REFL), size=num_points).astype(np.uint32)
+    return {
+        "pcl": pcl,
+        "normals": normals.astype(np.float32),
+        "semantics": semantics,
+        "viewTransform": np.eye(4, dtype=np.float32),
+    }
+
+
+class SideScanChain:
+    """SideScanProcessor ping: bin_points + post_process."""
+
+    def __init__(self, device, num_points: int, fused: bool = True, num_channels: int = 1, normalizing_method: str = "all"):
+        self.fused = fused
+        self.processor = SideScanProcessor(min_range=8.0, max_range=10.0, range_res=0.001,
+                                           device=device, num_channels=num_channels)
+        self.processor.set_normalizing_method(normalizing_method)
+        ping = make_synthetic_ping(num_points, 8.0, 10.0)
+        self.args = dict(pcl=wp.array(ping["pcl"], device=device),
+                         normals=wp.array(ping["normals"], device=device),
+                         semantics=wp.array(ping["semantics"], device=device),
+                         viewTransform=ping["viewTransform"],
+                         indexToRefl=wp.array(INDEX_TO_REFL, device=device),
+                         attenuation=1.0)
+        self.seed = 0
+
+    def run(self):
+        self.seed += 1
+        self.processor.bin_points(fused=self.fused, **self.args)
+        self.processor.post_process(seed=self.seed, fused=self.fused)
+
+
+class SideScanBinningChain:
+    """SideScanProcessor.bin_points alone with a fixed BinningEngine method, on a spread-out ping or
+    on a flat-seabed ping whose points fill only the first range_band meters (50 bins by default)."""
+
+    def __init__(self, device, num_points: int, method: str, range_band: float = None):
+        self.processor = SideScanProcessor(min_range=8.0, max_range=10.0, range_res=0.001, device=device)
+        self.processor.binning.set_method(method)
+        ping = make_synthetic_ping(num_points, 8.0, 10.0, range_band=range_band)
+        self.args = dict(pcl=wp.array(ping["pcl"], device=device),
+                         normals=wp.array(ping["normals"], device=device),
+                         semantics=wp.array(ping["semantics"], device=device),
+                         viewTransform=ping["viewTransform"],
+                         indexToRefl=wp.array(INDEX_TO_REFL, device=device),
+                         attenuation=1.0)
+
+    def run(self):
+        self.processor.bin_points(**self.args)
+
+
+class ImagingSonarChain:
+    """Imaging sonar ping as ImagingSonarSensor launches it:
+    compute_intensity -> world2local -> bin_process -> max -> noise -> make_sonar_map_all -> make_sonar_image.
+    With binning="sorted", bin_process is replaced by bin_keyed_process and a BinningEngine sort + segmented reduction.
+    With reduction="engine", the atomic max is replaced by the two-stage ReductionEngine.
+    """
+
+    def __init__(self, device, num_points: int, range_res: float = 0.008, angular_res: float = 0.5, binning: str = "atomic",
+                 reduction: str = "atomic"):
+        self.device = device
+        self.num_points = num_points
+        self.binning = None
+        self.reduction = ReductionEngine(device=device) if reduction == "engine" else None
+        ping = make_imaging_ping(num_points)
+        self.pcl = wp.array(ping["pcl"], device=device)
+        self.normals = wp.array(ping["normals"], device=device)
+        self.semantics = wp.array(ping["semantics"], device=device)
+        self.viewTransform = wp.mat44(ping["viewTransform"])
+        self.indexToRefl = wp.array(INDEX_TO_REFL, device=device)
+
+        self.intensity = wp.empty(num_points, dtype=wp.float32, device=device)
+        self.pcl_spher = wp.empty(num_points, dtype=wp.vec3, device=device)
+        self.pcl_bin_idx = wp.empty(num_points, dtype=wp.vec2ui, device=device)
+
+        # Size the grid from the data so that bin_process (which has no bounds checks) stays inside it
+        wp.launch(world2local, dim=num_points, inputs=[self.viewTransform, self.pcl],
+                  outputs=[self.pcl_spher], device=device)
+        spher = self.pcl_spher.numpy()
+        r_min, azi_min = spher[:, 0].min(), spher[:, 1].min()
+        r_num = int((spher[:, 0].max() - r_min) / range_res) + 1
+        azi_res = np.deg2rad(angular_res)
+        azi_num = int((spher[:, 1].max() - azi_min) / azi_res) + 1
+
+        self.sonar_grid = sonarGrid()
+        self.sonar_grid.x_offset = float(r_min)
+        self.sonar_grid.y_offset = float(azi_min)
+        self.sonar_grid.x_res = range_res
+        self.sonar_grid.y_res = azi_res
+        self.sonar_grid.x_num = r_num
+        self.sonar_grid.y_num = azi_num
+
+        r, azi = np.meshgrid(r_min + range_res * np.arange(r_num), azi_min + azi_res * np.arange(azi_num), indexing="ij")
+        self.r = wp.array(r, dtype=wp.float32, device=device)
+        self.azi = wp.array(azi, dtype=wp.float32, device=device)
+        self.max_range = float(r.max())
+        shape = (r_num, azi_num)
+        self.bin_sum = wp.zeros(shape, dtype=wp.float32, device=device)
+        self.bin_count = wp.zeros(shape, dtype=wp.int32, device=device)
+        self.bin_min_zenith = wp.zeros(shape, dtype=wp.float32, device=device)
+        self.gau_noise = wp.zeros(shape, dtype=wp.float32, device=device)
+        self.ray_noise = wp.zeros(shape, dtype=wp.float32, device=device)
+        self.sonar_data = wp.zeros(shape, dtype=wp.vec3, device=device)
+        self.max_intensity = wp.zeros(1, dtype=wp.float32, device=device)
+        # make_sonar_image writes column width - j, so the image is one column wider than the map
+        self.sonar_image = wp.zeros((r_num, azi_num + 1, 4), dtype=wp.uint8, device=device)
+        if binning == "sorted":
+            self.binning = BinningEngine(r_num * azi_num, device=device, method="sorted")
+        self.seed = 0
+
+    def run(self):
+        self.seed += 1
+        device = self.device
+        n = self.num_points
+        self.bin_sum.zero_()
+        self.bin_count.zero_()
+        self.bin_min_zenith.fill_(wp.inf)
+        wp.launch(compute_intensity, dim=n,
+                  inputs=[self.pcl, self.normals, self.viewTransform, self.semantics, self.indexToRefl, 1.0],
+                  outputs=[self.intensity], device=device)
+        wp.launch(world2local, dim=n, inputs=[self.viewTransform, self.pcl],
+                  outputs=[self.pcl_spher], device=device)
+        if self.binning is None:
+            wp.launch(bin_process, dim=n,
+                      inputs=[self.pcl_spher, self.intensity, self.semantics, self.sonar_grid],
+                      outputs=[self.bin_sum, self.bin_count, self.pcl_bin_idx, self.bin_min_zenith], device=device)
+        else:
+            keys, values = self.binning.sort_buffers(n)
+            wp.launch(bin_keyed_process, dim=n,
+                      inputs=[self.pcl_spher, self.intensity, self.semantics, self.sonar_grid],
+                      outputs=[keys, values, self.pcl_bin_idx, self.bin_min_zenith], device=device)
+            self.binning.reduce_sorted(keys, values, n, self.bin_sum.flatten(), self.bin_count.flatten())
+        if self.reduction is None:
+            self.max_intensity.fill_(-wp.inf)
+            wp.launch(compute_max_intensity_all, dim=self.bin_sum.shape, inputs=[self.bin_sum],
+                      outputs=[self.max_intensity], device=device)
+        else:
+            self.reduction.reduce(self.bin_sum.flatten(), "max", out=self.max_intensity)
+        wp.launch(normal_2d, dim=self.bin_sum.shape, inputs=[self.seed, 0.0, 0.05],
+                  outputs=[self.gau_noise], device=device)
+        wp.launch(range_dependent_rayleigh_2d, dim=self.bin_sum.shape,
+                  inputs=[self.seed, self.r, self.azi, self.max_range, 0.05, 0.0, 0.001],
+                  outputs=[self.ray_noise], device=device)
+        wp.launch(make_sonar_map_all, dim=self.bin_sum.shape,
+                  inputs=[self.r, self.azi, self.bin_sum, self.max_intensity, self.gau_noise, self.ray_noise, 0.0, 1.0],
+                  outputs=[self.sonar_data], device=device)
+        wp.launch(make_sonar_image, dim=self.bin_sum.shape, inputs=[self.sonar_data],
+                  outputs=[self.sonar_image], device=device)
+
+
+CHAINS = {
+    "side_scan_fused": lambda device, n: SideScanChain(device, n, fused=True),
+    "side_scan_reference": lambda device, n: SideScanChain(device, n, fused=False),
+    "side_scan_dual": lambda device, n: SideScanChain(device, n, fused=True, num_channels=2),
+    "side_scan_range": lambda device, n: SideScanChain(device, n, fused=True, normalizing_method="range"),
+    "imaging_sonar": lambda device, n: ImagingSonarChain(device, n),
+    "imaging_sonar_sorted": lambda device, n: ImagingSonarChain(device, n, binning="sorted"),
+    "imaging_sonar_reduce": lambda device, n: ImagingSonarChain(device, n, reduction="engine"),
+    # Binning engines against the atomic path, see side_scan_pipeline.BinningEngine
+    "binning_atomic": lambda device, n: SideScanBinningChain(device, n, "atomic"),
+    "binning_privatized": lambda device, n: SideScanBinningChain(device, n, "privatized"),
+    "binning_sorted": lambda device, n: SideScanBinningChain(device, n, "sorted"),
+    "binning_atomic_flat": lambda device, n: SideScanBinningChain(device, n, "atomic", range_band=0.05),
+    "binning_privatized_flat": lambda device, n: SideScanBinningChain(device, n, "privatized", range_band=0.05),
+    "binning_sorted_flat": lambda device, n: SideScanBinningChain(device, n, "sorted", range_band=0.05),
+}
+
+
+def time_chain(chain, device, warmup: int, repeats: int) -> float:
+    """Median wall time of one ping in seconds, device synchronized around every ping."""
+    for _ in range(warmup):
+        chain.run()
+    wp.synchronize_device(device)
+    times = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        chain.run()
+        wp.synchronize_device(device)
+        times.append(time.perf_counter() - start)
+    return float(np.median(times))
+
+
+def device_key(device) -> str:
+    return f"{device.alias} ({device.name})"
+
+
+def run_benchmarks(devices, sizes, chains, warmup: int, repeats: int) -> dict:
+    results = {}
+    for device in devices:
+        key = device_key(device)
+        results[key] = {}
+        for name in chains:
+            for n in sizes:
+                chain = CHAINS[name](device, n)
+                seconds = time_chain(chain, device, warmup, repeats)
+                results[key][f"{name}/{n}"] = {
+                    "points_per_s": n / seconds,
+                    "pings_per_s": 1.0 / seconds,
+                }
+                print(f"{key:<28} {name:<22} {n:>9,d} pts  {1e3 * seconds:10.3f} ms  "
+                      f"{n / seconds / 1e6:9.2f} Mpts/s  {1.0 / seconds:9.1f} pings/s")
+                del chain
+    return results
+
+
+def compare(results: dict, baseline: dict, tolerance: float) -> list:
+    """Entries slower than (1 - tolerance) x baseline points/s."""
+    regressions = []
+    for key, entries in results.items():
+        for entry, value in entries.items():
+            reference = baseline.get(key, {}).get(entry)
+            if reference is None:
+                continue
+            ratio = value["points_per_s"] / reference["points_per_s"]
+            if ratio < 1.0 - tolerance:
+                regressions.append((key, entry, ratio))
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=int, nargs="+", default=DEFAULT_SIZES, help="Point counts per ping")
+    parser.add_argument("--chains", nargs="+", default=list(CHAINS), choices=list(CHAINS))
+    parser.add_argument("--devices", nargs="+", default=None,
+                        help="Warp devices, defaults to cpu and every CUDA device present")
+    parser.add_argument("--warmup", type=int, default=2, help="Untimed pings, the first one compiles the kernels")
+    parser.add_argument("--repeats", type=int, default=5, help="Timed pings, the median is reported")
+    parser.add_argument("--baseline", default=DEFAULT_BASELINE, help="Baseline JSON file")
+    parser.add_argument("--save-baseline", action="store_true", help="Store this run as the baseline of its devices")
+    parser.add_argument("--tolerance", type=float, default=0.2,
+                        help="Allowed throughput drop relative to the baseline. Defaults to 0.2 (20%%).")
+    parser.add_argument("--output", default=None, help="Also write the results of this run to a JSON file")
+    args = parser.parse_args()
+
+    wp.config.quiet = True
+    wp.init()
+    if args.devices is None:
+        devices = [wp.get_device("cpu")] + [wp.get_device(d) for d in wp.get_cuda_devices()]
+    else:
+        devices = [wp.get_device(d) for d in args.devices]
+
+    results = run_benchmarks(devices, args.sizes, args.chains, args.warmup, args.repeats)
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+
+    baseline = {}
+    if os.path.exists(args.baseline):
+        with open(args.baseline, "r") as f:
+            baseline = json.load(f)
+
+    if args.save_baseline:
+        for key, entries in results.items():
+            baseline.setdefault(key, {}).update(entries)
+        with open(args.baseline, "w") as f:
+            json.dump(baseline, f, indent=2, sort_keys=True)
+        print(f"Baseline saved: {args.baseline}")
+        return 0
+
+    if not baseline:
+        print(f"No baseline at {args.baseline}, run with --save-baseline to create one")
+        return 0
+
+    regressions = compare(results, baseline, args.tolerance)
+    for key, entry, ratio in regressions:
+        print(f"REGRESSION {key} {entry}: {100 * ratio:.1f}% of baseline throughput")
+    if regressions:
+        return 1
+    print(f"No regression beyond {100 * args.tolerance:.0f}% of the baseline")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,267 @@
+import json
+import os
+
+import numpy as np
+import warp as wp
+
+try:
+    from isaacsim.oceansim.utils.side_scan_pipeline import SideScanProcessor, LabelTableCache, SonarWaterfall
+except ImportError:
+    # Running outside Isaac Sim (replay, tuning scripts): use the local module
+    from side_scan_pipeline import SideScanProcessor, LabelTableCache, SonarWaterfall
+
+
+class FrameRecorder:
+    """Records the raw annotator frames of a side-scan sensor, exactly what scan() stores in scan_data.
+
+    Every frame is appended as raw little-endian arrays to frames.bin; frames.json indexes them
+    and holds the sensor configuration and the distinct idToLabels tables (a table is stored once
+    and referenced by every frame that uses it).
+
+    Layout of a recording directory:
+        frames.json     sensor config, label tables and one entry per frame
+                        (ping_id, byte offset, number of points, normal columns, label table index)
+        frames.bin      per frame: viewTransform (4x4 float32), pcl (N x 3 float32),
+                        normals (N x C float32), semantics (N uint32)
+
+        recorder = FrameRecorder.create(path, sensor_config={...})
+        recorder.append(sensor.scan_data, ping_id=sensor.id)
+        recorder.close()
+    """
+
+    INDEX_FILE = "frames.json"
+    DATA_FILE = "frames.bin"
+
+    def __init__(self, path: str, sensor_config: dict):
+        self.path = path
+        self.sensor_config = dict(sensor_config)
+        self.frames = []
+        self.label_tables = []
+        self._label_index = {}
+        self._offset = 0
+        self._file = open(os.path.join(path, self.DATA_FILE), "wb")
+
+    @classmethod
+    def create(cls, path: str, sensor_config: dict):
+        """Start a new recording in ``path`` (created if needed).
+
+        Args:
+            path (str): Recording directory
+            sensor_config (dict): Everything replay needs to rebuild the processor: min_range, max_range,
+                                  range_res, num_channels and optionally normalizing_method, range_window, range_floor,
+                                  range_splat, pulse_width and fused
+        """
+        os.makedirs(path, exist_ok=True)
+        if os.path.exists(os.path.join(path, cls.INDEX_FILE)):
+            raise FileExistsError(f"A recording already exists in {path}")
+        recorder = cls(path, sensor_config)
+        recorder._write_index()
+        return recorder
+
+    def __len__(self):
+        return len(self.frames)
+
+    @staticmethod
+    def _to_numpy(array, dtype) -> np.ndarray:
+        if isinstance(array, wp.array):
+            array = array.numpy()
+        return np.ascontiguousarray(np.asarray(array), dtype=dtype)
+
+    def _write_index(self):
+        index = {
+            "sensor": self.sensor_config,
+            "label_tables": self.label_tables,
+            "frames": self.frames,
+        }
+        tmp_path = os.path.join(self.path, self.INDEX_FILE + ".tmp")
+        with open(tmp_path, "w") as f:
+            json.dump(index, f)
+        os.replace(tmp_path, os.path.join(self.path, self.INDEX_FILE))
+
+    def append(self, scan_data: dict, ping_id: int):
+        """Append one frame.
+
+        Args:
+            scan_data (dict): pcl, normals, semantics (wp.array or np.ndarray), viewTransform and idToLabels
+            ping_id (int): Sensor frame id of the ping, which is also its noise seed
+        """
+        pcl = self._to_numpy(scan_data['pcl'], np.float32).reshape(-1, 3)
+        normals = self._to_numpy(scan_data['normals'], np.float32)
+        normals = normals.reshape(pcl.shape[0], -1)
+        semantics = self._to_numpy(scan_data['semantics'], np.uint32).reshape(-1)
+        view_transform = np.ascontiguousarray(scan_data['viewTransform'], dtype=np.float32).reshape(4, 4)
+
+        id_to_labels = scan_data['idToLabels']
+        fingerprint = LabelTableCache.fingerprint(id_to_labels)
+        label_idx = self._label_index.get(fingerprint)
+        if label_idx is None:
+            label_idx = self._label_index[fingerprint] = len(self.label_tables)
+            self.label_tables.append(json.loads(fingerprint))
+
+        for array in (view_transform, pcl, normals, semantics):
+            self._file.write(array.tobytes())
+        self.frames.append({
+            "ping_id": int(ping_id),
+            "offset": self._offset,
+            "num_points": int(pcl.shape[0]),
+            "normal_cols": int(normals.shape[1]),
+            "labels": label_idx,
+        })
+        self._offset += view_transform.nbytes + pcl.nbytes + normals.nbytes + semantics.nbytes
+
+    def flush(self):
+        """Flush the data file and update the index, e.g. periodically during a long run."""
+        self._file.flush()
+        self._write_index()
+
+    def close(self):
+        if self._file is None:
+            return
+        self._file.close()
+        self._file = None
+        self._write_index()
+
+
+class FrameReplay:
+    """Read-only access to a FrameRecorder recording. Iterating yields scan_data-like dicts.
+
+        replay = FrameReplay.open(path)
+        for frame in replay:
+            frame['pcl'], frame['normals'], frame['semantics'], frame['viewTransform'], frame['idToLabels'], frame['ping_id']
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        with open(os.path.join(path, FrameRecorder.INDEX_FILE), "r") as f:
+            index = json.load(f)
+        self.sensor_config = index["sensor"]
+        self.label_tables = index["label_tables"]
+        self.frames = index["frames"]
+        data_path = os.path.join(path, FrameRecorder.DATA_FILE)
+        self._data = np.memmap(data_path, dtype=np.uint8, mode="r") if os.path.getsize(data_path) > 0 else None
+
+    @classmethod
+    def open(cls, path: str):
+        return cls(path)
+
+    def __len__(self):
+        return len(self.frames)
+
+    def __iter__(self):
+        for i in range(len(self.frames)):
+            yield self.read(i)
+
+    def read(self, i: int) -> dict:
+        """Frame i as numpy arrays (views of the memory-mapped data file)."""
+        entry = self.frames[i]
+        n = entry["num_points"]
+        offset = entry["offset"]
+        parts = []
+        for dtype, count, shape in ((np.float32, 16, (4, 4)),
+                                    (np.float32, n * 3, (n, 3)),
+                                    (np.float32, n * entry["normal_cols"], (n, entry["normal_cols"])),
+                                    (np.uint32, n, (n,))):
+            nbytes = count * np.dtype(dtype).itemsize
+            parts.append(self._data[offset:offset + nbytes].view(dtype).reshape(shape))
+            offset += nbytes
+        view_transform, pcl, normals, semantics = parts
+        return {
+            "ping_id": entry["ping_id"],
+            "pcl": pcl,
+            "normals": normals,
+            "semantics": semantics,
+            "viewTransform": view_transform,
+            "idToLabels": self.label_tables[entry["labels"]],
+        }
+
+
+class SideScanReplay:
+    """Runs recorded frames through SideScanProcessor without Isaac Sim, e.g. on the Warp CPU device.
+
+    The processing is the sensor's (bin_points then post_process, seeded with the recorded ping
+    id). The normalizing method, range splat and fused setting default to the recorded ones, so replaying with
+    the same parameters gives the same outputs as the live run, and any parameter can be changed
+    between replays.
+
+        replay = SideScanReplay(path, device="cpu")
+        rows = replay.render(attenuation=0.5, gau_noise_param=0.1)   # (num_pings, width, 4) image rows
+    """
+
+    def __init__(self, path: str, device="cpu", normalizing_method: str = None, fused: bool = None,
+                 range_splat: str = None, pulse_width: float = None, range_window: int = None,
+                 range_floor: float = None):
+        self.frames = FrameReplay.open(path)
+        self.device = wp.get_device(device)
+        config = self.frames.sensor_config
+        if normalizing_method is None:
+            normalizing_method = config.get("normalizing_method", "all")
+        if range_window is None:
+            range_window = config.get("range_window", 64)
+        if range_floor is None:
+            range_floor = config.get("range_floor", 0.1)
+        self.fused = config.get("fused", True) if fused is None else fused
+        self.processor = SideScanProcessor(min_range=config["min_range"],
+                                           max_range=config["max_range"],
+                                           range_res=config["range_res"],
+                                           device=self.device,
+                                           num_channels=config.get("num_channels", 1))
+        self.processor.set_normalizing_method(normalizing_method, range_window, range_floor)
+        if range_splat is None:
+            range_splat = config.get("range_splat", "nearest")
+            pulse_width = config.get("pulse_width") if pulse_width is None else pulse_width
+        self.processor.set_range_splat(range_splat, pulse_width)
+        self.label_tables = LabelTableCache(device=self.device)
+
+    def __len__(self):
+        return len(self.frames)
+
+    def process(self,
+                frame: dict,
+                query_prop: str = 'reflectivity',
+                attenuation: float = 1.0,
+                gau_noise_param: float = 0.05,
+                ray_noise_param: float = 0.05,
+                intensity_offset: float = 0.0,
+                intensity_gain: float = 1.0,
+                central_peak: float = 0.0,
+                central_std: float = 0.001):
+        """Process one frame, same arguments as SideScanSonarSensor.make_side_sonar_data().
+        The results are left in the processor (side_sonar_data, out_array, side_sonar_image)."""
+        indexToRefl = self.label_tables.get(frame['idToLabels'], query_prop)
+        self.processor.bin_points(pcl=wp.array(frame['pcl'], dtype=wp.float32, device=self.device),
+                                  normals=wp.array(frame['normals'], dtype=wp.float32, device=self.device),
+                                  semantics=wp.array(frame['semantics'], dtype=wp.uint32, device=self.device),
+                                  viewTransform=frame['viewTransform'],
+                                  indexToRefl=indexToRefl,
+                                  attenuation=attenuation,
+                                  fused=self.fused)
+        self.processor.post_process(seed=frame['ping_id'],
+                                    gau_noise_param=gau_noise_param,
+                                    ray_noise_param=ray_noise_param,
+                                    intensity_offset=intensity_offset,
+                                    intensity_gain=intensity_gain,
+                                    central_peak=central_peak,
+                                    central_std=central_std,
+                                    fused=self.fused)
+
+    def run(self, **params):
+        """Process every frame in order, yielding the frame after processing it."""
+        # Every run starts like the live sensor, without earlier pings in the per-range maximum
+        self.processor.reset_range_history()
+        for frame in self.frames:
+            self.process(frame, **params)
+            yield frame
+
+    def render(self, **params) -> np.ndarray:
+        """Image rows of every ping, (num_pings, width, 4) uint8, newest last."""
+        rows = np.empty((len(self.frames),) + tuple(self.processor.side_sonar_image.shape), dtype=np.uint8)
+        for i, _ in enumerate(self.run(**params)):
+            rows[i] = self.processor.side_sonar_image.numpy()
+        return rows
+
+    def render_waterfall(self, height: int = 720, **params) -> SonarWaterfall:
+        """Replay into a SonarWaterfall of the given height, like the sensor's display."""
+        waterfall = SonarWaterfall(height=height, width=self.processor.side_sonar_image.shape[0], device=self.device)
+        for _ in self.run(**params):
+            waterfall.push_row(self.processor.side_sonar_image)
+        return waterfall
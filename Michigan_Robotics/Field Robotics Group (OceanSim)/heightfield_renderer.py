@@ -0,0 +1,331 @@
+import argparse
+import json
+import os
+import time
+from dataclasses import dataclass
+
+import numpy as np
+import warp as wp
+
+try:
+    from isaacsim.oceansim.utils.ImagingSonar_kernels import (heightField,
+                                                              heightfield_side_scan_process,
+                                                              side_group_post_process)
+    from isaacsim.oceansim.utils.side_scan_pipeline import SideScanProcessor
+    from isaacsim.oceansim.utils.survey_store import SurveyStore
+except ImportError:
+    # Standalone (bulk dataset generation without Isaac Sim): use the local modules
+    from imaging_sonar_kernels import (heightField,
+                                       heightfield_side_scan_process,
+                                       side_group_post_process)
+    from side_scan_pipeline import SideScanProcessor
+    from survey_store import SurveyStore
+
+
+@dataclass
+class SideScanGeometry:
+    """Sensor geometry of the offline renderer, defaults from SideScanSonarSensor and the scenario mount.
+
+    The fan is a pinhole grid of hori_res x vert_res rays spanning hori_fov along track and
+    vert_fov across track, centred depression degrees below the horizon on the given side.
+    Along-track rays only average speckle, so far fewer than the render product's are enough.
+    """
+    min_range: float = 8.0
+    max_range: float = 10.0
+    range_res: float = 0.001
+    hori_fov: float = 0.2
+    vert_fov: float = 90.0
+    hori_res: int = 16
+    vert_res: int = 4096
+    depression: float = 45.0
+    side: str = "starboard"    # "starboard" or "port"
+
+
+@dataclass
+class VehicleTrack:
+    """Straight survey line at constant altitude above the seabed, heading and speed.
+
+    Positions are in the terrain frame of generate_usd_terrain_from_heightmap() (origin at the
+    map centre, z up); heading is in degrees from +x towards +y. ping_rate defaults to the
+    two-way travel time to the sensor's max_range at sound_speed, like PingScheduler.
+    """
+    start_x: float = 0.0
+    start_y: float = 0.0
+    heading: float = 0.0
+    speed: float = 1.5
+    altitude: float = 6.0
+    num_pings: int = 500
+    ping_rate: float = None
+    sound_speed: float = 1500.0
+
+
+def load_terrain_scale(params_path: str) -> tuple:
+    """(scale_x, scale_y, scale_z) of a TerrainParameters JSON written by TerrainParameterGenerator.save_parameters()."""
+    with open(params_path, "r") as f:
+        params = json.load(f)
+    return (params.get("scale_x", 100.0), params.get("scale_y", 100.0), params.get("scale_z", 10.0))
+
+
+class HeightfieldSideScanRenderer:
+    """Renders side-scan waterfalls straight from a terrain heightmap, without Isaac Sim.
+
+    The heightmap is placed like run_terrain_generation.generate_usd_terrain_from_heightmap() with
+    the TerrainParameters scale. For a chunk of pings, one launch of heightfield_side_scan_process
+    ray-marches every ray of every ping's fan through the heightfield and bins the hits with the
+    sensor's intensity model; a row-wise max reduction and side_group_post_process then normalize
+    and add the sensor's noise for all pings of the chunk at once (seeded with the ping index).
+    A track therefore costs a handful of launches per chunk on any Warp device.
+
+        renderer = HeightfieldSideScanRenderer(np.load("terrain.npy"), scale=(100.0, 100.0, 10.0))
+        rows = renderer.render(VehicleTrack(altitude=6.0, heading=30.0))    # (num_pings, num_range_bins, 4)
+    """
+
+    def __init__(self,
+                 heightmap: np.ndarray,
+                 scale=(100.0, 100.0, 10.0),
+                 geometry: SideScanGeometry = None,
+                 reflectivity=1.0,
+                 device=None,
+                 pings_per_launch: int = 64):
+        """
+        Args:
+            heightmap (np.ndarray): (size, size) heights, e.g. generate_parametric_heightmap() output
+            scale (tuple, optional): (scale_x, scale_y, scale_z), or a TerrainParameters. Defaults to (100.0, 100.0, 10.0).
+            geometry (SideScanGeometry, optional): Sensor geometry. Defaults to SideScanGeometry().
+            reflectivity (float or np.ndarray, optional): Seabed reflectivity, constant or a per-vertex map
+                                                          with the heightmap's shape. Defaults to 1.0 (the sensor's
+                                                          value for labels without a reflectivity).
+            device (optional): Warp device. Defaults to the preferred device.
+            pings_per_launch (int, optional): Pings rendered per launch. Defaults to 64.
+        """
+        if hasattr(scale, "scale_x"):
+            scale = (scale.scale_x, scale.scale_y, scale.scale_z)
+        self.device = wp.get_device(device)
+        self.geometry = geometry if geometry is not None else SideScanGeometry()
+        self.pings_per_launch = pings_per_launch
+
+        heightmap = np.asarray(heightmap, dtype=np.float32)
+        ny, nx = heightmap.shape
+        self.heights_np = heightmap * np.float32(scale[2])
+        self.heightfield = heightField()
+        self.heightfield.heights = wp.array(heightmap, dtype=wp.float32, device=self.device)
+        self.heightfield.origin_x = -0.5 * scale[0]
+        self.heightfield.origin_y = -0.5 * scale[1]
+        # generate_usd_terrain_from_heightmap places vertex i at (i / size - 0.5) * scale
+        self.heightfield.cell_x = scale[0] / nx
+        self.heightfield.cell_y = scale[1] / ny
+        self.heightfield.scale_z = float(scale[2])
+        self.march_step = 0.5 * min(self.heightfield.cell_x, self.heightfield.cell_y)
+
+        if np.ndim(reflectivity) == 0:
+            self._reflectivity = float(reflectivity)
+            self._reflectivity_map = wp.zeros(shape=(0, 0), dtype=wp.float32, device=self.device)
+        else:
+            self._reflectivity = 1.0
+            self._reflectivity_map = wp.array(np.asarray(reflectivity, dtype=np.float32), dtype=wp.float32, device=self.device)
+
+        g = self.geometry
+        # Range grid, normalization and noise are the sensor's
+        self.processor = SideScanProcessor(min_range=g.min_range, max_range=g.max_range, range_res=g.range_res, device=self.device)
+        self.num_range_bins = self.processor.num_range_bins
+
+        tan_x = np.tan(np.deg2rad(g.hori_fov) / 2)
+        tan_y = np.tan(np.deg2rad(g.vert_fov) / 2)
+        u = (2.0 * (np.arange(g.hori_res) + 0.5) / g.hori_res - 1.0) * tan_x
+        v = (1.0 - 2.0 * (np.arange(g.vert_res) + 0.5) / g.vert_res) * tan_y
+        vv, uu = np.meshgrid(v, u, indexing="ij")
+        dirs = np.stack([uu, vv, -np.ones_like(uu)], axis=-1).reshape(-1, 3)
+        self._ray_dirs = wp.array(dirs.astype(np.float32), dtype=wp.vec3, device=self.device)
+
+        shape = (pings_per_launch, self.num_range_bins)
+        self.bin_sum = wp.zeros(shape=shape, dtype=wp.float32, device=self.device)
+        self.bin_count = wp.zeros(shape=shape, dtype=wp.int32, device=self.device)
+        self.side_sonar_data = wp.zeros(shape=shape, dtype=wp.vec3, device=self.device)
+        self.out_array = wp.zeros(shape=shape, dtype=wp.float32, device=self.device)
+        self.side_sonar_image = wp.zeros(shape=shape + (4,), dtype=wp.uint8, device=self.device)
+        self._max_intensity = wp.zeros(shape=(pings_per_launch,), dtype=wp.float32, device=self.device)
+        self._poses = wp.zeros(shape=(pings_per_launch,), dtype=wp.mat44, device=self.device)
+        self._seeds = wp.zeros(shape=(pings_per_launch,), dtype=wp.int32, device=self.device)
+        self._active = wp.zeros(shape=(pings_per_launch,), dtype=wp.int32, device=self.device)
+
+    def terrain_height(self, x: np.ndarray, y: np.ndarray) -> np.ndarray:
+        """Bilinear seabed height at (x, y), clamped to the map."""
+        hf = self.heightfield
+        ny, nx = self.heights_np.shape
+        gx = np.clip((np.asarray(x) - hf.origin_x) / hf.cell_x, 0, nx - 1)
+        gy = np.clip((np.asarray(y) - hf.origin_y) / hf.cell_y, 0, ny - 1)
+        i = np.minimum(gx.astype(int), nx - 2)
+        j = np.minimum(gy.astype(int), ny - 2)
+        fx = gx - i
+        fy = gy - j
+        h = self.heights_np
+        return ((h[j, i] * (1 - fx) + h[j, i + 1] * fx) * (1 - fy)
+                + (h[j + 1, i] * (1 - fx) + h[j + 1, i + 1] * fx) * fy)
+
+    def track_poses(self, track: VehicleTrack) -> np.ndarray:
+        """Camera-to-world matrices (num_pings, 4, 4) of the sensor along a track (USD camera convention, looking down -Z)."""
+        g = self.geometry
+        ping_rate = track.ping_rate if track.ping_rate is not None else track.sound_speed / (2.0 * g.max_range)
+        heading = np.deg2rad(track.heading)
+        forward = np.array([np.cos(heading), np.sin(heading), 0.0])
+        starboard = np.array([np.sin(heading), -np.cos(heading), 0.0])
+        side = starboard if g.side == "starboard" else -starboard
+        depression = np.deg2rad(g.depression)
+        look = np.cos(depression) * side + np.sin(depression) * np.array([0.0, 0.0, -1.0])
+        z_axis = -look
+        x_axis = forward
+        y_axis = np.cross(z_axis, x_axis)
+
+        t = np.arange(track.num_pings) / ping_rate
+        x = track.start_x + forward[0] * track.speed * t
+        y = track.start_y + forward[1] * track.speed * t
+        z = self.terrain_height(x, y) + track.altitude
+
+        poses = np.tile(np.eye(4), (track.num_pings, 1, 1))
+        poses[:, :3, 0] = x_axis
+        poses[:, :3, 1] = y_axis
+        poses[:, :3, 2] = z_axis
+        poses[:, 0, 3] = x
+        poses[:, 1, 3] = y
+        poses[:, 2, 3] = z
+        return poses
+
+    def _render_chunk(self, poses: np.ndarray, first_ping: int, seed: int, params: dict):
+        num = poses.shape[0]
+        padded = np.tile(np.eye(4, dtype=np.float32), (self.pings_per_launch, 1, 1))
+        padded[:num] = poses
+        self._poses.assign(padded)
+        self._seeds.assign(np.arange(self.pings_per_launch, dtype=np.int32) + seed + first_ping)
+        self._active.assign((np.arange(self.pings_per_launch) < num).astype(np.int32))
+
+        self.bin_sum.zero_()
+        self.bin_count.zero_()
+        g = self.geometry
+        wp.launch(kernel=heightfield_side_scan_process,
+                  dim=(num, self._ray_dirs.shape[0]),
+                  inputs=[
+                      self.heightfield,
+                      self._reflectivity_map,
+                      self._reflectivity,
+                      self._poses,
+                      self._ray_dirs,
+                      g.min_range,
+                      g.max_range,
+                      self.march_step,
+                      params["attenuation"],
+                      self.processor.sonar_grid,
+                  ],
+                  outputs=[
+                      self.bin_sum,
+                      self.bin_count,
+                  ],
+                  device=self.device)
+        self.processor.reduction.reduce(self.bin_sum, "max", out=self._max_intensity)
+        wp.launch(kernel=side_group_post_process,
+                  dim=self.bin_sum.shape,
+                  inputs=[
+                      self._seeds,
+                      self._active,
+                      self.processor.r,
+                      self.bin_sum,
+                      self.bin_count,
+                      self._max_intensity,
+                      g.max_range,
+                      params["gau_noise_param"],
+                      params["ray_noise_param"],
+                      params["intensity_offset"],
+                      params["intensity_gain"],
+                  ],
+                  outputs=[
+                      self.side_sonar_data,
+                      self.out_array,
+                      self.side_sonar_image,
+                  ],
+                  device=self.device)
+        return self.side_sonar_image.numpy()[:num]
+
+    def iter_render(self,
+                    track: VehicleTrack,
+                    seed: int = 0,
+                    attenuation: float = 1.0,
+                    gau_noise_param: float = 0.05,
+                    ray_noise_param: float = 0.05,
+                    intensity_offset: float = 0.0,
+                    intensity_gain: float = 1.0):
+        """Yield (first_ping, rows) chunks of up to pings_per_launch image rows along the track.
+        The parameters are those of SideScanSonarSensor.make_side_sonar_data(); ping i is seeded with seed + i."""
+        params = {
+            "attenuation": attenuation,
+            "gau_noise_param": gau_noise_param,
+            "ray_noise_param": ray_noise_param,
+            "intensity_offset": intensity_offset,
+            "intensity_gain": intensity_gain,
+        }
+        poses = self.track_poses(track)
+        for first in range(0, poses.shape[0], self.pings_per_launch):
+            yield first, self._render_chunk(poses[first:first + self.pings_per_launch], first, seed, params)
+
+    def render(self, track: VehicleTrack, **params) -> np.ndarray:
+        """Waterfall rows of the whole track, (num_pings, num_range_bins, 4) uint8, first ping first."""
+        rows = np.empty((track.num_pings, self.num_range_bins, 4), dtype=np.uint8)
+        for first, chunk in self.iter_render(track, **params):
+            rows[first:first + chunk.shape[0]] = chunk
+        return rows
+
+    def render_to_store(self, track: VehicleTrack, path: str, **params) -> SurveyStore:
+        """Render a track into a SurveyStore (ping rows plus poses), for tracks of any length."""
+        ping_rate = track.ping_rate if track.ping_rate is not None else track.sound_speed / (2.0 * self.geometry.max_range)
+        poses = self.track_poses(track)
+        store = SurveyStore.create(path, row_shape=(self.num_range_bins, 4))
+        for first, chunk in self.iter_render(track, **params):
+            for k, row in enumerate(chunk):
+                i = first + k
+                store.append(row, ping_id=i, timestamp=i / ping_rate, pose=self._pose_record(poses[i]))
+        store.close()
+        return store
+
+    @staticmethod
+    def _pose_record(camera_to_world: np.ndarray) -> np.ndarray:
+        # [x, y, z, qw, qx, qy, qz] of PING_METADATA_DTYPE
+        m = camera_to_world[:3, :3]
+        qw = np.sqrt(max(0.0, 1.0 + m[0, 0] + m[1, 1] + m[2, 2])) / 2
+        qx = np.copysign(np.sqrt(max(0.0, 1.0 + m[0, 0] - m[1, 1] - m[2, 2])) / 2, m[2, 1] - m[1, 2])
+        qy = np.copysign(np.sqrt(max(0.0, 1.0 - m[0, 0] + m[1, 1] - m[2, 2])) / 2, m[0, 2] - m[2, 0])
+        qz = np.copysign(np.sqrt(max(0.0, 1.0 - m[0, 0] - m[1, 1] + m[2, 2])) / 2, m[1, 0] - m[0, 1])
+        return np.array([*camera_to_world[:3, 3], qw, qx, qy, qz])
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Render side-scan waterfalls from terrain heightmaps without Isaac Sim.")
+    parser.add_argument("heightmaps", nargs="+", help=".npy heightmaps (e.g. from parametric_terrain_generator.py)")
+    parser.add_argument("--params", default=None, help="TerrainParameters JSON for the scale (default 100 x 100 x 10)")
+    parser.add_argument("--output", default="heightfield_renders", help="Output directory")
+    parser.add_argument("--altitude", type=float, default=6.0)
+    parser.add_argument("--heading", type=float, nargs="+", default=[0.0], help="One track per heading (degrees)")
+    parser.add_argument("--speed", type=float, default=1.5)
+    parser.add_argument("--num-pings", type=int, default=500)
+    parser.add_argument("--hori-res", type=int, default=SideScanGeometry.hori_res)
+    parser.add_argument("--vert-res", type=int, default=SideScanGeometry.vert_res)
+    parser.add_argument("--device", default=None)
+    parser.add_argument("--png", action="store_true", help="Also write each waterfall as a PNG")
+    args = parser.parse_args()
+
+    scale = load_terrain_scale(args.params) if args.params else (100.0, 100.0, 10.0)
+    geometry = SideScanGeometry(hori_res=args.hori_res, vert_res=args.vert_res)
+    os.makedirs(args.output, exist_ok=True)
+    for path in args.heightmaps:
+        renderer = HeightfieldSideScanRenderer(np.load(path), scale=scale, geometry=geometry, device=args.device)
+        name = os.path.splitext(os.path.basename(path))[0]
+        for heading in args.heading:
+            track = VehicleTrack(heading=heading, speed=args.speed, altitude=args.altitude, num_pings=args.num_pings)
+            start = time.perf_counter()
+            out_path = os.path.join(args.output, f"{name}_hdg{heading:05.1f}")
+            store = renderer.render_to_store(track, out_path)
+            if args.png:
+                import cv2
+                cv2.imwrite(out_path + ".png", store.read()[:, :, 0])
+            print(f"[SSS] {out_path}: {track.num_pings} pings in {time.perf_counter() - start:.2f} s")
+
+
+if __name__ == "__main__":
+    main()
@@ -164,6 +164,718 @@ def side_bin_process(
     wp.atomic_add(bin_sum, r_bin_idx, intensity[tid])
     wp.atomic_add(bin_count, r_bin_idx, 1)
 
+@wp.kernel
+def side_sensor_location(viewTransform: wp.mat44,
+                         sensor_loc: wp.array(dtype=wp.vec3)):
+    # Sensor origin in world coordinates, computed once per ping instead of once per point.
+    # Same expression as in compute_intensity so the fused path stays bit-for-bit comparable.
+    R = wp.mat33(viewTransform[0,0], viewTransform[0,1], viewTransform[0,2],
+                 viewTransform[1,0], viewTransform[1,1], viewTransform[1,2],
+                 viewTransform[2,0], viewTransform[2,1], viewTransform[2,2])
+    T = wp.vec3(viewTransform[0,3], viewTransform[1,3], viewTransform[2,3])
+    sensor_loc[0] = - (wp.transpose(R) @ T)
+
+@wp.func
+def side_slant_range(viewTransform: wp.mat44, x: float, y: float, z: float) -> wp.vec4:
+    # Sensor-frame point and slant range (x, y, z, r), same as side_world2local. r is 0 for invalid points.
+    lx = float(0.0)
+    ly = float(0.0)
+    lz = float(0.0)
+    r = float(0.0)
+    if not (wp.isnan(x) or wp.isnan(y) or wp.isnan(z)):
+        lx = viewTransform[0, 0]*x + viewTransform[0, 1]*y + viewTransform[0, 2]*z + viewTransform[0, 3]*1.0
+        ly = viewTransform[1, 0]*x + viewTransform[1, 1]*y + viewTransform[1, 2]*z + viewTransform[1, 3]*1.0
+        lz = viewTransform[2, 0]*x + viewTransform[2, 1]*y + viewTransform[2, 2]*z + viewTransform[2, 3]*1.0
+        lx = -lx
+        r = wp.sqrt(lx*lx + ly*ly + lz*lz)
+        if wp.isnan(r) or wp.isinf(r) or r < 1e-3:
+            r = 0.0
+    return wp.vec4(lx, ly, lz, r)
+
+@wp.func
+def side_range_bin(r: float, sonar_grid: sonarGrid) -> int:
+    # Same bounds checks as side_bin_process, -1 when the range falls outside the grid
+    x_offset = sonar_grid.x_offset
+    x_res = sonar_grid.x_res
+    x_num = sonar_grid.x_num
+    if r < x_offset:
+        return -1
+    if r >= x_offset + x_res * float(x_num):
+        return -1
+    r_bin_idx = wp.uint32((r - x_offset) / x_res)
+    if r_bin_idx >= x_num:
+        return -1
+    return int(r_bin_idx)
+
+@wp.func
+def side_point_incidence(pcl_vec: wp.vec3, normal_vec: wp.vec3, sensor_pos: wp.vec3) -> wp.vec2:
+    # (cos_theta, dist) of the intensity model, same as compute_intensity
+    incidence = pcl_vec - sensor_pos
+    dist = wp.sqrt(incidence[0]*incidence[0] + incidence[1]*incidence[1] + incidence[2]*incidence[2])
+    unit_directs = wp.normalize(pcl_vec - sensor_pos)
+    cos_theta = wp.dot(-unit_directs, normal_vec)
+    return wp.vec2(cos_theta, dist)
+
+@wp.func
+def side_point_intensity(pcl_vec: wp.vec3,
+                         normal_vec: wp.vec3,
+                         sensor_pos: wp.vec3,
+                         reflectivity: float,
+                         attenuation: float) -> float:
+    # Same as compute_intensity
+    geometry = side_point_incidence(pcl_vec, normal_vec, sensor_pos)
+    return reflectivity * geometry[0] * wp.exp(-attenuation * geometry[1])
+
+@wp.kernel
+# Fused version of compute_intensity -> side_world2local -> side_bin_process.
+# Each point is read once and accumulated straight into bin_sum/bin_count,
+# so the N-length intensity and range arrays never go through global memory.
+def side_fused_point_process(pcl: wp.array(ndim=2, dtype=wp.float32),
+                             normals: wp.array(ndim=2, dtype=wp.float32),
+                             viewTransform: wp.mat44,
+                             semantics: wp.array(ndim=1, dtype=wp.uint32),
+                             indexToRefl: wp.array(dtype=wp.float32),
+                             attenuation: float,
+                             sensor_loc: wp.array(dtype=wp.vec3),
+                             sonar_grid: sonarGrid,
+                             bin_sum: wp.array(dtype=wp.float32),
+                             bin_count: wp.array(dtype=wp.int32)):
+    tid = wp.tid()
+    x = pcl[tid, 0]
+    y = pcl[tid, 1]
+    z = pcl[tid, 2]
+
+    # Early exits taken before doing any intensity work
+    r_bin_idx = side_range_bin(side_slant_range(viewTransform, x, y, z)[3], sonar_grid)
+    if r_bin_idx < 0:
+        return
+
+    normal_vec = wp.vec3(normals[tid,0], normals[tid,1], normals[tid,2])
+    intensity = side_point_intensity(wp.vec3(x, y, z), normal_vec, sensor_loc[0],
+                                     indexToRefl[semantics[tid]], attenuation)
+
+    wp.atomic_add(bin_sum, r_bin_idx, intensity)
+    wp.atomic_add(bin_count, r_bin_idx, 1)
+
+@wp.kernel
+# Dual-channel version of side_fused_point_process for a downward-looking fan that sees both sides.
+# Channel 0 (port) takes the returns on the sensor's +y side, channel 1 (starboard) the -y side.
+def side_dual_fused_point_process(pcl: wp.array(ndim=2, dtype=wp.float32),
+                                  normals: wp.array(ndim=2, dtype=wp.float32),
+                                  viewTransform: wp.mat44,
+                                  semantics: wp.array(ndim=1, dtype=wp.uint32),
+                                  indexToRefl: wp.array(dtype=wp.float32),
+                                  attenuation: float,
+                                  sensor_loc: wp.array(dtype=wp.vec3),
+                                  sonar_grid: sonarGrid,
+                                  bin_sum: wp.array(ndim=2, dtype=wp.float32),
+                                  bin_count: wp.array(ndim=2, dtype=wp.int32)):
+    tid = wp.tid()
+    x = pcl[tid, 0]
+    y = pcl[tid, 1]
+    z = pcl[tid, 2]
+
+    local = side_slant_range(viewTransform, x, y, z)
+    r_bin_idx = side_range_bin(local[3], sonar_grid)
+    if r_bin_idx < 0:
+        return
+    channel = 0
+    if local[1] < 0.0:
+        channel = 1
+
+    normal_vec = wp.vec3(normals[tid,0], normals[tid,1], normals[tid,2])
+    intensity = side_point_intensity(wp.vec3(x, y, z), normal_vec, sensor_loc[0],
+                                     indexToRefl[semantics[tid]], attenuation)
+
+    wp.atomic_add(bin_sum, channel, r_bin_idx, intensity)
+    wp.atomic_add(bin_count, channel, r_bin_idx, 1)
+
+@wp.func
+def side_point_flat_bin(local: wp.vec4, sonar_grid: sonarGrid, num_channels: int) -> int:
+    # Bin of a point in the flattened (channel, range bin) layout, -1 when out of the grid.
+    # Channels as in side_dual_fused_point_process.
+    r_bin_idx = side_range_bin(local[3], sonar_grid)
+    if r_bin_idx < 0:
+        return -1
+    if num_channels == 2 and local[1] < 0.0:
+        return int(sonar_grid.x_num) + r_bin_idx
+    return r_bin_idx
+
+@wp.kernel
+# Privatized version of side_fused_point_process / side_dual_fused_point_process. Point tid adds into
+# histogram copy tid % num_copies, so the points of one crowded bin are spread over num_copies
+# addresses instead of serializing on one; private_merge then folds the copies into bin_sum/bin_count.
+def side_private_point_process(pcl: wp.array(ndim=2, dtype=wp.float32),
+                               normals: wp.array(ndim=2, dtype=wp.float32),
+                               viewTransform: wp.mat44,
+                               semantics: wp.array(ndim=1, dtype=wp.uint32),
+                               indexToRefl: wp.array(dtype=wp.float32),
+                               attenuation: float,
+                               sensor_loc: wp.array(dtype=wp.vec3),
+                               sonar_grid: sonarGrid,
+                               num_channels: int,
+                               private_sum: wp.array(ndim=2, dtype=wp.float32),
+                               private_count: wp.array(ndim=2, dtype=wp.int32)):
+    tid = wp.tid()
+    x = pcl[tid, 0]
+    y = pcl[tid, 1]
+    z = pcl[tid, 2]
+
+    flat_bin = side_point_flat_bin(side_slant_range(viewTransform, x, y, z), sonar_grid, num_channels)
+    if flat_bin < 0:
+        return
+
+    normal_vec = wp.vec3(normals[tid,0], normals[tid,1], normals[tid,2])
+    intensity = side_point_intensity(wp.vec3(x, y, z), normal_vec, sensor_loc[0],
+                                     indexToRefl[semantics[tid]], attenuation)
+
+    copy = tid % private_sum.shape[0]
+    wp.atomic_add(private_sum, copy, flat_bin, intensity)
+    wp.atomic_add(private_count, copy, flat_bin, 1)
+
+# Pulse kernels of range splatting. NEAREST is the plain bin assignment of side_bin_process.
+SPLAT_NEAREST = wp.constant(0)
+SPLAT_LINEAR = wp.constant(1)
+SPLAT_GAUSSIAN = wp.constant(2)
+
+@wp.func
+def side_splat_weight(d: float, splat_kind: int, splat_width: float) -> float:
+    # Pulse kernel at d bins from the return, splat_width in bins (half-width of the tent, sigma of the Gaussian)
+    if splat_kind == SPLAT_LINEAR:
+        return wp.max(1.0 - wp.abs(d) / splat_width, 0.0)
+    return wp.exp(-0.5 * (d / splat_width) * (d / splat_width))
+
+@wp.func
+def side_splat(bin_sum: wp.array(ndim=2, dtype=wp.float32),
+               bin_weight: wp.array(ndim=2, dtype=wp.float32),
+               bin_count: wp.array(ndim=2, dtype=wp.int32),
+               row: int,
+               col_offset: int,
+               x_num: int,
+               f: float,
+               intensity: float,
+               splat_kind: int,
+               splat_width: float):
+    # Spread intensity over the bins around the continuous bin coordinate f (in bins, 0 at the
+    # centre of bin 0) with weights summing to 1, into bin_sum[row, col_offset:col_offset + x_num].
+    # The weights go to bin_weight (the fractional return count a bin's mean divides by) and every
+    # bin receiving some of the return is counted in bin_count, which then only flags bins with data.
+    # Weight falling outside the grid is dropped, like returns outside the range window.
+    radius = splat_width
+    if splat_kind == SPLAT_GAUSSIAN:
+        radius = 3.0 * splat_width
+    lo = int(wp.ceil(f - radius))
+    hi = int(wp.floor(f + radius))
+    total = float(0.0)
+    for j in range(lo, hi + 1):
+        total += side_splat_weight(float(j) - f, splat_kind, splat_width)
+    if total <= 0.0:
+        # Pulse narrower than the distance to any bin centre: the return keeps to its own bin
+        j = wp.clamp(int(wp.floor(f + 0.5)), 0, x_num - 1)
+        wp.atomic_add(bin_sum, row, col_offset + j, intensity)
+        wp.atomic_add(bin_weight, row, col_offset + j, 1.0)
+        wp.atomic_add(bin_count, row, col_offset + j, 1)
+        return
+    for j in range(wp.max(lo, 0), wp.min(hi, x_num - 1) + 1):
+        w = side_splat_weight(float(j) - f, splat_kind, splat_width)
+        if w > 0.0:
+            wp.atomic_add(bin_sum, row, col_offset + j, intensity * w / total)
+            wp.atomic_add(bin_weight, row, col_offset + j, w / total)
+            wp.atomic_add(bin_count, row, col_offset + j, 1)
+
+@wp.kernel
+# Range-splatting version of side_fused_point_process / side_dual_fused_point_process. The return is
+# spread over its neighbouring bins with the pulse kernel (see side_splat) instead of landing in one
+# bin, so coarse range grids do not alias. Writes histogram copy tid % num_copies like
+# side_private_point_process (one copy: the bin arrays viewed as a row).
+def side_splat_point_process(pcl: wp.array(ndim=2, dtype=wp.float32),
+                             normals: wp.array(ndim=2, dtype=wp.float32),
+                             viewTransform: wp.mat44,
+                             semantics: wp.array(ndim=1, dtype=wp.uint32),
+                             indexToRefl: wp.array(dtype=wp.float32),
+                             attenuation: float,
+                             sensor_loc: wp.array(dtype=wp.vec3),
+                             sonar_grid: sonarGrid,
+                             num_channels: int,
+                             splat_kind: int,
+                             splat_width: float,
+                             private_sum: wp.array(ndim=2, dtype=wp.float32),
+                             private_weight: wp.array(ndim=2, dtype=wp.float32),
+                             private_count: wp.array(ndim=2, dtype=wp.int32)):
+    tid = wp.tid()
+    x = pcl[tid, 0]
+    y = pcl[tid, 1]
+    z = pcl[tid, 2]
+
+    local = side_slant_range(viewTransform, x, y, z)
+    flat_bin = side_point_flat_bin(local, sonar_grid, num_channels)
+    if flat_bin < 0:
+        return
+
+    normal_vec = wp.vec3(normals[tid,0], normals[tid,1], normals[tid,2])
+    intensity = side_point_intensity(wp.vec3(x, y, z), normal_vec, sensor_loc[0],
+                                     indexToRefl[semantics[tid]], attenuation)
+
+    x_num = int(sonar_grid.x_num)
+    copy = tid % private_sum.shape[0]
+    f = (local[3] - sonar_grid.x_offset) / sonar_grid.x_res - 0.5
+    side_splat(private_sum, private_weight, private_count, copy, (flat_bin / x_num) * x_num, x_num, f,
+               intensity, splat_kind, splat_width)
+
+@wp.kernel
+# Sum the histogram copies of a privatized binning pass into the flat bin arrays, one thread per bin.
+def private_merge(private_sum: wp.array(ndim=2, dtype=wp.float32),
+                  private_count: wp.array(ndim=2, dtype=wp.int32),
+                  bin_sum: wp.array(dtype=wp.float32),
+                  bin_count: wp.array(dtype=wp.int32)):
+    b = wp.tid()
+    s = float(0.0)
+    c = int(0)
+    for copy in range(private_sum.shape[0]):
+        s += private_sum[copy, b]
+        c += private_count[copy, b]
+    bin_sum[b] = s
+    bin_count[b] = c
+
+@wp.kernel
+# private_merge for the splat weights of side_splat_point_process
+def private_merge_weight(private_weight: wp.array(ndim=2, dtype=wp.float32),
+                         bin_weight: wp.array(dtype=wp.float32)):
+    b = wp.tid()
+    w = float(0.0)
+    for copy in range(private_weight.shape[0]):
+        w += private_weight[copy, b]
+    bin_weight[b] = w
+
+@wp.kernel
+# First pass of sort-based binning: the flat bin of every point as the sort key (num_bins for points
+# outside the grid, so they sort to the end) and its intensity as the value.
+def side_keyed_point_process(pcl: wp.array(ndim=2, dtype=wp.float32),
+                             normals: wp.array(ndim=2, dtype=wp.float32),
+                             viewTransform: wp.mat44,
+                             semantics: wp.array(ndim=1, dtype=wp.uint32),
+                             indexToRefl: wp.array(dtype=wp.float32),
+                             attenuation: float,
+                             sensor_loc: wp.array(dtype=wp.vec3),
+                             sonar_grid: sonarGrid,
+                             num_channels: int,
+                             keys: wp.array(dtype=wp.int32),
+                             values: wp.array(dtype=wp.float32)):
+    tid = wp.tid()
+    x = pcl[tid, 0]
+    y = pcl[tid, 1]
+    z = pcl[tid, 2]
+
+    flat_bin = side_point_flat_bin(side_slant_range(viewTransform, x, y, z), sonar_grid, num_channels)
+    if flat_bin < 0:
+        keys[tid] = num_channels * int(sonar_grid.x_num)
+        values[tid] = 0.0
+        return
+
+    normal_vec = wp.vec3(normals[tid,0], normals[tid,1], normals[tid,2])
+    keys[tid] = flat_bin
+    values[tid] = side_point_intensity(wp.vec3(x, y, z), normal_vec, sensor_loc[0],
+                                       indexToRefl[semantics[tid]], attenuation)
+
+@wp.kernel
+# Segmented reduction of key-sorted (bin, intensity) pairs. Each thread walks chunk_size consecutive
+# pairs and issues one atomic per run of equal keys, so a bin holding n points sees about
+# n / chunk_size atomics instead of n. Keys >= bin_sum.shape[0] mark points outside the grid.
+def sorted_segment_reduce(keys: wp.array(dtype=wp.int32),
+                          values: wp.array(dtype=wp.float32),
+                          count: int,
+                          chunk_size: int,
+                          bin_sum: wp.array(dtype=wp.float32),
+                          bin_count: wp.array(dtype=wp.int32)):
+    tid = wp.tid()
+    start = tid * chunk_size
+    end = wp.min(start + chunk_size, count)
+    num_bins = bin_sum.shape[0]
+
+    key = int(-1)
+    s = float(0.0)
+    c = int(0)
+    for i in range(start, end):
+        k = keys[i]
+        if k >= num_bins:
+            break
+        if k != key:
+            if c > 0:
+                wp.atomic_add(bin_sum, key, s)
+                wp.atomic_add(bin_count, key, c)
+            key = k
+            s = 0.0
+            c = 0
+        s += values[i]
+        c += 1
+    if c > 0:
+        wp.atomic_add(bin_sum, key, s)
+        wp.atomic_add(bin_count, key, c)
+
+@wp.kernel
+# Sort-based binning of the imaging sonar: the first pass of bin_process with the flat
+# (range, azimuth) bin as the sort key and the intensity as the value. pcl_bin_idx and
+# bin_min_zenith are written as in bin_process.
+def bin_keyed_process(pcl: wp.array(dtype=wp.vec3),
+                      intensity: wp.array(dtype=wp.float32),
+                      semantics: wp.array(dtype=wp.uint32),
+                      sonar_grid: sonarGrid,
+                      keys: wp.array(dtype=wp.int32),
+                      values: wp.array(dtype=wp.float32),
+                      pcl_bin_idx: wp.array(dtype=wp.vec2ui),
+                      bin_min_zenith: wp.array(ndim=2, dtype=wp.float32)):
+    tid = wp.tid()
+    x = pcl[tid][0]
+    y = pcl[tid][1]
+    x_bin_idx = wp.uint32((x - sonar_grid.x_offset) / sonar_grid.x_res)
+    y_bin_idx = wp.uint32((y - sonar_grid.y_offset) / sonar_grid.y_res)
+    keys[tid] = int(x_bin_idx) * int(sonar_grid.y_num) + int(y_bin_idx)
+    values[tid] = intensity[tid]
+    pcl_bin_idx[tid] = wp.vec2ui(x_bin_idx, y_bin_idx)
+    if semantics[tid] != 0 and semantics[tid] != 1:
+        wp.atomic_min(bin_min_zenith, x_bin_idx, y_bin_idx, pcl[tid][2])
+
+@wp.kernel
+# Semantic row of a ping: for every (channel, range bin) the semantic id of its strongest return.
+# The intensity is quantized into the high 32 bits of a 64-bit key and the id kept in the low bits,
+# so a single atomic_max per point picks the winner and ties break deterministically on the id.
+def side_semantic_row_accumulate(pcl: wp.array(ndim=2, dtype=wp.float32),
+                                 normals: wp.array(ndim=2, dtype=wp.float32),
+                                 viewTransform: wp.mat44,
+                                 semantics: wp.array(ndim=1, dtype=wp.uint32),
+                                 indexToRefl: wp.array(dtype=wp.float32),
+                                 attenuation: float,
+                                 sensor_loc: wp.array(dtype=wp.vec3),
+                                 sonar_grid: sonarGrid,
+                                 num_channels: int,
+                                 bin_key: wp.array(dtype=wp.uint64)):
+    tid = wp.tid()
+    x = pcl[tid, 0]
+    y = pcl[tid, 1]
+    z = pcl[tid, 2]
+
+    local = side_slant_range(viewTransform, x, y, z)
+    r_bin_idx = side_range_bin(local[3], sonar_grid)
+    if r_bin_idx < 0:
+        return
+    channel = 0
+    if num_channels == 2 and local[1] < 0.0:
+        channel = 1
+
+    normal_vec = wp.vec3(normals[tid,0], normals[tid,1], normals[tid,2])
+    semantic = semantics[tid]
+    intensity = side_point_intensity(wp.vec3(x, y, z), normal_vec, sensor_loc[0],
+                                     indexToRefl[semantic], attenuation)
+
+    level = wp.uint32(wp.clamp(intensity, 0.0, 255.0) * 16777216.0)
+    key = (wp.uint64(level) << wp.uint64(32)) | wp.uint64(semantic)
+    wp.atomic_max(bin_key, channel * int(sonar_grid.x_num) + r_bin_idx, key)
+
+@wp.kernel
+def side_semantic_row_unpack(bin_key: wp.array(dtype=wp.uint64),
+                             bin_count: wp.array(dtype=wp.int32),
+                             semantic_row: wp.array(dtype=wp.uint32)):
+    # Empty bins get id 0 (BACKGROUND)
+    i = wp.tid()
+    if bin_count[i] > 0:
+        semantic_row[i] = wp.uint32(bin_key[i] & wp.uint64(0xFFFFFFFF))
+    else:
+        semantic_row[i] = wp.uint32(0)
+
+@wp.struct
+class heightField:
+    # Heightmap laid out like generate_usd_terrain_from_heightmap(): vertex (i, j) = heights[j, i]
+    # sits at (origin_x + i*cell_x, origin_y + j*cell_y, heights[j, i]*scale_z)
+    heights: wp.array(ndim=2, dtype=wp.float32)
+    origin_x: float
+    origin_y: float
+    cell_x: float
+    cell_y: float
+    scale_z: float
+
+@wp.func
+def heightfield_sample(hf: heightField, x: float, y: float) -> wp.vec3:
+    # Bilinear height and its gradient at (x, y): (h, dh/dx, dh/dy). NaN outside the map.
+    gx = (x - hf.origin_x) / hf.cell_x
+    gy = (y - hf.origin_y) / hf.cell_y
+    nx = hf.heights.shape[1]
+    ny = hf.heights.shape[0]
+    if gx < 0.0 or gy < 0.0 or gx > float(nx - 1) or gy > float(ny - 1):
+        return wp.vec3(wp.nan, 0.0, 0.0)
+    i = wp.min(int(gx), nx - 2)
+    j = wp.min(int(gy), ny - 2)
+    fx = gx - float(i)
+    fy = gy - float(j)
+    h00 = hf.heights[j, i]
+    h10 = hf.heights[j, i + 1]
+    h01 = hf.heights[j + 1, i]
+    h11 = hf.heights[j + 1, i + 1]
+    h = (h00 * (1.0 - fx) + h10 * fx) * (1.0 - fy) + (h01 * (1.0 - fx) + h11 * fx) * fy
+    dhdx = ((h10 - h00) * (1.0 - fy) + (h11 - h01) * fy) / hf.cell_x
+    dhdy = ((h01 - h00) * (1.0 - fx) + (h11 - h10) * fx) / hf.cell_y
+    return wp.vec3(h, dhdx, dhdy) * hf.scale_z
+
+@wp.kernel
+# Offline side-scan rendering straight from a heightmap, over (ping, ray). Every ray of every ping's
+# fan is ray-marched through the heightfield from min_range (the near clipping distance) to
+# max_range in steps of march_step, the crossing is refined by bisection, and the hit is
+# accumulated into bin_sum[ping]/bin_count[ping] with the sensor's intensity model
+# (side_point_intensity). Reflectivity is a per-cell map when given, the constant otherwise.
+def heightfield_side_scan_process(hf: heightField,
+                                  reflectivity_map: wp.array(ndim=2, dtype=wp.float32),
+                                  reflectivity: float,
+                                  camera_to_world: wp.array(dtype=wp.mat44),
+                                  ray_dirs: wp.array(dtype=wp.vec3),
+                                  min_range: float,
+                                  max_range: float,
+                                  march_step: float,
+                                  attenuation: float,
+                                  sonar_grid: sonarGrid,
+                                  bin_sum: wp.array(ndim=2, dtype=wp.float32),
+                                  bin_count: wp.array(ndim=2, dtype=wp.int32)):
+    p, k = wp.tid()
+    pose = camera_to_world[p]
+    origin = wp.transform_point(pose, wp.vec3(0.0, 0.0, 0.0))
+    direction = wp.normalize(wp.transform_vector(pose, ray_dirs[k]))
+
+    # Geometry before the near distance is clipped, a ray starting under the terrain sees nothing
+    t0 = min_range
+    q = origin + direction * t0
+    h = heightfield_sample(hf, q[0], q[1])
+    if wp.isnan(h[0]) or q[2] <= h[0]:
+        return
+
+    t1 = t0
+    hit = int(0)
+    while hit == 0 and t0 < max_range:
+        t1 = wp.min(t0 + march_step, max_range)
+        q = origin + direction * t1
+        h = heightfield_sample(hf, q[0], q[1])
+        if wp.isnan(h[0]):
+            return
+        if q[2] <= h[0]:
+            hit = 1
+        else:
+            t0 = t1
+    if hit == 0:
+        return
+
+    for _ in range(12):
+        tm = 0.5 * (t0 + t1)
+        q = origin + direction * tm
+        h = heightfield_sample(hf, q[0], q[1])
+        if q[2] <= h[0]:
+            t1 = tm
+        else:
+            t0 = tm
+
+    point = origin + direction * t1
+    h = heightfield_sample(hf, point[0], point[1])
+    r_bin_idx = side_range_bin(wp.length(point - origin), sonar_grid)
+    if r_bin_idx < 0:
+        return
+
+    refl = reflectivity
+    if reflectivity_map.shape[0] > 0:
+        gx = int((point[0] - hf.origin_x) / hf.cell_x + 0.5)
+        gy = int((point[1] - hf.origin_y) / hf.cell_y + 0.5)
+        gx = wp.clamp(gx, 0, reflectivity_map.shape[1] - 1)
+        gy = wp.clamp(gy, 0, reflectivity_map.shape[0] - 1)
+        refl = reflectivity_map[gy, gx]
+
+    normal = wp.normalize(wp.vec3(-h[1], -h[2], 1.0))
+    intensity = side_point_intensity(point, normal, origin, refl, attenuation)
+
+    wp.atomic_add(bin_sum, p, r_bin_idx, intensity)
+    wp.atomic_add(bin_count, p, r_bin_idx, 1)
+
+@wp.kernel
+# Parameter sweep version of side_fused_point_process. The range bin, incidence and reflectivity of a
+# point are computed once and accumulated for every distinct attenuation value: bin_sum[a, bin].
+# bin_count does not depend on the parameters and is shared.
+def side_sweep_point_process(pcl: wp.array(ndim=2, dtype=wp.float32),
+                             normals: wp.array(ndim=2, dtype=wp.float32),
+                             viewTransform: wp.mat44,
+                             semantics: wp.array(ndim=1, dtype=wp.uint32),
+                             indexToRefl: wp.array(dtype=wp.float32),
+                             attenuations: wp.array(dtype=wp.float32),
+                             sensor_loc: wp.array(dtype=wp.vec3),
+                             sonar_grid: sonarGrid,
+                             bin_sum: wp.array(ndim=2, dtype=wp.float32),
+                             bin_count: wp.array(dtype=wp.int32)):
+    tid = wp.tid()
+    x = pcl[tid, 0]
+    y = pcl[tid, 1]
+    z = pcl[tid, 2]
+
+    r_bin_idx = side_range_bin(side_slant_range(viewTransform, x, y, z)[3], sonar_grid)
+    if r_bin_idx < 0:
+        return
+
+    normal_vec = wp.vec3(normals[tid,0], normals[tid,1], normals[tid,2])
+    geometry = side_point_incidence(wp.vec3(x, y, z), normal_vec, sensor_loc[0])
+    base = indexToRefl[semantics[tid]] * geometry[0]
+
+    wp.atomic_add(bin_count, r_bin_idx, 1)
+    for a in range(attenuations.shape[0]):
+        wp.atomic_add(bin_sum, a, r_bin_idx, base * wp.exp(-attenuations[a] * geometry[1]))
+
+@wp.kernel
+# Parameter sweep version of side_fused_post_process over (parameter set, range bin). Set p reads the
+# binned response of its attenuation, att_index[p], and draws the same noise as a single run with
+# the same seed.
+def side_sweep_post_process(seed: int,
+                            r: wp.array(dtype=wp.float32),
+                            bin_sum: wp.array(ndim=2, dtype=wp.float32),
+                            bin_count: wp.array(dtype=wp.int32),
+                            max_intensity: wp.array(ndim=2, dtype=wp.float32),
+                            att_index: wp.array(dtype=wp.int32),
+                            gau_noise_param: wp.array(dtype=wp.float32),
+                            ray_noise_param: wp.array(dtype=wp.float32),
+                            offset: wp.array(dtype=wp.float32),
+                            gain: wp.array(dtype=wp.float32),
+                            max_range: float,
+                            out_array: wp.array(ndim=2, dtype=wp.float32),
+                            side_sonar_image: wp.array(ndim=3, dtype=wp.uint8)):
+    p, i = wp.tid()
+    a = att_index[p]
+    # (attenuation, 1) ping maxima, or (attenuation, range bin) per-range maxima
+    m = max_intensity[a, 0]
+    if max_intensity.shape[1] > 1:
+        m = max_intensity[a, i]
+
+    state = wp.rand_init(seed, i)
+    intensity = side_ping_intensity(state, r[i], bin_sum[a, i], m, max_range,
+                                    gau_noise_param[p], ray_noise_param[p], offset[p], gain[p])
+
+    count = bin_count[i]
+    if count > 0:
+        out_array[p, i] = intensity / float(count)
+    else:
+        out_array[p, i] = 0.0
+
+    sonar_rgb = wp.uint8(intensity * wp.float32(255))
+    side_sonar_image[p, i, 0] = sonar_rgb
+    side_sonar_image[p, i, 1] = sonar_rgb
+    side_sonar_image[p, i, 2] = sonar_rgb
+    side_sonar_image[p, i, 3] = wp.uint8(255)
+
+@wp.kernel
+def side_group_sensor_location(viewTransforms: wp.array(dtype=wp.mat44),
+                               sensor_loc: wp.array(dtype=wp.vec3)):
+    # side_sensor_location for every sensor of a group
+    s = wp.tid()
+    viewTransform = viewTransforms[s]
+    R = wp.mat33(viewTransform[0,0], viewTransform[0,1], viewTransform[0,2],
+                 viewTransform[1,0], viewTransform[1,1], viewTransform[1,2],
+                 viewTransform[2,0], viewTransform[2,1], viewTransform[2,2])
+    T = wp.vec3(viewTransform[0,3], viewTransform[1,3], viewTransform[2,3])
+    sensor_loc[s] = - (wp.transpose(R) @ T)
+
+@wp.kernel
+# Sensor group version of side_fused_point_process, one launch over the concatenated point
+# streams of all sensors. Point tid belongs to the sensor s with point_offsets[s] <= tid < point_offsets[s+1].
+# The per-sensor inputs are not copied together: buffer_ptrs[k, s] holds the address of sensor s's
+# pcl (k=0), normals (k=1), semantics (k=2) and indexToRefl (k=3), all contiguous.
+def side_group_point_process(buffer_ptrs: wp.array(ndim=2, dtype=wp.uint64),
+                             point_offsets: wp.array(dtype=wp.int32),
+                             normal_cols: wp.array(dtype=wp.int32),
+                             refl_sizes: wp.array(dtype=wp.int32),
+                             viewTransforms: wp.array(dtype=wp.mat44),
+                             attenuation: float,
+                             sensor_loc: wp.array(dtype=wp.vec3),
+                             sonar_grid: sonarGrid,
+                             bin_sum: wp.array(ndim=2, dtype=wp.float32),
+                             bin_count: wp.array(ndim=2, dtype=wp.int32)):
+    tid = wp.tid()
+    s = int(0)
+    while tid >= point_offsets[s + 1]:
+        s += 1
+    i = tid - point_offsets[s]
+    n = point_offsets[s + 1] - point_offsets[s]
+
+    pcl = wp.array(ptr=buffer_ptrs[0, s], shape=(n, 3), dtype=wp.float32)
+    x = pcl[i, 0]
+    y = pcl[i, 1]
+    z = pcl[i, 2]
+
+    viewTransform = viewTransforms[s]
+    r_bin_idx = side_range_bin(side_slant_range(viewTransform, x, y, z)[3], sonar_grid)
+    if r_bin_idx < 0:
+        return
+
+    normals = wp.array(ptr=buffer_ptrs[1, s], shape=(n, normal_cols[s]), dtype=wp.float32)
+    semantics = wp.array(ptr=buffer_ptrs[2, s], shape=(n,), dtype=wp.uint32)
+    indexToRefl = wp.array(ptr=buffer_ptrs[3, s], shape=(refl_sizes[s],), dtype=wp.float32)
+
+    normal_vec = wp.vec3(normals[i,0], normals[i,1], normals[i,2])
+    intensity = side_point_intensity(wp.vec3(x, y, z), normal_vec, sensor_loc[s],
+                                     indexToRefl[semantics[i]], attenuation)
+
+    wp.atomic_add(bin_sum, s, r_bin_idx, intensity)
+    wp.atomic_add(bin_count, s, r_bin_idx, 1)
+
+@wp.kernel
+# Sensor group version of side_fused_post_process over (sensor, range bin). Every sensor is
+# normalized by its own maximum and seeded with its own frame id; sensors that did not ping
+# (active[s] == 0) keep their previous side_sonar_data, out_array and image row.
+def side_group_post_process(seeds: wp.array(dtype=wp.int32),
+                            active: wp.array(dtype=wp.int32),
+                            r: wp.array(dtype=wp.float32),
+                            bin_sum: wp.array(ndim=2, dtype=wp.float32),
+                            bin_count: wp.array(ndim=2, dtype=wp.int32),
+                            max_intensity: wp.array(dtype=wp.float32),
+                            max_range: float,
+                            gau_noise_param: float,
+                            ray_noise_param: float,
+                            offset: wp.float32,
+                            gain: wp.float32,
+                            side_sonar_data: wp.array(ndim=2, dtype=wp.vec3),
+                            out_array: wp.array(ndim=2, dtype=wp.float32),
+                            side_sonar_image: wp.array(ndim=3, dtype=wp.uint8)):
+    s, i = wp.tid()
+    if active[s] == 0:
+        return
+
+    state = wp.rand_init(seeds[s], i)
+    intensity = side_ping_intensity(state, r[i], bin_sum[s, i], max_intensity[s], max_range,
+                                    gau_noise_param, ray_noise_param, offset, gain)
+
+    side_sonar_data[s, i] = wp.vec3(r[i], 0.0, intensity)
+
+    count = bin_count[s, i]
+    if count > 0:
+        out_array[s, i] = intensity / float(count)
+    else:
+        out_array[s, i] = 0.0
+
+    sonar_rgb = wp.uint8(intensity * wp.float32(255))
+    side_sonar_image[s, i, 0] = sonar_rgb
+    side_sonar_image[s, i, 1] = sonar_rgb
+    side_sonar_image[s, i, 2] = sonar_rgb
+    side_sonar_image[s, i, 3] = wp.uint8(255)
+
+@wp.kernel
+def side_altitude_accumulate(pcl: wp.array(ndim=2, dtype=wp.float32),
+                             sensor_loc: wp.array(dtype=wp.vec3),
+                             stride: int,
+                             sonar_grid: sonarGrid,
+                             altitude_acc: wp.array(dtype=wp.float32)):
+    # Vertical drop (world z up) from the sensor to every stride-th return inside the range window.
+    # On a flat seabed this is the altitude, since slant range * sin(depression) = altitude.
+    tid = wp.tid()
+    idx = tid * stride
+    if idx >= pcl.shape[0]:
+        return
+    p = wp.vec3(pcl[idx, 0], pcl[idx, 1], pcl[idx, 2])
+    if wp.isnan(p[0]) or wp.isnan(p[1]) or wp.isnan(p[2]):
+        return
+    r = wp.length(p - sensor_loc[0])
+    if r < sonar_grid.x_offset or r >= sonar_grid.x_offset + sonar_grid.x_res * float(sonar_grid.x_num):
+        return
+    wp.atomic_add(altitude_acc, 0, sensor_loc[0][2] - p[2])
+    wp.atomic_add(altitude_acc, 1, 1.0)
+
 @wp.kernel
 def bin_semantics_process(pcl: wp.array(dtype=wp.vec3),
                           semantics: wp.array(dtype=wp.uint32),
@@ -259,6 +971,89 @@ def side_compute_max_intensity_range(array: wp.array(dtype=wp.float32),
     i = wp.tid()
     wp.atomic_max(max_value, 0, array[i])
 
+# Operations of the two-stage row reduction (ReductionEngine)
+REDUCE_MAX = wp.constant(0)
+REDUCE_SUM = wp.constant(1)
+REDUCE_MEAN = wp.constant(2)
+
+@wp.func
+def reduce_identity(op: int) -> float:
+    if op == REDUCE_MAX:
+        return -wp.inf
+    return 0.0
+
+@wp.func
+def reduce_combine(op: int, a: float, b: float) -> float:
+    if op == REDUCE_MAX:
+        return wp.max(a, b)
+    return a + b
+
+@wp.kernel
+# Stage 1 of a row reduction: thread (row, block) reduces block_size consecutive elements of its row
+# into partials[row, block]. No atomics, every partial has a single writer.
+def reduce_rows_partial(values: wp.array(ndim=2, dtype=wp.float32),
+                        op: int,
+                        block_size: int,
+                        partials: wp.array(ndim=2, dtype=wp.float32)):
+    row, block = wp.tid()
+    start = block * block_size
+    end = wp.min(start + block_size, values.shape[1])
+    acc = reduce_identity(op)
+    for j in range(start, end):
+        acc = reduce_combine(op, acc, values[row, j])
+    partials[row, block] = acc
+
+@wp.kernel
+# Stage 2 of a row reduction: one thread per row folds its partials, the mean divides by the row length.
+def reduce_rows_final(partials: wp.array(ndim=2, dtype=wp.float32),
+                      op: int,
+                      row_length: int,
+                      out: wp.array(dtype=wp.float32)):
+    row = wp.tid()
+    acc = reduce_identity(op)
+    for b in range(partials.shape[1]):
+        acc = reduce_combine(op, acc, partials[row, b])
+    if op == REDUCE_MEAN:
+        acc = acc / float(row_length)
+    out[row] = acc
+
+@wp.kernel
+# Per-range normalization of the side-scan: bin_sum of this ping becomes column slot of the
+# (bins, window) history, whose row maxima are the per-range normalization values.
+def side_push_range_history(bin_sum: wp.array(dtype=wp.float32),
+                            slot: int,
+                            history: wp.array(ndim=2, dtype=wp.float32)):
+    i = wp.tid()
+    history[i, slot] = bin_sum[i]
+
+@wp.kernel
+# Floor of the per-range normalization values: a range bin whose history is short or weak is divided by
+# at least floor x the maximum of its ping, so it does not saturate against its own value.
+def side_floor_range_max(ping_max: wp.array(dtype=wp.float32),
+                         floor: float,
+                         bins_per_ping: int,
+                         max_intensity: wp.array(dtype=wp.float32)):
+    i = wp.tid()
+    max_intensity[i] = wp.max(max_intensity[i], floor * ping_max[i / bins_per_ping])
+
+@wp.func
+def side_bin_max(max_intensity: wp.array(dtype=wp.float32), flat_bin: int) -> float:
+    # Normalization value of a (flattened) bin: one per bin with per-range normalization, else the ping maximum
+    if max_intensity.shape[0] > 1:
+        return max_intensity[flat_bin]
+    return max_intensity[0]
+
+@wp.func
+def side_bin_mean(intensity: float, count: int, bin_weight: wp.array(dtype=wp.float32), flat_bin: int) -> float:
+    # Mean return of a bin: divided by the splat weights when range splatting filled bin_weight
+    # (bin_count then only flags bins with data), else by the return count. An empty bin_weight
+    # means nearest-bin assignment.
+    if count <= 0:
+        return 0.0
+    if bin_weight.shape[0] > 0:
+        return intensity / bin_weight[flat_bin]
+    return intensity / float(count)
+
 
 @wp.kernel
 def normalize_bin(bin_sum: wp.array(dtype=wp.float32),
@@ -456,7 +1251,7 @@ def side_make_sonar_map_range(r: wp.array(dtype=wp.float32),
     # intensity[i] *= (0.5 + gau_noise[i])
     # intensity[i] += range_ray_noise[i]
 
-    intensity[i] = intensity[i] / (max_intensity[0] + 1e-6)
+    intensity[i] = intensity[i] / (side_bin_max(max_intensity, i) + 1e-6)
     intensity[i] *= (0.9 + 0.1 + gau_noise[i])
     # intensity[i] +=  range_ray_noise[i]
     intensity[i] += 0.3 * range_ray_noise[i]
@@ -510,6 +1305,238 @@ def side_make_sonar_map_range(r: wp.array(dtype=wp.float32),
 
 ### FIXING NORMALIZATION ##################################################################
 
+@wp.func
+def side_ping_intensity(state: wp.uint32,
+                        r: float,
+                        bin_value: float,
+                        max_value: float,
+                        max_range: float,
+                        gau_noise_param: float,
+                        ray_noise_param: float,
+                        offset: float,
+                        gain: float) -> float:
+    # Both noise kernels of the reference chain seed rand_init(seed, i), so the gaussian
+    # sample is the first normal draw of the rayleigh pair. One state serves both.
+    n1 = wp.randn(state)
+    n2 = wp.randn(state)
+    gau_noise = 0.0 + gau_noise_param * n1
+    rayleigh = ray_noise_param * wp.sqrt(n1*n1 + n2*n2)
+    range_ray_noise = wp.pow(r / max_range, 0.3) * rayleigh
+
+    intensity = bin_value / (max_value + 1e-6)
+    intensity *= (0.9 + 0.1 + gau_noise)
+    intensity += 0.3 * range_ray_noise
+    intensity += offset
+    intensity *= gain
+    return wp.clamp(intensity, wp.float32(0.0), wp.float32(1.0))
+
+@wp.func
+def side_write_pixel(side_sonar_image: wp.array(ndim=2, dtype=wp.uint8), col: int, intensity: float):
+    sonar_rgb = wp.uint8(intensity * wp.float32(255))
+    side_sonar_image[col,0] = sonar_rgb
+    side_sonar_image[col,1] = sonar_rgb
+    side_sonar_image[col,2] = sonar_rgb
+    side_sonar_image[col,3] = wp.uint8(255)
+
+@wp.kernel
+# Fused version of side_normal_1d -> side_range_dependent_rayleigh_1d -> side_make_sonar_map_range
+# -> normalize_bin -> make_side_sonar_image, launched once over the range bins after the max reduction.
+# bin_sum is only read here (the reference chain normalizes it in place), so the raw binned
+# response is still available after the ping.
+def side_fused_post_process(seed: int,
+                            r: wp.array(dtype=wp.float32),
+                            bin_sum: wp.array(dtype=wp.float32),
+                            bin_count: wp.array(dtype=wp.int32),
+                            bin_weight: wp.array(dtype=wp.float32),
+                            max_intensity: wp.array(dtype=wp.float32),
+                            max_range: float,
+                            gau_noise_param: float,
+                            ray_noise_param: float,
+                            offset: wp.float32,
+                            gain: wp.float32,
+                            side_sonar_data: wp.array(dtype=wp.vec3),
+                            out_array: wp.array(dtype=wp.float32),
+                            side_sonar_image: wp.array(ndim=2, dtype=wp.uint8)):
+    i = wp.tid()
+
+    state = wp.rand_init(seed, i)
+    intensity = side_ping_intensity(state, r[i], bin_sum[i], side_bin_max(max_intensity, i), max_range,
+                                    gau_noise_param, ray_noise_param, offset, gain)
+
+    side_sonar_data[i] = wp.vec3(r[i], 0.0, intensity)
+
+    out_array[i] = side_bin_mean(intensity, bin_count[i], bin_weight, i)
+
+    side_write_pixel(side_sonar_image, i, intensity)
+
+@wp.kernel
+# Dual-channel version of side_fused_post_process over (channel, range bin). With a single
+# max_intensity both channels share it, so port and starboard are on the same scale. The image row is laid out side by
+# side with the port channel mirrored: [port far ... port near | starboard near ... starboard far].
+def side_dual_fused_post_process(seed: int,
+                                 r: wp.array(dtype=wp.float32),
+                                 bin_sum: wp.array(ndim=2, dtype=wp.float32),
+                                 bin_count: wp.array(ndim=2, dtype=wp.int32),
+                                 bin_weight: wp.array(dtype=wp.float32),
+                                 max_intensity: wp.array(dtype=wp.float32),
+                                 max_range: float,
+                                 gau_noise_param: float,
+                                 ray_noise_param: float,
+                                 offset: wp.float32,
+                                 gain: wp.float32,
+                                 side_sonar_data: wp.array(ndim=2, dtype=wp.vec3),
+                                 out_array: wp.array(ndim=2, dtype=wp.float32),
+                                 side_sonar_image: wp.array(ndim=2, dtype=wp.uint8)):
+    c, i = wp.tid()
+    num_bins = r.shape[0]
+
+    # Channel 0 draws the same noise as the single-channel kernel
+    state = wp.rand_init(seed, c * num_bins + i)
+    intensity = side_ping_intensity(state, r[i], bin_sum[c, i], side_bin_max(max_intensity, c * num_bins + i), max_range,
+                                    gau_noise_param, ray_noise_param, offset, gain)
+
+    side_sonar_data[c, i] = wp.vec3(r[i], 0.0, intensity)
+
+    out_array[c, i] = side_bin_mean(intensity, bin_count[c, i], bin_weight, c * num_bins + i)
+
+    col = num_bins + i
+    if c == 0:
+        col = num_bins - 1 - i
+    side_write_pixel(side_sonar_image, col, intensity)
+
+@wp.kernel
+# Ray backend without the renderer: casts the sonar fan against a wp.Mesh BVH and writes the hits
+# in the pointcloud annotator layout (pcl (N, 3), normals (N, 4), semantics (N,)), compacted
+# through hit_count. Rays start at min_range like the camera's near clipping plane, normals face
+# the sensor, and semantics come from the semantic id of the hit face.
+def sonar_fan_raycast(mesh: wp.uint64,
+                      camera_to_world: wp.mat44,
+                      ray_dirs: wp.array(dtype=wp.vec3),
+                      min_range: float,
+                      max_range: float,
+                      face_semantics: wp.array(dtype=wp.uint32),
+                      hit_count: wp.array(dtype=wp.int32),
+                      pcl: wp.array(ndim=2, dtype=wp.float32),
+                      normals: wp.array(ndim=2, dtype=wp.float32),
+                      semantics: wp.array(dtype=wp.uint32)):
+    tid = wp.tid()
+    origin = wp.transform_point(camera_to_world, wp.vec3(0.0, 0.0, 0.0))
+    direction = wp.normalize(wp.transform_vector(camera_to_world, ray_dirs[tid]))
+    start = origin + direction * min_range
+
+    query = wp.mesh_query_ray(mesh, start, direction, max_range - min_range)
+    if not query.result:
+        return
+
+    p = start + direction * query.t
+    n = wp.normalize(query.normal)
+    if wp.dot(n, direction) > 0.0:
+        n = -n
+
+    idx = wp.atomic_add(hit_count, 0, 1)
+    pcl[idx, 0] = p[0]
+    pcl[idx, 1] = p[1]
+    pcl[idx, 2] = p[2]
+    normals[idx, 0] = n[0]
+    normals[idx, 1] = n[1]
+    normals[idx, 2] = n[2]
+    normals[idx, 3] = 0.0
+    semantics[idx] = face_semantics[query.face]
+
+@wp.kernel
+# Surfel backend, pass 1. One thread per hash grid cell of the box around the fan; the query only
+# touches that cell, and the floor() check drops surfels of other cells hashed to the same bucket.
+# Surfels inside the range annulus and the fan are appended to the candidate list with their fan
+# pixel and range (count keeps growing past the capacity so the host can detect an overflow), and
+# depth keeps the nearest range seen by every pixel.
+def surfel_gather_candidates(grid: wp.uint64,
+                             cell_width: float,
+                             cell_lo: wp.vec3i,
+                             cell_dims: wp.vec3i,
+                             surfel_pos: wp.array(dtype=wp.vec3),
+                             world_to_camera: wp.mat44,
+                             camera_pos: wp.vec3,
+                             tan_x: float,
+                             tan_y: float,
+                             hori_res: int,
+                             vert_res: int,
+                             min_range: float,
+                             max_range: float,
+                             depth: wp.array(dtype=wp.float32),
+                             candidate_count: wp.array(dtype=wp.int32),
+                             candidate_surfel: wp.array(dtype=wp.int32),
+                             candidate_pixel: wp.array(dtype=wp.int32),
+                             candidate_range: wp.array(dtype=wp.float32)):
+    tid = wp.tid()
+    cx = cell_lo[0] + tid % cell_dims[0]
+    cy = cell_lo[1] + (tid / cell_dims[0]) % cell_dims[1]
+    cz = cell_lo[2] + tid / (cell_dims[0] * cell_dims[1])
+    center = wp.vec3(float(cx) + 0.5, float(cy) + 0.5, float(cz) + 0.5) * cell_width
+
+    query = wp.hash_grid_query(grid, center, 0.25 * cell_width)
+    index = int(0)
+    while wp.hash_grid_query_next(query, index):
+        p = surfel_pos[index]
+        if int(wp.floor(p[0] / cell_width)) != cx or int(wp.floor(p[1] / cell_width)) != cy or int(wp.floor(p[2] / cell_width)) != cz:
+            continue
+        r = wp.length(p - camera_pos)
+        if r < min_range or r > max_range:
+            continue
+        q = wp.transform_point(world_to_camera, p)
+        if q[2] >= 0.0:
+            continue
+        u = q[0] / (-q[2] * tan_x)
+        v = q[1] / (-q[2] * tan_y)
+        if wp.abs(u) >= 1.0 or wp.abs(v) >= 1.0:
+            continue
+        col = wp.min(int((u + 1.0) * 0.5 * float(hori_res)), hori_res - 1)
+        row = wp.min(int((1.0 - v) * 0.5 * float(vert_res)), vert_res - 1)
+        pixel = row * hori_res + col
+
+        wp.atomic_min(depth, pixel, r)
+        idx = wp.atomic_add(candidate_count, 0, 1)
+        if idx < candidate_surfel.shape[0]:
+            candidate_surfel[idx] = index
+            candidate_pixel[idx] = pixel
+            candidate_range[idx] = r
+
+@wp.kernel
+# Surfel backend, pass 2: keep the candidates within depth_tolerance of their pixel's nearest range
+# (what the render would see, so shadows survive) and write them in the annotator layout, normals
+# facing the sensor like sonar_fan_raycast.
+def surfel_compact_visible(candidate_surfel: wp.array(dtype=wp.int32),
+                           candidate_pixel: wp.array(dtype=wp.int32),
+                           candidate_range: wp.array(dtype=wp.float32),
+                           depth: wp.array(dtype=wp.float32),
+                           depth_tolerance: float,
+                           camera_pos: wp.vec3,
+                           surfel_pos: wp.array(dtype=wp.vec3),
+                           surfel_normal: wp.array(dtype=wp.vec3),
+                           surfel_semantics: wp.array(dtype=wp.uint32),
+                           hit_count: wp.array(dtype=wp.int32),
+                           pcl: wp.array(ndim=2, dtype=wp.float32),
+                           normals: wp.array(ndim=2, dtype=wp.float32),
+                           semantics: wp.array(dtype=wp.uint32)):
+    tid = wp.tid()
+    if candidate_range[tid] > depth[candidate_pixel[tid]] + depth_tolerance:
+        return
+
+    s = candidate_surfel[tid]
+    p = surfel_pos[s]
+    n = surfel_normal[s]
+    if wp.dot(n, p - camera_pos) > 0.0:
+        n = -n
+
+    idx = wp.atomic_add(hit_count, 0, 1)
+    pcl[idx, 0] = p[0]
+    pcl[idx, 1] = p[1]
+    pcl[idx, 2] = p[2]
+    normals[idx, 0] = n[0]
+    normals[idx, 1] = n[1]
+    normals[idx, 2] = n[2]
+    normals[idx, 3] = 0.0
+    semantics[idx] = surfel_semantics[s]
+
 @wp.kernel
 def make_sonar_image(sonar_data: wp.array(ndim=2, dtype=wp.vec3),
                      sonar_image: wp.array(ndim=3, dtype=wp.uint8)):
@@ -545,6 +1572,22 @@ def update_first_row(sonar_image: wp.array(ndim = 2, dtype = wp.uint8),
     i, j = wp.tid()
     waterfall[0, i, j] = sonar_image[i,j]
 
+@wp.kernel
+def write_waterfall_row(sonar_image: wp.array(ndim=2, dtype=wp.uint8),
+                        waterfall: wp.array(ndim=3, dtype=wp.uint8),
+                        row: int):
+    # Ring buffer write: only the newest row is touched, the rest of the waterfall stays put
+    i, j = wp.tid()
+    waterfall[row, i, j] = sonar_image[i, j]
+
+@wp.kernel
+def unroll_waterfall(ring: wp.array(ndim=3, dtype=wp.uint8),
+                     head: int,
+                     waterfall: wp.array(ndim=3, dtype=wp.uint8)):
+    # Row 0 of the unrolled waterfall is the newest ping, stored at ring[head]
+    i, j, k = wp.tid()
+    waterfall[i, j, k] = ring[(head + i) % ring.shape[0], j, k]
+
 @wp.kernel
 def make_semantics_image(bin_semantics: wp.array(ndim=2, dtype=wp.uint32),
                          semantics_color: wp.array(ndim=2, dtype=wp.uint8),
@@ -0,0 +1,297 @@
+import json
+
+import numpy as np
+import warp as wp
+
+try:
+    from isaacsim.oceansim.utils.ImagingSonar_kernels import sonar_fan_raycast
+except ImportError:
+    # Running outside Isaac Sim (replay, tests on the Warp CPU device): use the local kernels file
+    from imaging_sonar_kernels import sonar_fan_raycast
+
+
+# Reserved ids of the semantic segmentation annotator's idToLabels
+BACKGROUND_ID = 0
+UNLABELLED_ID = 1
+
+
+def heightmap_to_mesh(heightmap: np.ndarray, scale=(100.0, 100.0, 10.0)):
+    """Triangle mesh of a heightmap, with the vertex layout and winding of
+    terrain_generation/run_terrain_generation.generate_usd_terrain_from_heightmap().
+
+    Args:
+        heightmap (np.ndarray): (size, size) heights, e.g. generate_parametric_heightmap() output in [0, 1]
+        scale (tuple, optional): (scale_x, scale_y, scale_z) as in TerrainParameters. Defaults to (100.0, 100.0, 10.0).
+
+    Returns:
+        tuple: (points (size*size, 3) float32, indices (2*(size-1)^2*3,) int32)
+    """
+    heightmap = np.asarray(heightmap)
+    size = heightmap.shape[0]
+    ys, xs = np.meshgrid(np.arange(size), np.arange(size), indexing="ij")
+    points = np.stack([(xs / size - 0.5) * scale[0],
+                       (ys / size - 0.5) * scale[1],
+                       heightmap * scale[2]], axis=-1).reshape(-1, 3).astype(np.float32)
+
+    v1 = (ys[:-1, :-1] * size + xs[:-1, :-1]).ravel()
+    v2 = v1 + 1
+    v3 = v1 + size + 1
+    v4 = v1 + size
+    indices = np.stack([v1, v2, v3, v1, v3, v4], axis=-1).reshape(-1).astype(np.int32)
+    return points, indices
+
+
+class MeshRayScene:
+    """Static scene geometry for the mesh ray backend: one wp.Mesh (BVH) plus a semantic id per face.
+
+    Every mesh added with labels (e.g. {"class": "seabed", "reflectivity": 0.6}) gets a semantic id,
+    meshes with the same labels share one. id_to_labels is laid out like the semantic segmentation
+    annotator's idToLabels, so LabelTableCache / make_indexToProp_array work on it unchanged.
+
+        scene = MeshRayScene(device="cpu")
+        scene.add_heightmap(heightmap, scale=(100.0, 100.0, 10.0), labels={"class": "seabed", "reflectivity": 0.8})
+        scene.build()
+    """
+
+    def __init__(self, device=None):
+        self.device = wp.get_device(device)
+        self.id_to_labels = {str(BACKGROUND_ID): {"class": "BACKGROUND"}, str(UNLABELLED_ID): {"class": "UNLABELLED"}}
+        self.mesh = None
+        self.face_semantics = None
+        self._label_ids = {}
+        self._points = []
+        self._indices = []
+        self._semantics = []
+        self._num_points = 0
+
+    def _semantic_id(self, labels: dict) -> int:
+        if not labels:
+            return UNLABELLED_ID
+        fingerprint = json.dumps(labels, sort_keys=True, default=str)
+        semantic_id = self._label_ids.get(fingerprint)
+        if semantic_id is None:
+            semantic_id = self._label_ids[fingerprint] = len(self.id_to_labels)
+            self.id_to_labels[str(semantic_id)] = dict(labels)
+        return semantic_id
+
+    def add_mesh(self, points: np.ndarray, indices: np.ndarray, labels: dict = None, transform: np.ndarray = None) -> int:
+        """Add a triangle mesh. Call build() after the last one.
+
+        Args:
+            points (np.ndarray): (V, 3) vertices
+            indices (np.ndarray): (F*3,) or (F, 3) triangle vertex indices
+            labels (dict, optional): Semantic labels of the mesh. Defaults to UNLABELLED.
+            transform (np.ndarray, optional): 4x4 local-to-world matrix (column vector convention)
+
+        Returns:
+            int: semantic id of the mesh's faces
+        """
+        points = np.asarray(points, dtype=np.float64).reshape(-1, 3)
+        indices = np.asarray(indices, dtype=np.int64).reshape(-1)
+        if transform is not None:
+            transform = np.asarray(transform, dtype=np.float64)
+            points = points @ transform[:3, :3].T + transform[:3, 3]
+        semantic_id = self._semantic_id(labels)
+        self._points.append(points.astype(np.float32))
+        self._indices.append((indices + self._num_points).astype(np.int32))
+        self._semantics.append(np.full(indices.shape[0] // 3, semantic_id, dtype=np.uint32))
+        self._num_points += points.shape[0]
+        return semantic_id
+
+    def add_heightmap(self, heightmap: np.ndarray, scale=(100.0, 100.0, 10.0), labels: dict = None, transform: np.ndarray = None) -> int:
+        """Add a terrain heightmap, laid out like generate_usd_terrain_from_heightmap(), see heightmap_to_mesh()."""
+        points, indices = heightmap_to_mesh(heightmap, scale)
+        return self.add_mesh(points, indices, labels=labels, transform=transform)
+
+    @classmethod
+    def from_heightmap(cls, heightmap: np.ndarray, scale=(100.0, 100.0, 10.0), labels: dict = None, device=None):
+        scene = cls(device=device)
+        scene.add_heightmap(heightmap, scale=scale, labels=labels)
+        scene.build()
+        return scene
+
+    @classmethod
+    def from_stage(cls, stage, root_path: str = "/World", collision_only: bool = True, device=None):
+        """Scene of the static meshes under root_path of a USD stage (needs pxr, i.e. Isaac Sim).
+
+        Polygons are fan-triangulated and baked with their world transform. Labels are the
+        Semantics API entries (type -> data) of the prim and its ancestors, which is what the
+        semantic segmentation annotator reports.
+
+        Args:
+            stage: Usd.Stage
+            root_path (str, optional): Subtree to collect. Defaults to "/World".
+            collision_only (bool, optional): Only take meshes with the physics CollisionAPI applied. Defaults to True.
+        """
+        from pxr import Usd, UsdGeom, UsdPhysics
+
+        scene = cls(device=device)
+        for prim in Usd.PrimRange(stage.GetPrimAtPath(root_path)):
+            if not prim.IsA(UsdGeom.Mesh):
+                continue
+            if collision_only and not prim.HasAPI(UsdPhysics.CollisionAPI):
+                continue
+            mesh = UsdGeom.Mesh(prim)
+            points = np.asarray(mesh.GetPointsAttr().Get(), dtype=np.float64)
+            counts = np.asarray(mesh.GetFaceVertexCountsAttr().Get(), dtype=np.int64)
+            face_indices = np.asarray(mesh.GetFaceVertexIndicesAttr().Get(), dtype=np.int64)
+            if points.size == 0 or counts.size == 0:
+                continue
+            # Gf matrices are row-vector convention
+            transform = np.asarray(UsdGeom.Xformable(prim).ComputeLocalToWorldTransform(Usd.TimeCode.Default())).T
+            scene.add_mesh(points, cls._triangulate(counts, face_indices), labels=cls._prim_labels(prim), transform=transform)
+        scene.build()
+        return scene
+
+    @staticmethod
+    def _triangulate(counts: np.ndarray, face_indices: np.ndarray) -> np.ndarray:
+        starts = np.concatenate([[0], np.cumsum(counts)[:-1]])
+        triangles = [np.stack([np.full(count - 2, start), start + np.arange(1, count - 1), start + np.arange(2, count)], axis=-1)
+                     for start, count in zip(starts, counts) if count >= 3]
+        if not triangles:
+            return np.zeros(0, dtype=np.int64)
+        return face_indices[np.concatenate(triangles).reshape(-1)]
+
+    @staticmethod
+    def _prim_labels(prim) -> dict:
+        import Semantics
+
+        labels = {}
+        while prim and prim.IsValid():
+            for schema in prim.GetAppliedSchemas():
+                if not schema.startswith("SemanticsAPI:"):
+                    continue
+                sem = Semantics.SemanticsAPI.Get(prim, schema.split(":", 1)[1])
+                # The closest prim wins
+                labels.setdefault(sem.GetSemanticTypeAttr().Get(), sem.GetSemanticDataAttr().Get())
+            prim = prim.GetParent()
+        return labels
+
+    def triangles(self) -> tuple:
+        """Everything added so far as host arrays: (points (V, 3) float32, indices (F*3,) int32, face semantic ids (F,) uint32)."""
+        if not self._points:
+            raise ValueError("MeshRayScene has no geometry")
+        return np.concatenate(self._points), np.concatenate(self._indices), np.concatenate(self._semantics)
+
+    def build(self) -> wp.Mesh:
+        """Build the BVH of everything added so far."""
+        points, indices, face_semantics = self.triangles()
+        self.mesh = wp.Mesh(points=wp.array(points, dtype=wp.vec3, device=self.device),
+                            indices=wp.array(indices, dtype=wp.int32, device=self.device))
+        self.face_semantics = wp.array(face_semantics, dtype=wp.uint32, device=self.device)
+        return self.mesh
+
+    @property
+    def num_faces(self) -> int:
+        return 0 if self.face_semantics is None else self.face_semantics.shape[0]
+
+
+def camera_to_world_from_pose(position, orientation) -> np.ndarray:
+    """4x4 camera-to-world matrix from a position and a (w, x, y, z) quaternion in the USD camera
+    convention (looking down -Z with +Y up), i.e. the camera prim's own world transform."""
+    w, x, y, z = orientation
+    rotation = np.array([
+        [1 - 2 * (y * y + z * z), 2 * (x * y - w * z), 2 * (x * z + w * y)],
+        [2 * (x * y + w * z), 1 - 2 * (x * x + z * z), 2 * (y * z - w * x)],
+        [2 * (x * z - w * y), 2 * (y * z + w * x), 1 - 2 * (x * x + y * y)],
+    ])
+    camera_to_world = np.eye(4)
+    camera_to_world[:3, :3] = rotation
+    camera_to_world[:3, 3] = position
+    return camera_to_world
+
+
+class SonarRayCaster:
+    """Casts the sonar's ray fan against a MeshRayScene instead of rendering it.
+
+    The fan is the pinhole grid of the render product it replaces: hori_res x vert_res rays with
+    square pixels and the horizontal aperture set to hori_fov, looking down the camera's -Z axis.
+    cast() returns a scan_data dict in the annotator layout that SideScanSonarSensor.scan() stores
+    (pcl (N, 3), normals (N, 4), semantics (N,), viewTransform, idToLabels), so every processing
+    path, including compute_intensity, takes it unchanged. Runs on any Warp device, the CPU included.
+
+        caster = SonarRayCaster(scene, hori_fov=0.2, hori_res=300, vert_res=4096, min_range=8.0, max_range=10.0)
+        scan_data = caster.cast(camera_to_world)
+    """
+
+    def __init__(self,
+                 scene: MeshRayScene,
+                 hori_fov: float,
+                 hori_res: int,
+                 vert_res: int,
+                 min_range: float,
+                 max_range: float):
+        """
+        Args:
+            scene (MeshRayScene): Built scene, its device is used for the rays
+            hori_fov (float): Horizontal field of view in degrees
+            hori_res (int): Rays across the horizontal field of view
+            vert_res (int): Rays across the vertical field of view
+            min_range (float): Near distance, geometry closer than this is ignored
+            max_range (float): Far distance
+        """
+        if scene.mesh is None:
+            raise ValueError("Call MeshRayScene.build() before creating a SonarRayCaster")
+        self.scene = scene
+        self.device = scene.device
+        self.min_range = min_range
+        self.max_range = max_range
+        self.set_fan(hori_fov, hori_res, vert_res)
+        self._hit_count = wp.zeros(shape=(1,), dtype=wp.int32, device=self.device)
+
+    def set_fan(self, hori_fov: float, hori_res: int, vert_res: int):
+        """Resize the ray fan, e.g. after the render product resolution would have changed."""
+        self.hori_fov = hori_fov
+        self.hori_res = hori_res
+        self.vert_res = vert_res
+        tan_x = np.tan(np.deg2rad(hori_fov) / 2)
+        tan_y = tan_x * vert_res / hori_res
+        u = (2.0 * (np.arange(hori_res) + 0.5) / hori_res - 1.0) * tan_x
+        v = (1.0 - 2.0 * (np.arange(vert_res) + 0.5) / vert_res) * tan_y
+        vv, uu = np.meshgrid(v, u, indexing="ij")
+        dirs = np.stack([uu, vv, -np.ones_like(uu)], axis=-1).reshape(-1, 3)
+        self.vert_fov = np.rad2deg(2 * np.arctan(tan_y))
+        self.num_rays = dirs.shape[0]
+        self._ray_dirs = wp.array(dirs.astype(np.float32), dtype=wp.vec3, device=self.device)
+        self._pcl = wp.empty(shape=(self.num_rays, 3), dtype=wp.float32, device=self.device)
+        self._normals = wp.empty(shape=(self.num_rays, 4), dtype=wp.float32, device=self.device)
+        self._semantics = wp.empty(shape=(self.num_rays,), dtype=wp.uint32, device=self.device)
+
+    def cast(self, camera_to_world: np.ndarray) -> dict:
+        """Cast the fan from a camera pose.
+
+        Args:
+            camera_to_world (np.ndarray): 4x4 world transform of the camera prim (column vector convention)
+
+        Returns:
+            dict: scan_data with pcl, normals, semantics (views of internal buffers, valid until the
+                  next cast), viewTransform (4x4 world-to-camera) and idToLabels
+        """
+        camera_to_world = np.asarray(camera_to_world, dtype=np.float64).reshape(4, 4)
+        self._hit_count.zero_()
+        wp.launch(kernel=sonar_fan_raycast,
+                  dim=self.num_rays,
+                  inputs=[
+                      self.scene.mesh.id,
+                      wp.mat44(camera_to_world.astype(np.float32)),
+                      self._ray_dirs,
+                      self.min_range,
+                      self.max_range,
+                      self.scene.face_semantics,
+                  ],
+                  outputs=[
+                      self._hit_count,
+                      self._pcl,
+                      self._normals,
+                      self._semantics,
+                  ],
+                  device=self.device)
+        # The annotator also hands out hits only; the count is the one readback of a cast
+        num_hits = int(self._hit_count.numpy()[0])
+        return {
+            "pcl": self._pcl[:num_hits],
+            "normals": self._normals[:num_hits],
+            "semantics": self._semantics[:num_hits],
+            "viewTransform": np.linalg.inv(camera_to_world).astype(np.float32),
+            "idToLabels": self.scene.id_to_labels,
+        }
@@ -96,7 +96,8 @@ class SideScanSonarScenario():
         self._time += step
 
 
-        self._right_side_sonar.make_side_sonar_data()
+        # Only processes a ping on the steps the sensor's ping scheduler fires
+        self._right_side_sonar.make_side_sonar_data(sim_time=self._time)
         # self._left_side_sonar.make_left_side_sonar_data()
         force_cmd = Gf.Vec3f(*self._force_cmd._base_command)
         torque_cmd = Gf.Vec3f(*self._torque_cmd._base_command)
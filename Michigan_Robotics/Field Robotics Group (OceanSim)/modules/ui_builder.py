@@ -483,8 +483,7 @@ class UIBuilder:
         Args:
             step (float): The dt of the current physics step
         """
-        self._right_side_sonar.make_side_sonar_data()
-        # self._left_side_sonar.make_side_sonar_data()
+        # The scenario pings the sonar (at its own ping rate, see PingScheduler)
         self._scenario.update_scenario(step)
 
     def _on_run_scenario_a_text(self):
@@ -0,0 +1,1645 @@
+import copy
+import json
+import time
+from collections import deque
+from contextlib import nullcontext
+from dataclasses import dataclass
+
+import numpy as np
+import warp as wp
+
+try:
+    from isaacsim.oceansim.utils.ImagingSonar_kernels import *
+except ImportError:
+    # Running outside Isaac Sim (tests, benchmarks, offline tools): use the local kernels file
+    from imaging_sonar_kernels import *
+
+
+class _RollingStat:
+    """Last ``window`` samples of one quantity plus lifetime count and total."""
+
+    def __init__(self, window: int):
+        self.samples = deque(maxlen=window)
+        self.count = 0
+        self.total = 0.0
+
+    def add(self, value: float):
+        self.samples.append(value)
+        self.count += 1
+        self.total += value
+
+    def summary(self) -> dict:
+        window = np.asarray(self.samples, dtype=np.float64)
+        return {
+            "count": self.count,
+            "total": self.total,
+            "last": float(window[-1]),
+            "mean": float(window.mean()),
+            "p50": float(np.percentile(window, 50)),
+            "p95": float(np.percentile(window, 95)),
+            "max": float(window.max()),
+        }
+
+
+class _StageTimer:
+    def __init__(self, profiler, name: str):
+        self._profiler = profiler
+        self._name = name
+
+    def __enter__(self):
+        if self._profiler.sync:
+            wp.synchronize_device(self._profiler.device)
+        self._start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        if self._profiler.sync:
+            wp.synchronize_device(self._profiler.device)
+        self._profiler.record(f"time_ms/{self._name}", (time.perf_counter() - self._start) * 1e3)
+        return False
+
+
+_NULL_STAGE = nullcontext()
+
+
+class PingProfiler:
+    """Per-stage timings and counters of the ping pipeline, kept as rolling statistics.
+
+    Disabled (the default) every call returns right away, so the instrumentation can stay in the
+    ping path. When enabled:
+        with profiler.stage("binning"):    # wall time of the stage -> "time_ms/binning"
+            ...
+        profiler.record("points", n)       # one sample of a per-ping quantity
+        profiler.count("dropped_frames")   # event counter
+
+    Kernel launches are asynchronous, so by default a stage measures the host side (launch cost).
+    With sync=True the device is synchronized around every stage, which gives the device time of
+    the stage at the price of serializing the pipeline.
+    """
+
+    def __init__(self, enabled: bool = False, window: int = 100, sync: bool = False, device=None):
+        self.enabled = enabled
+        self.window = window
+        self.sync = sync
+        self.device = wp.get_device(device)
+        self.stats = {}
+        self.counters = {}
+
+    def stage(self, name: str):
+        if not self.enabled:
+            return _NULL_STAGE
+        return _StageTimer(self, name)
+
+    def record(self, name: str, value: float):
+        if not self.enabled:
+            return
+        stat = self.stats.get(name)
+        if stat is None:
+            stat = self.stats[name] = _RollingStat(self.window)
+        stat.add(float(value))
+
+    def count(self, name: str, value: int = 1):
+        if not self.enabled:
+            return
+        self.counters[name] = self.counters.get(name, 0) + value
+
+    def report(self) -> dict:
+        """Rolling summary (count, total, last, mean, p50, p95, max) of every series, and the counters."""
+        return {
+            "window": self.window,
+            "sync": self.sync,
+            "stats": {name: stat.summary() for name, stat in sorted(self.stats.items())},
+            "counters": dict(sorted(self.counters.items())),
+        }
+
+    def dump(self, path: str):
+        """Write report() as JSON."""
+        with open(path, "w") as f:
+            json.dump(self.report(), f, indent=2)
+
+    def reset(self):
+        self.stats = {}
+        self.counters = {}
+
+
+class SonarBufferPool:
+    """Grow-only pool of per-ping scratch arrays owned by a sonar sensor.
+
+    Every ping needs a handful of point-length work arrays (intensity, range, bin index ...).
+    The point count barely changes between frames, so instead of allocating and freeing them
+    on every ping the pool keeps one backing array per name and hands out a view of the
+    requested length. A backing array only gets reallocated when a ping needs more elements
+    than it holds, and then its capacity grows geometrically so the steady state allocates nothing.
+    """
+
+    def __init__(self,
+                 device=None,
+                 growth_factor: float = 2.0,
+                 min_capacity: int = 1024):
+        """
+        Args:
+            device (optional): Warp device the buffers live on. Defaults to the preferred device.
+            growth_factor (float, optional): Capacity multiplier applied when a buffer has to grow. Defaults to 2.0.
+            min_capacity (int, optional): Smallest capacity ever allocated for a buffer. Defaults to 1024.
+        """
+        if growth_factor <= 1.0:
+            raise ValueError(f"growth_factor must be > 1.0, got {growth_factor}")
+        self.device = wp.get_device(device)
+        self.growth_factor = growth_factor
+        self.min_capacity = min_capacity
+
+        self._buffers = {}      # name -> backing wp.array
+        self._high_water = {}   # name -> largest length ever requested
+        self.num_allocations = 0
+
+    def _grow_capacity(self, capacity: int, length: int) -> int:
+        capacity = max(capacity, self.min_capacity)
+        while capacity < length:
+            capacity = max(int(capacity * self.growth_factor), capacity + 1)
+        return capacity
+
+    def get(self, name: str, length: int, dtype=wp.float32) -> wp.array:
+        """Return a view of ``length`` elements of the scratch buffer called ``name``.
+
+        The content of the view is undefined (like wp.empty) and is only valid until the next
+        call to get() with the same name, so do not hold on to it across pings.
+
+        Args:
+            name (str): Buffer identifier, e.g. "intensity" or "pcl_range"
+            length (int): Number of elements needed this ping
+            dtype (optional): Warp dtype of the buffer. Defaults to wp.float32.
+
+        Returns:
+            wp.array: 1D view of shape (length,) into the backing array
+        """
+        buf = self._buffers.get(name)
+        if buf is None or buf.dtype != dtype or buf.shape[0] < length:
+            old_capacity = buf.shape[0] if (buf is not None and buf.dtype == dtype) else 0
+            capacity = self._grow_capacity(old_capacity, length)
+            buf = wp.empty(shape=(capacity,), dtype=dtype, device=self.device)
+            self._buffers[name] = buf
+            self.num_allocations += 1
+
+        if length > self._high_water.get(name, 0):
+            self._high_water[name] = length
+
+        return buf[:length]
+
+    def capacity(self, name: str) -> int:
+        """Number of elements currently backing buffer ``name`` (0 if never requested)."""
+        buf = self._buffers.get(name)
+        return 0 if buf is None else buf.shape[0]
+
+    def high_water_mark(self, name: str = None) -> int:
+        """Largest length ever requested for ``name``, or across all buffers if name is None."""
+        if name is not None:
+            return self._high_water.get(name, 0)
+        return max(self._high_water.values(), default=0)
+
+    @property
+    def nbytes(self) -> int:
+        """Total device memory held by the pool in bytes."""
+        return sum(buf.capacity for buf in self._buffers.values())
+
+    def report(self) -> dict:
+        """Summarize the pool state, e.g. for logging at the end of a survey.
+
+        Returns:
+            dict: {name: {"capacity", "high_water_mark"}} plus "num_allocations" and "nbytes"
+        """
+        summary = {name: {"capacity": buf.shape[0],
+                          "high_water_mark": self._high_water.get(name, 0)}
+                   for name, buf in self._buffers.items()}
+        summary["num_allocations"] = self.num_allocations
+        summary["nbytes"] = self.nbytes
+        return summary
+
+    def clear(self):
+        """Release every backing array. The next get() reallocates from scratch."""
+        self._buffers.clear()
+        self._high_water.clear()
+        self.num_allocations = 0
+
+
+class BinningEngine:
+    """Accumulation strategy of the binning stage, chosen per ping from the points-per-bin ratio.
+
+    With ~1M points landing in a few thousand range bins (far fewer on a flat seabed), the atomic
+    adds of the point kernel pile up on the same addresses and serialize. Besides the plain
+    "atomic" path there are two contention-free engines, both over the flattened bin arrays:
+
+        "privatized"  the point kernel adds into num_copies interleaved histogram copies
+                      (point tid -> copy tid % num_copies), private_merge sums the copies per bin.
+        "sorted"      the point kernel writes (bin, intensity) pairs, a radix sort groups them by
+                      bin and sorted_segment_reduce issues one atomic per run of equal bins in
+                      every chunk_size pairs.
+
+    With method="auto", select() takes "atomic" below privatize_ratio points per bin, "privatized"
+    up to sort_ratio and "sorted" above it. Contention only exists on CUDA devices; Warp runs CPU
+    kernels serially, so "auto" always picks "atomic" there. The ratios are tuning knobs, see the
+    binning_* chains of benchmarks/benchmark_sonar_kernels.py.
+    Every engine gives the same bins up to the float summation order.
+    """
+
+    METHODS = ("atomic", "privatized", "sorted")
+
+    def __init__(self,
+                 num_bins: int,
+                 device=None,
+                 method: str = "auto",
+                 num_copies: int = 32,
+                 chunk_size: int = 256,
+                 privatize_ratio: float = 32.0,
+                 sort_ratio: float = 4096.0,
+                 buffer_pool: SonarBufferPool = None):
+        """
+        Args:
+            num_bins (int): Number of (flattened) bins
+            device (optional): Warp device. Defaults to the preferred device.
+            method (str, optional): "auto", "atomic", "privatized" or "sorted". Defaults to "auto".
+            num_copies (int, optional): Histogram copies of the privatized engine. Defaults to 32.
+            chunk_size (int, optional): Sorted pairs reduced per thread by the sorted engine. Defaults to 256.
+            privatize_ratio (float, optional): Points per bin from which "auto" privatizes. Defaults to 32.
+            sort_ratio (float, optional): Points per bin from which "auto" sorts. Defaults to 4096.
+            buffer_pool (SonarBufferPool, optional): Pool for the point-length sort buffers. Defaults to a private one.
+        """
+        self.device = wp.get_device(device)
+        self.num_bins = num_bins
+        self.num_copies = num_copies
+        self.chunk_size = chunk_size
+        self.privatize_ratio = privatize_ratio
+        self.sort_ratio = sort_ratio
+        self.buffer_pool = buffer_pool if buffer_pool is not None else SonarBufferPool(device=self.device)
+        self._private_sum = None
+        self._private_count = None
+        self._private_weight = None
+        self.set_method(method)
+
+    def set_method(self, method: str):
+        if method != "auto" and method not in self.METHODS:
+            raise ValueError(f"Unknown binning method: {method}. Use 'auto', 'atomic', 'privatized' or 'sorted'.")
+        self.method = method
+
+    def select(self, num_points: int) -> str:
+        """Engine of a ping with num_points points."""
+        if self.method != "auto":
+            return self.method
+        if not self.device.is_cuda:
+            return "atomic"
+        ratio = num_points / self.num_bins
+        if ratio < self.privatize_ratio:
+            return "atomic"
+        if ratio < self.sort_ratio:
+            return "privatized"
+        return "sorted"
+
+    def private_buffers(self) -> tuple:
+        """Zeroed (num_copies, num_bins) sum and count copies for the privatized point kernel."""
+        if self._private_sum is None:
+            self._private_sum = wp.empty(shape=(self.num_copies, self.num_bins), dtype=wp.float32, device=self.device)
+            self._private_count = wp.empty(shape=(self.num_copies, self.num_bins), dtype=wp.int32, device=self.device)
+        self._private_sum.zero_()
+        self._private_count.zero_()
+        return self._private_sum, self._private_count
+
+    def private_weights(self) -> wp.array:
+        """Zeroed (num_copies, num_bins) splat weight copies, see SideScanProcessor.set_range_splat()."""
+        if self._private_weight is None:
+            self._private_weight = wp.empty(shape=(self.num_copies, self.num_bins), dtype=wp.float32, device=self.device)
+        self._private_weight.zero_()
+        return self._private_weight
+
+    def merge(self, bin_sum: wp.array, bin_count: wp.array, bin_weight: wp.array = None):
+        """Write the sum of the private copies into the flat bin arrays (overwrites them).
+
+        With bin_weight, the splat weight copies of private_weights() are merged into it as well.
+        """
+        wp.launch(kernel=private_merge,
+                  dim=self.num_bins,
+                  inputs=[self._private_sum, self._private_count],
+                  outputs=[bin_sum, bin_count],
+                  device=self.device)
+        if bin_weight is not None:
+            wp.launch(kernel=private_merge_weight,
+                      dim=self.num_bins,
+                      inputs=[self._private_weight],
+                      outputs=[bin_weight],
+                      device=self.device)
+
+    def sort_buffers(self, num_points: int) -> tuple:
+        """Key and value arrays for the keyed point kernel, sized 2 * num_points as the radix sort needs."""
+        keys = self.buffer_pool.get("binning_keys", 2 * num_points, dtype=wp.int32)
+        values = self.buffer_pool.get("binning_values", 2 * num_points, dtype=wp.float32)
+        return keys, values
+
+    def reduce_sorted(self, keys: wp.array, values: wp.array, num_points: int, bin_sum: wp.array, bin_count: wp.array):
+        """Sort the (bin, intensity) pairs and add them into the zeroed flat bin arrays."""
+        if num_points == 0:
+            return
+        # Keys are at most num_bins, so only their low bits need sorting
+        wp.utils.radix_sort_pairs(keys, values, num_points, end_bit=int(self.num_bins).bit_length())
+        wp.launch(kernel=sorted_segment_reduce,
+                  dim=(num_points + self.chunk_size - 1) // self.chunk_size,
+                  inputs=[keys, values, num_points, self.chunk_size],
+                  outputs=[bin_sum, bin_count],
+                  device=self.device)
+
+
+class ReductionEngine:
+    """Two-stage max / sum / mean reductions over the rows of device arrays, without atomics or host syncs.
+
+    Stage 1 (reduce_rows_partial) splits every row into blocks and writes one partial per block,
+    stage 2 (reduce_rows_final) folds the partials of a row. The block size is about the square
+    root of the row length (at least min_block), so both stages stay short and parallel whether a
+    row holds a ping's 2000 range bins or a million. The result stays on the device and is read by
+    the next launch, e.g. the normalization in post-processing, so nothing waits on the host.
+    Shared by the side-scan processor, sensor groups, sweeps, the heightfield renderer and the
+    imaging sonar chain; the partial buffers are cached per array shape.
+
+        engine = ReductionEngine(device)
+        engine.reduce(bin_sum, "max", out=max_intensity)     # 1D: whole array -> out[0]
+        engine.reduce(rows_2d, "mean", out=row_means)        # 2D: one value per row
+    """
+
+    OPS = {"max": REDUCE_MAX, "sum": REDUCE_SUM, "mean": REDUCE_MEAN}
+
+    def __init__(self, device=None, min_block: int = 64):
+        self.device = wp.get_device(device)
+        self.min_block = min_block
+        self._partials = {}     # (rows, row length) -> (block size, partials array)
+
+    def _partials_for(self, rows: int, length: int):
+        key = (rows, length)
+        entry = self._partials.get(key)
+        if entry is None:
+            block_size = max(self.min_block, int(np.ceil(np.sqrt(length))))
+            num_blocks = max(1, (length + block_size - 1) // block_size)
+            entry = self._partials[key] = (block_size,
+                                           wp.empty(shape=(rows, num_blocks), dtype=wp.float32, device=self.device))
+        return entry
+
+    def reduce(self, values: wp.array, op: str = "max", out: wp.array = None) -> wp.array:
+        """Reduce a 1D array to one value, or every row of a 2D array to one value per row.
+
+        Args:
+            values (wp.array): 1D or 2D contiguous float32 array
+            op (str, optional): "max", "sum" or "mean". Defaults to "max".
+            out (wp.array, optional): float32 array of one element per row (overwritten). Allocated if None.
+
+        Returns:
+            wp.array: out
+        """
+        if op not in self.OPS:
+            raise ValueError(f"Unknown reduction: {op}. Use 'max', 'sum' or 'mean'.")
+        if values.ndim == 1:
+            values = values.reshape((1, values.shape[0]))
+        rows, length = values.shape
+        if out is None:
+            out = wp.empty(shape=(rows,), dtype=wp.float32, device=self.device)
+        block_size, partials = self._partials_for(rows, length)
+        wp.launch(kernel=reduce_rows_partial,
+                  dim=partials.shape,
+                  inputs=[values, self.OPS[op], block_size],
+                  outputs=[partials],
+                  device=self.device)
+        wp.launch(kernel=reduce_rows_final,
+                  dim=rows,
+                  inputs=[partials, self.OPS[op], length],
+                  outputs=[out],
+                  device=self.device)
+        return out
+
+
+class AnnotatorIngest:
+    """Zero-copy ingestion of the point cloud annotator's buffers (opt-in, if_array_copy=False).
+
+    With do_array_copy=False the annotator hands out views of its own device buffers, which the
+    renderer overwrites with the next frame. Holding Python references to them does not hold the
+    renderer back, so the views may only be handed back once the launches reading them are done:
+    acquire() takes the views of a frame, release() is called right after the last launch that reads
+    them (the point stage) and synchronizes the host with the device before dropping them.
+
+    Nothing is pinned or double-buffered: the buffers are only safe to read in place as long as the
+    renderer does not write the next frame before release() returns, i.e. while Replicator renders
+    one frame at a time and only after the simulation step. With several frames in flight keep
+    if_array_copy=True.
+
+    This costs one host synchronization per ping, in exchange for the point cloud and normals copy.
+    Post-processing is launched after release() and is not waited for.
+
+        ingest.acquire(pcl=pcl, normals=normals, semantics=semantics)
+        processor.bin_points(...)
+        ingest.release()
+    """
+
+    def __init__(self, device=None):
+        self.device = wp.get_device(device)
+        self.num_frames = 0
+        self.num_waits = 0
+        self._arrays = None
+
+    def acquire(self, **arrays) -> dict:
+        """Take this frame's annotator arrays. Returns them unchanged (no copy)."""
+        if self._arrays is not None:
+            # The previous ping bailed out before release()
+            self.release()
+        self._arrays = arrays
+        self.num_frames += 1
+        return arrays
+
+    def release(self):
+        """Wait for the launches that read the current frame's arrays, then drop them."""
+        if self._arrays is None:
+            return
+        if self.device.is_cuda:
+            # CPU launches are synchronous, the reads are already done
+            self.num_waits += 1
+            wp.synchronize_stream(wp.get_stream(self.device))
+        self._arrays = None
+
+    def clear(self):
+        """Release the frame in flight, if any."""
+        self.release()
+
+
+class PingScheduler:
+    """Decides on which simulation steps the sonar pings, independently of the physics rate.
+
+    A real side-scan sonar cannot ping again before the echo from max_range is back, so the
+    default ping interval is the two-way travel time 2 * max_range / sound_speed. A fixed ping
+    rate can be given instead. request() is called with the simulation time of the step and
+    returns True at most once per step, so several callers asking for a ping in the same step
+    share one. A step coarser than the ping interval fires a single ping and keeps the ping phase.
+
+    render_next tells whether the step after the last request is expected to ping, using the last
+    step duration, so rendering can be switched off on the steps in between.
+
+        if scheduler.request(sim_time):
+            ... ping ...
+    """
+
+    def __init__(self, max_range: float, ping_rate: float = None, sound_speed: float = 1500.0):
+        """
+        Args:
+            max_range (float): Sonar max range in meters
+            ping_rate (float, optional): Pings per second. Defaults to the two-way travel time rate.
+            sound_speed (float, optional): Speed of sound in water, m/s. Defaults to 1500.0.
+        """
+        if ping_rate is not None and ping_rate <= 0:
+            raise ValueError(f"ping_rate must be positive, got {ping_rate}")
+        self.ping_interval = 1.0 / ping_rate if ping_rate is not None else 2.0 * max_range / sound_speed
+        self.reset()
+
+    @property
+    def ping_rate(self) -> float:
+        return 1.0 / self.ping_interval
+
+    def reset(self):
+        self.next_ping_time = None
+        self.render_next = True
+        self.num_pings = 0
+        self.num_requests = 0
+        self._last_time = None
+        self._last_step = None
+
+    def request(self, sim_time: float) -> bool:
+        """Whether the step at sim_time pings. Repeated requests for the same sim_time return False."""
+        self.num_requests += 1
+        if self._last_time is not None:
+            if sim_time == self._last_time:
+                return False
+            if sim_time < self._last_time:
+                # Timeline rewound (stop/reset)
+                self.reset()
+                self.num_requests = 1
+            else:
+                self._last_step = sim_time - self._last_time
+        self._last_time = sim_time
+
+        # Tolerance for the accumulated float error of step times
+        eps = 1e-9 * max(1.0, abs(sim_time))
+        ping = self.next_ping_time is None or sim_time + eps >= self.next_ping_time
+        if ping:
+            if self.next_ping_time is None:
+                self.next_ping_time = sim_time
+            missed = int((sim_time + eps - self.next_ping_time) // self.ping_interval)
+            self.next_ping_time += (missed + 1) * self.ping_interval
+            self.num_pings += 1
+
+        self.render_next = self._last_step is None or sim_time + self._last_step + eps >= self.next_ping_time
+        return ping
+
+
+class PoseDeltaCache:
+    """Decides whether a ping can reuse the binned response (bin_sum/bin_count) of an earlier ping.
+
+    The binned response is kept when the sensor pose from viewTransform is within
+    translation_tol meters and rotation_tol degrees of the pose it was computed at (not of the
+    last ping, so a slow drift cannot accumulate), and the reflectivity table and point-stage
+    parameters are unchanged (pass SideScanProcessor.config_key() with them, and invalidate() when
+    the ray fan changes). Moving objects are not detected; max_reuse bounds how many pings in a
+    row can reuse one response.
+
+        if cache.hit(viewTransform, indexToRefl, (attenuation,)):
+            ... post_process only ...
+        else:
+            ... bin_points, post_process ...
+            cache.store(viewTransform, indexToRefl, (attenuation,))
+    """
+
+    def __init__(self, translation_tol: float = 0.005, rotation_tol: float = 0.1, max_reuse: int = None):
+        """
+        Args:
+            translation_tol (float, optional): Sensor position tolerance in meters. Defaults to 0.005.
+            rotation_tol (float, optional): Sensor orientation tolerance in degrees. Defaults to 0.1.
+            max_reuse (int, optional): Recompute after this many reuses in a row. Defaults to no limit.
+        """
+        self.translation_tol = translation_tol
+        self.rotation_tol = rotation_tol
+        self.max_reuse = max_reuse
+        self.num_hits = 0
+        self.num_misses = 0
+        self.invalidate()
+
+    @staticmethod
+    def _pose(viewTransform):
+        view = np.asarray(viewTransform, dtype=np.float64).reshape(4, 4)
+        rotation = view[:3, :3]
+        # Sensor origin in world coordinates, as in side_sensor_location
+        return rotation, -rotation.T @ view[:3, 3]
+
+    def invalidate(self):
+        self._rotation = None
+        self._position = None
+        self._table = None
+        self._params = None
+        self._reuses = 0
+
+    def hit(self, viewTransform, table, params: tuple = ()) -> bool:
+        """Whether the stored response can be reused for this ping (counted as a hit or miss)."""
+        hit = self._rotation is not None and table is self._table and params == self._params
+        if hit and self.max_reuse is not None:
+            hit = self._reuses < self.max_reuse
+        if hit:
+            rotation, position = self._pose(viewTransform)
+            cos_angle = np.clip((np.trace(rotation @ self._rotation.T) - 1.0) / 2.0, -1.0, 1.0)
+            hit = (np.linalg.norm(position - self._position) <= self.translation_tol
+                   and np.degrees(np.arccos(cos_angle)) <= self.rotation_tol)
+        if hit:
+            self._reuses += 1
+            self.num_hits += 1
+        else:
+            self.num_misses += 1
+        return hit
+
+    def store(self, viewTransform, table, params: tuple = ()):
+        """Record the inputs of the binned response that was just computed."""
+        self._rotation, self._position = self._pose(viewTransform)
+        self._table = table
+        self._params = params
+        self._reuses = 0
+
+
+def make_indexToProp_array(idToLabels: dict, query_property: str) -> np.ndarray:
+    """ A utility function helps to convert idToLabels into indexToProp array
+    This manipulation facilitates warp computation framework
+    indexToProp is an 1-dim array where the values associated with the query property
+    are placed at the index corresponding to the key
+    First two entry are always zero because {'0': {'class': 'BACKGROUND'}, '1': {'class': 'UNLABELLED'}}
+    eg: indexToProp = [0, 0, 0.1, 1 .....]
+    """
+    # Keys are strings, compare them as ints ('10' sorts before '9')
+    max_id = max((int(id) for id in idToLabels.keys()), default=-1)
+    indexToProp_array = np.ones((max_id+1,))
+    for id in idToLabels.keys():
+        for property in idToLabels.get(id):
+            if property == query_property:
+                indexToProp_array[int(id)] = idToLabels.get(id).get(property)
+    return indexToProp_array
+
+
+class LabelTableCache:
+    """Device-side property tables (e.g. indexToRefl) cached by the content of idToLabels.
+
+    The label table only changes when the stage changes, so rebuilding indexToProp with python
+    loops and uploading it every ping is wasted work. Tables are keyed by a fingerprint of
+    idToLabels and the queried property, and only rebuilt when either changes.
+    """
+
+    def __init__(self, device=None, max_entries: int = 8):
+        self.device = wp.get_device(device)
+        self.max_entries = max_entries
+        self._tables = {}          # (fingerprint, query_property) -> wp.array
+        self._last_labels = None   # copy of the last idToLabels, compared by content
+        self._last_fingerprint = None
+        self.num_builds = 0
+
+    @staticmethod
+    def fingerprint(idToLabels: dict) -> str:
+        return json.dumps(idToLabels, sort_keys=True, default=str)
+
+    def get(self, idToLabels: dict, query_property: str = 'reflectivity') -> wp.array:
+        """Get the indexToProp table for ``query_property`` as a float32 wp.array on the cache device."""
+        # Static labels skip fingerprinting: a dict equal to the last one (a plain == against a
+        # private copy, so a caller's dict changed in place is still noticed) reuses its fingerprint.
+        if self._last_labels is None or idToLabels != self._last_labels:
+            self._last_fingerprint = self.fingerprint(idToLabels)
+            self._last_labels = copy.deepcopy(idToLabels)
+        key = (self._last_fingerprint, query_property)
+
+        table = self._tables.get(key)
+        if table is None:
+            if len(self._tables) >= self.max_entries:
+                self._tables.pop(next(iter(self._tables)))
+            indexToProp_np = make_indexToProp_array(idToLabels, query_property)
+            table = wp.array(indexToProp_np, dtype=wp.float32, device=self.device)
+            self._tables[key] = table
+            self.num_builds += 1
+        return table
+
+    def clear(self):
+        self._tables.clear()
+        self._last_labels = None
+        self._last_fingerprint = None
+
+
+def adaptive_fan_geometry(altitude: float,
+                          min_range: float,
+                          max_range: float,
+                          range_res: float,
+                          hori_fov: float,
+                          samples_per_bin: float = 2.0,
+                          margin_deg: float = 1.0,
+                          min_hori_res: int = 1,
+                          max_vert_res: int = 4096,
+                          two_sided: bool = False) -> dict:
+    """Smallest side-scan ray fan that still covers the [min_range, max_range] annulus.
+
+    On a flat seabed a ray at depression angle theta hits at slant range altitude / sin(theta),
+    so only the depression angles between asin(altitude / max_range) and asin(altitude / min_range)
+    can reach a bin. The vertical resolution is chosen so that adjacent rays are at most
+    range_res / samples_per_bin apart in range where the fan is most grazing (the largest
+    d(range)/d(theta)), and the horizontal resolution follows from square pixels.
+
+    Args:
+        altitude (float): Sensor height above the seabed in meters
+        min_range (float): Near edge of the range window in meters
+        max_range (float): Far edge of the range window in meters
+        range_res (float): Range bin size in meters
+        hori_fov (float): Along-track field of view in degrees
+        samples_per_bin (float, optional): Rays per range bin across track. Defaults to 2.0.
+        margin_deg (float, optional): Extra angle added on both sides of the window. Defaults to 1.0.
+        min_hori_res (int, optional): Lower bound for the along-track ray count. Defaults to 1.
+        max_vert_res (int, optional): Upper bound for the across-track ray count. Defaults to 4096.
+        two_sided (bool, optional): Downward-looking dual-channel fan. The fan then spans from the window on
+                                    one side to its mirror on the other, centred on nadir (depression 90 deg),
+                                    and is capped at 170 deg. Defaults to False.
+
+    Returns:
+        dict: hori_res, vert_res, depression_lo / depression_hi / depression_center (deg) and vert_fov (deg),
+              or None when the range window cannot be reached from this altitude.
+    """
+    if altitude <= 0.0 or altitude >= max_range:
+        return None
+    theta_lo = np.arcsin(altitude / max_range)
+    theta_hi = np.arcsin(min(1.0, altitude / min_range))
+
+    # Largest range change per radian inside the window, at the most grazing ray
+    dr_dtheta = altitude * np.cos(theta_lo) / np.sin(theta_lo) ** 2
+    dtheta = range_res / (samples_per_bin * dr_dtheta)
+
+    margin = np.deg2rad(margin_deg)
+    lo = max(theta_lo - margin, np.deg2rad(0.1))
+    hi = min(theta_hi + margin, np.pi / 2)
+    if two_sided:
+        # Depressions past 90 deg are on the other side; a pinhole cannot render a 180 deg fan
+        lo = max(lo, np.deg2rad(5.0))
+        hi = np.pi - lo
+    fov = hi - lo
+
+    vert_res = int(np.clip(np.ceil(fov / dtheta), 16, max_vert_res))
+    # Square pixels: vert_res / hori_res = tan(vert_fov / 2) / tan(hori_fov / 2)
+    hori_res = max(min_hori_res, int(round(vert_res * np.tan(np.deg2rad(hori_fov) / 2) / np.tan(fov / 2))))
+
+    return {
+        "hori_res": hori_res,
+        "vert_res": vert_res,
+        "depression_lo": float(np.rad2deg(lo)),
+        "depression_hi": float(np.rad2deg(hi)),
+        "depression_center": float(np.rad2deg(0.5 * (lo + hi))),
+        "vert_fov": float(np.rad2deg(fov)),
+    }
+
+
+def range_normalization_floor(pings: int, range_window: int, range_floor: float) -> float:
+    """Lower bound of the per-range normalization values, as a fraction of the ping maximum.
+
+    1 on the first ping of the history (the ping is normalized like "all"), falling linearly towards 0
+    while the window fills and range_floor once range_window pings are in the history.
+    """
+    if pings >= range_window:
+        return range_floor
+    return max(range_floor, 1.0 - (pings - 1) / range_window)
+
+
+class SonarWaterfall:
+    """Waterfall display stored as a GPU ring buffer plus a head index.
+
+    Adding a ping writes a single row (O(width)) instead of shifting the whole image down.
+    The unrolled image, with the newest ping in row 0, is only assembled when somebody reads it
+    (viewport upload, export) and is cached until the next push.
+    """
+
+    def __init__(self,
+                 height: int,
+                 width: int,
+                 device=None):
+        self.device = wp.get_device(device)
+        self.height = height
+        self.width = width
+        self.ring = wp.zeros(shape=(height, width, 4), dtype=wp.uint8, device=self.device)
+        self._unrolled = wp.zeros_like(self.ring)
+        self.head = 0            # ring row holding the newest ping
+        self.num_rows = 0        # total pings pushed so far
+        self._dirty = False
+
+    def push_row(self, sonar_image: wp.array):
+        """Add one (width, 4) RGBA row as the newest line of the waterfall."""
+        self.head = (self.head - 1) % self.height
+        wp.launch(kernel=write_waterfall_row,
+                  dim=(self.width, 4),
+                  inputs=[sonar_image, self.ring, self.head],
+                  device=self.device)
+        self.num_rows += 1
+        self._dirty = True
+
+    def unrolled(self) -> wp.array:
+        """Get the (height, width, 4) waterfall with the newest ping in row 0.
+
+        The returned array is reused and is overwritten by the next unrolled() call after a push.
+        """
+        if self._dirty:
+            wp.launch(kernel=unroll_waterfall,
+                      dim=(self.height, self.width, 4),
+                      inputs=[self.ring, self.head],
+                      outputs=[self._unrolled],
+                      device=self.device)
+            self._dirty = False
+        return self._unrolled
+
+    def numpy(self) -> np.ndarray:
+        """Host copy of the unrolled waterfall."""
+        return self.unrolled().numpy()
+
+    def clear(self):
+        self.ring.zero_()
+        self._unrolled.zero_()
+        self.head = 0
+        self.num_rows = 0
+        self._dirty = False
+
+
+class SideScanProcessor:
+    """Isaac-independent part of the side-scan ping pipeline.
+
+    Owns the range bin grid, the bin accumulators, the per-ping outputs and the scratch buffer pool.
+    bin_points() turns the raw data that SideScanSonarSensor.scan() stores in scan_data
+    (pcl, normals, semantics, viewTransform) into binned intensities, and post_process() turns those
+    into side_sonar_data, out_array and the RGBA side_sonar_image row. Since it only needs warp and
+    numpy it also runs on the Warp CPU device, which is what makes the fused kernels comparable
+    against the reference kernels.
+
+    With num_channels=2 (port and starboard seen by one downward-looking fan) bin_sum, bin_count,
+    side_sonar_data and out_array get a leading channel dimension, both channels are processed by the
+    same launches, and side_sonar_image is one side-by-side row of 2 * num_range_bins pixels.
+    Dual-channel processing only exists as fused kernels.
+    """
+
+    def __init__(self,
+                 min_range: float,
+                 max_range: float,
+                 range_res: float,
+                 device=None,
+                 num_channels: int = 1):
+        if num_channels not in (1, 2):
+            raise ValueError(f"num_channels must be 1 or 2, got {num_channels}")
+        self.device = wp.get_device(device)
+        self.min_range = min_range
+        self.max_range = max_range
+        self.range_res = range_res
+        self.num_channels = num_channels
+
+        r_vals = np.arange(min_range, max_range, range_res)
+        self.num_range_bins = len(r_vals)
+        self.r = wp.array(r_vals, dtype=wp.float32, device=self.device)
+
+        bins_shape = (self.num_range_bins,) if num_channels == 1 else (num_channels, self.num_range_bins)
+        self.bin_sum = wp.empty(shape=bins_shape, dtype=wp.float32, device=self.device)
+        self.bin_count = wp.empty(shape=bins_shape, dtype=wp.int32, device=self.device)
+        # Fractional return count per (flattened) bin, only filled by range splatting; the empty
+        # array tells the post-processing kernels to divide by bin_count instead
+        self.bin_weight = wp.zeros(shape=(num_channels * self.num_range_bins,), dtype=wp.float32, device=self.device)
+        self._no_weight = wp.empty(shape=(0,), dtype=wp.float32, device=self.device)
+        self.side_sonar_data = wp.empty(shape=bins_shape, dtype=wp.vec3, device=self.device)
+        self.side_sonar_image = wp.empty(shape=(num_channels * self.num_range_bins, 4), dtype=wp.uint8, device=self.device)
+        self.out_array = wp.empty(shape=bins_shape, dtype=wp.float32, device=self.device)
+        # Only written by the reference (unfused) post-processing chain
+        self.gau_noise = wp.empty(shape=(self.num_range_bins), dtype=wp.float32, device=self.device)
+        self.range_dependent_ray_noise = wp.empty(shape=(self.num_range_bins), dtype=wp.float32, device=self.device)
+
+        self.sonar_grid = sonarGrid()
+        self.sonar_grid.x_offset = min_range
+        self.sonar_grid.x_res = range_res
+        self.sonar_grid.x_num = self.num_range_bins
+
+        self.buffer_pool = SonarBufferPool(device=self.device)
+        # Accumulation strategy of the fused point stage, see BinningEngine
+        self.binning = BinningEngine(num_channels * self.num_range_bins, device=self.device, buffer_pool=self.buffer_pool)
+        # Normalization values of post_process, see ReductionEngine
+        self.reduction = ReductionEngine(device=self.device)
+        self._sensor_loc = wp.empty(shape=(1,), dtype=wp.vec3, device=self.device)
+        self._altitude_acc = wp.zeros(shape=(2,), dtype=wp.float32, device=self.device)
+        # Pinned host copy of _altitude_acc, filled asynchronously and read once its event completed
+        self._altitude_host = wp.zeros(shape=(2,), dtype=wp.float32, device="cpu", pinned=self.device.is_cuda)
+        self._altitude_host_np = self._altitude_host.numpy()
+        self._altitude_event = None
+        self._altitude = None
+        # Disabled unless the owner swaps in an enabled one
+        self.profiler = PingProfiler(device=self.device)
+        # Allocated by the first bin_semantics() call
+        self.semantic_row = None
+        self._semantic_key = None
+        # Set by a SideScanGroupProcessor that rebinds the output arrays to its batched buffers
+        self._group = None
+        self.set_normalizing_method("all")
+        self.set_range_splat("nearest")
+
+    def _check_ungrouped(self, setting: str):
+        if self._group is not None:
+            # Would reallocate or change arrays the group has bound to its batched buffers
+            raise RuntimeError(f"Cannot change {setting} of a processor that belongs to a sensor group")
+
+    def set_normalizing_method(self, normalizing_method: str, range_window: int = 64, range_floor: float = 0.1):
+        """Choose between "range" for normalization per range (r) or "all" for the normalization from the whole map.
+
+        "all" divides every bin by the maximum of the ping (both channels together in dual-channel mode).
+        A ping holds a single return per range bin, so "range" divides every bin by its own maximum over
+        the last range_window pings, the along-track counterpart of the imaging sonar's per-range
+        maximum over azimuth. It evens out the fall-off with range like a time-varying gain.
+
+        Without a lower bound every bin of the first ping is divided by its own value and saturates, and
+        so does every bin hit only recently. A bin is therefore never divided by less than a floor times
+        the maximum of its ping, see range_normalization_floor(): the floor starts at 1 (the first ping is normalized
+        like "all") and falls linearly to range_floor as the window fills, after which a bin is amplified
+        at most 1 / range_floor times relative to "all".
+
+        Args:
+            normalizing_method (str): "all" or "range"
+            range_window (int, optional): Pings of the per-range maximum. Defaults to 64.
+            range_floor (float, optional): Lower bound of the per-range maximum as a fraction of the ping
+                                           maximum once the window is full, in (0, 1]. 1 is the same as "all".
+                                           Defaults to 0.1.
+        """
+        self._check_ungrouped("normalizing_method")
+        num_flat_bins = self.num_channels * self.num_range_bins
+        if normalizing_method == "all":
+            self._max_intensity = wp.zeros(shape=(1,), dtype=wp.float32, device=self.device)
+            self._range_history = None
+        elif normalizing_method == "range":
+            if range_window < 1:
+                raise ValueError(f"range_window must be >= 1, got {range_window}")
+            if not 0.0 < range_floor <= 1.0:
+                raise ValueError(f"range_floor must be in (0, 1], got {range_floor}")
+            self._max_intensity = wp.zeros(shape=(num_flat_bins,), dtype=wp.float32, device=self.device)
+            # Bins x pings, empty slots never win the maximum
+            self._range_history = wp.full(shape=(num_flat_bins, range_window), value=-wp.inf, dtype=wp.float32, device=self.device)
+            self._range_slot = 0
+            self._range_filled = 0
+            self._ping_max = wp.zeros(shape=(1,), dtype=wp.float32, device=self.device)
+        else:
+            raise ValueError(f"Unknown normalizing_method: {normalizing_method}. Use 'all' or 'range'.")
+        # The 1D range map reads one normalization value per bin or the single ping maximum (side_bin_max)
+        self._make_sonar_map = side_make_sonar_map_range
+        self.normalizing_method = normalizing_method
+        self.range_window = range_window
+        self.range_floor = range_floor
+
+    def reset_range_history(self):
+        """Forget the pings of the per-range maximum, e.g. before replaying a recording from its start."""
+        if self._range_history is not None:
+            self._range_history.fill_(-wp.inf)
+            self._range_slot = 0
+            self._range_filled = 0
+
+    def reduce_max_intensity(self):
+        """Launch the normalization values of the ping in bin_sum into _max_intensity, see set_normalizing_method()."""
+        with self.profiler.stage("max_reduction"):
+            if self._range_history is None:
+                self.reduction.reduce(self.bin_sum.flatten(), "max", out=self._max_intensity)
+                return
+            self.reduction.reduce(self.bin_sum.flatten(), "max", out=self._ping_max)
+            wp.launch(kernel=side_push_range_history,
+                      dim=self.bin_sum.size,
+                      inputs=[self.bin_sum.flatten(), self._range_slot],
+                      outputs=[self._range_history],
+                      device=self.device)
+            self._range_slot = (self._range_slot + 1) % self._range_history.shape[1]
+            self._range_filled = min(self._range_filled + 1, self.range_window)
+            self.reduction.reduce(self._range_history, "max", out=self._max_intensity)
+            wp.launch(kernel=side_floor_range_max,
+                      dim=self._max_intensity.shape[0],
+                      inputs=[self._ping_max, range_normalization_floor(self._range_filled, self.range_window, self.range_floor), self._max_intensity.shape[0]],
+                      outputs=[self._max_intensity],
+                      device=self.device)
+
+    def set_range_splat(self, splat: str, pulse_width: float = None):
+        """Choose how a return is distributed over the range bins.
+
+        "nearest" adds it to the bin it falls in. "linear" and "gaussian" spread it over the
+        neighbouring bins with a tent or Gaussian pulse kernel (weights summing to 1), so a grid
+        4-5x coarser than the ray spacing still gives a smooth, alias-free profile. Splatting needs
+        the fused kernels and uses the atomic or privatized binning engine (a sorted pass keys every
+        return to a single bin, so it is replaced by the privatized one). The splat weights are summed
+        into bin_weight, which the per-bin mean (out_array) divides by; bin_count then counts every
+        return that reached a bin, i.e. only tells which bins have data.
+
+        Args:
+            splat (str): "nearest", "linear" or "gaussian"
+            pulse_width (float, optional): Half-width of the tent or sigma of the Gaussian in meters. Defaults to range_res.
+        """
+        self._check_ungrouped("range_splat")
+        kinds = {"nearest": SPLAT_NEAREST, "linear": SPLAT_LINEAR, "gaussian": SPLAT_GAUSSIAN}
+        if splat not in kinds:
+            raise ValueError(f"Unknown range splat: {splat}. Use 'nearest', 'linear' or 'gaussian'.")
+        pulse_width = self.range_res if pulse_width is None else pulse_width
+        if pulse_width <= 0.0:
+            raise ValueError(f"pulse_width must be > 0, got {pulse_width}")
+        self.range_splat = splat
+        self.pulse_width = pulse_width
+        self._splat_kind = kinds[splat]
+        # In bins, which is what side_splat works in
+        self._splat_width = pulse_width / self.range_res
+
+    def config_key(self) -> tuple:
+        """Settings that shape the binned response, for caches of it (see PoseDeltaCache)."""
+        return (self.binning.method, self.range_splat, self._splat_width, self.normalizing_method)
+
+    def bin_points(self,
+                   pcl: wp.array,
+                   normals: wp.array,
+                   semantics: wp.array,
+                   viewTransform,
+                   indexToRefl: wp.array,
+                   attenuation: float = 1.0,
+                   fused: bool = True):
+        """Compute per-point intensity and slant range and accumulate them into bin_sum/bin_count.
+
+        Args:
+            pcl (wp.array): (N, 3) world-frame points
+            normals (wp.array): (N, 3) or (N, 4) world-frame normals
+            semantics (wp.array): (N,) semantic id per point
+            viewTransform: 4x4 world-to-sensor matrix (np.ndarray or wp.mat44)
+            indexToRefl (wp.array): reflectivity per semantic id
+            attenuation (float): Distance attenuation coefficient
+            fused (bool, optional): Use the single-launch side_fused_point_process kernel, or its privatized or
+                                    sorted variant when self.binning selects one for this point count.
+                                    False runs the reference chain compute_intensity -> side_world2local -> side_bin_process.
+                                    Defaults to True.
+        """
+        num_points = pcl.shape[0]
+        viewTransform = wp.mat44(viewTransform)
+
+        # Zero out intensity in each bin (do not omit this, this is necessary)
+        self.bin_sum.zero_()
+        self.bin_count.zero_()
+
+        wp.launch(kernel=side_sensor_location,
+                  dim=1,
+                  inputs=[viewTransform],
+                  outputs=[self._sensor_loc],
+                  device=self.device)
+
+        if self.num_channels == 2 and not fused:
+            raise ValueError("Dual-channel processing only supports the fused kernels")
+
+        method = self.binning.select(num_points) if fused else "atomic"
+        point_inputs = [pcl, normals, viewTransform, semantics, indexToRefl, attenuation, self._sensor_loc, self.sonar_grid]
+
+        if self._splat_kind != SPLAT_NEAREST:
+            if not fused:
+                raise ValueError("Range splatting only supports the fused kernels")
+            if method == "privatized" or method == "sorted":
+                method = "privatized"
+                private_sum, private_count = self.binning.private_buffers()
+                private_weight = self.binning.private_weights()
+            else:
+                # A single "copy": the bin arrays themselves
+                self.bin_weight.zero_()
+                private_sum = self.bin_sum.flatten().reshape((1, self.bin_sum.size))
+                private_count = self.bin_count.flatten().reshape((1, self.bin_count.size))
+                private_weight = self.bin_weight.reshape((1, self.bin_weight.size))
+            self.profiler.count(f"binning_{method}")
+            with self.profiler.stage("intensity_binning"):
+                wp.launch(kernel=side_splat_point_process,
+                          dim=num_points,
+                          inputs=point_inputs + [self.num_channels, self._splat_kind, self._splat_width],
+                          outputs=[private_sum, private_weight, private_count],
+                          device=self.device)
+            if method == "privatized":
+                with self.profiler.stage("binning_merge"):
+                    self.binning.merge(self.bin_sum.flatten(), self.bin_count.flatten(), self.bin_weight)
+            return
+
+        self.profiler.count(f"binning_{method}")
+
+        if method == "privatized":
+            private_sum, private_count = self.binning.private_buffers()
+            with self.profiler.stage("intensity_binning"):
+                wp.launch(kernel=side_private_point_process,
+                          dim=num_points,
+                          inputs=point_inputs + [self.num_channels],
+                          outputs=[private_sum, private_count],
+                          device=self.device)
+            with self.profiler.stage("binning_merge"):
+                self.binning.merge(self.bin_sum.flatten(), self.bin_count.flatten())
+            return
+
+        if method == "sorted":
+            keys, values = self.binning.sort_buffers(num_points)
+            with self.profiler.stage("intensity_binning"):
+                wp.launch(kernel=side_keyed_point_process,
+                          dim=num_points,
+                          inputs=point_inputs + [self.num_channels],
+                          outputs=[keys, values],
+                          device=self.device)
+            with self.profiler.stage("binning_merge"):
+                self.binning.reduce_sorted(keys, values, num_points, self.bin_sum.flatten(), self.bin_count.flatten())
+            return
+
+        if self.num_channels == 2:
+            with self.profiler.stage("intensity_binning"):
+                wp.launch(kernel=side_dual_fused_point_process,
+                          dim=num_points,
+                          inputs=[
+                              pcl,
+                              normals,
+                              viewTransform,
+                              semantics,
+                              indexToRefl,
+                              attenuation,
+                              self._sensor_loc,
+                              self.sonar_grid,
+                          ],
+                          outputs=[
+                              self.bin_sum,
+                              self.bin_count,
+                          ],
+                          device=self.device)
+            return
+
+        if fused:
+            with self.profiler.stage("intensity_binning"):
+                wp.launch(kernel=side_fused_point_process,
+                          dim=num_points,
+                          inputs=[
+                              pcl,
+                              normals,
+                              viewTransform,
+                              semantics,
+                              indexToRefl,
+                              attenuation,
+                              self._sensor_loc,
+                              self.sonar_grid,
+                          ],
+                          outputs=[
+                              self.bin_sum,
+                              self.bin_count,
+                          ],
+                          device=self.device)
+            return
+
+        intensity = self.buffer_pool.get("intensity", num_points, dtype=wp.float32)
+        pcl_range = self.buffer_pool.get("pcl_range", num_points, dtype=wp.float32)
+
+        with self.profiler.stage("intensity"):
+            wp.launch(kernel=compute_intensity,
+                      dim=num_points,
+                      inputs=[
+                          pcl,
+                          normals,
+                          viewTransform,
+                          semantics,
+                          indexToRefl,
+                          attenuation,
+                      ],
+                      outputs=[intensity],
+                      device=self.device)
+
+        with self.profiler.stage("range"):
+            wp.launch(kernel=side_world2local,
+                      dim=num_points,
+                      inputs=[
+                          viewTransform,
+                          pcl
+                      ],
+                      outputs=[pcl_range],
+                      device=self.device)
+
+        with self.profiler.stage("binning"):
+            wp.launch(kernel=side_bin_process,
+                      dim=num_points,
+                      inputs=[
+                          pcl_range,
+                          intensity,
+                          self.sonar_grid
+                      ],
+                      outputs=[
+                          self.bin_sum,
+                          self.bin_count,
+                      ],
+                      device=self.device)
+
+    def bin_semantics(self,
+                      pcl: wp.array,
+                      normals: wp.array,
+                      semantics: wp.array,
+                      viewTransform,
+                      indexToRefl: wp.array,
+                      attenuation: float = 1.0) -> wp.array:
+        """Semantic row of the ping last passed to bin_points(): the id of the strongest return of every bin.
+
+        Takes the same arguments as bin_points() and must be called after it (it reuses the sensor
+        location and bin_count of that ping).
+
+        Returns:
+            wp.array: uint32 semantic_row, same shape as bin_count, 0 (BACKGROUND) for empty bins
+        """
+        if self.semantic_row is None:
+            self.semantic_row = wp.zeros(shape=self.bin_count.shape, dtype=wp.uint32, device=self.device)
+            self._semantic_key = wp.zeros(shape=(self.bin_count.size,), dtype=wp.uint64, device=self.device)
+
+        self._semantic_key.zero_()
+        wp.launch(kernel=side_semantic_row_accumulate,
+                  dim=pcl.shape[0],
+                  inputs=[
+                      pcl,
+                      normals,
+                      wp.mat44(viewTransform),
+                      semantics,
+                      indexToRefl,
+                      attenuation,
+                      self._sensor_loc,
+                      self.sonar_grid,
+                      self.num_channels,
+                  ],
+                  outputs=[self._semantic_key],
+                  device=self.device)
+        wp.launch(kernel=side_semantic_row_unpack,
+                  dim=self.bin_count.size,
+                  inputs=[self._semantic_key, self.bin_count.flatten()],
+                  outputs=[self.semantic_row.flatten()],
+                  device=self.device)
+        return self.semantic_row
+
+    def estimate_altitude(self, pcl: wp.array, stride: int = 64):
+        """Launch the altitude estimate for the ping last passed to bin_points().
+
+        The result is copied asynchronously to a pinned host buffer behind an event. read_altitude()
+        on a later ping picks it up once the event completed, so the estimate never blocks the host.
+
+        Args:
+            pcl (wp.array): (N, 3) world-frame points of the ping
+            stride (int, optional): Only every stride-th point is used. Defaults to 64.
+        """
+        self._altitude_acc.zero_()
+        wp.launch(kernel=side_altitude_accumulate,
+                  dim=(pcl.shape[0] + stride - 1) // stride,
+                  inputs=[pcl, self._sensor_loc, stride, self.sonar_grid],
+                  outputs=[self._altitude_acc],
+                  device=self.device)
+        wp.copy(self._altitude_host, self._altitude_acc)
+        self._altitude_event = wp.get_stream(self.device).record_event() if self.device.is_cuda else None
+
+    def read_altitude(self) -> float:
+        """Mean vertical drop to the returns of the latest finished estimate_altitude() call.
+
+        Never waits for the device: while the copy of the latest estimate is still in flight the
+        previous altitude is returned. None until an estimate with returns has arrived.
+        """
+        if self._altitude_event is not None and not self._altitude_event.is_complete:
+            return self._altitude
+        altitude_sum, count = self._altitude_host_np
+        if count >= 1.0:
+            self._altitude = float(altitude_sum / count)
+        return self._altitude
+
+    def post_process(self,
+                     seed: int,
+                     gau_noise_param: float = 0.05,
+                     ray_noise_param: float = 0.05,
+                     intensity_offset: float = 0.0,
+                     intensity_gain: float = 1.0,
+                     central_peak: float = 0.0,
+                     central_std: float = 0.001,
+                     fused: bool = True):
+        """Normalize the binned response, inject noise and produce side_sonar_data, out_array and side_sonar_image.
+
+        Args:
+            seed (int): RNG seed for this ping (the sensor uses its frame id)
+            gau_noise_param (float): Gaussian noise multiplier
+            ray_noise_param (float): Rayleigh noise scale factor
+            intensity_offset (float): Post-normalization intensity offset
+            intensity_gain (float): Post-normalization intensity multiplier
+            central_peak (float): Central beam streak intensity (reference chain only, unused by the 1D map)
+            central_std (float): Central beam streak width (reference chain only, unused by the 1D map)
+            fused (bool, optional): Use the single-launch side_fused_post_process kernel after the max reduction.
+                                    False runs the original six-kernel chain. Defaults to True.
+        """
+        if self._splat_kind != SPLAT_NEAREST and not fused:
+            raise ValueError("Range splatting only supports the fused kernels")
+        # Mean per bin over the splat weights when splatting, else over the return count
+        bin_weight = self.bin_weight if self._splat_kind != SPLAT_NEAREST else self._no_weight
+
+        # Normalizing intensity at each bin either by global maximum or rangewise maximum
+        self.reduce_max_intensity()
+
+        if self.num_channels == 2:
+            if not fused:
+                raise ValueError("Dual-channel processing only supports the fused kernels")
+            with self.profiler.stage("normalization_image"):
+                wp.launch(kernel=side_dual_fused_post_process,
+                          dim=(self.num_channels, self.num_range_bins),
+                          inputs=[
+                              seed,
+                              self.r,
+                              self.bin_sum,
+                              self.bin_count,
+                              bin_weight,
+                              self._max_intensity,
+                              self.max_range,
+                              gau_noise_param,
+                              ray_noise_param,
+                              intensity_offset,
+                              intensity_gain,
+                          ],
+                          outputs=[
+                              self.side_sonar_data,
+                              self.out_array,
+                              self.side_sonar_image,
+                          ],
+                          device=self.device)
+            return
+
+        if fused:
+            with self.profiler.stage("normalization_image"):
+                wp.launch(kernel=side_fused_post_process,
+                          dim=self.num_range_bins,
+                          inputs=[
+                              seed,
+                              self.r,
+                              self.bin_sum,
+                              self.bin_count,
+                              bin_weight,
+                              self._max_intensity,
+                              self.max_range,
+                              gau_noise_param,
+                              ray_noise_param,
+                              intensity_offset,
+                              intensity_gain,
+                          ],
+                          outputs=[
+                              self.side_sonar_data,
+                              self.out_array,
+                              self.side_sonar_image,
+                          ],
+                          device=self.device)
+            return
+
+        # Inject Gaussian and Rayleigh noise to mimic real sonar distortions.
+        with self.profiler.stage("normalization"):
+            wp.launch(kernel=side_normal_1d,
+                      dim=self.num_range_bins,
+                      inputs=[seed, 0.0, gau_noise_param],
+                      outputs=[self.gau_noise],
+                      device=self.device)
+
+            wp.launch(kernel=side_range_dependent_rayleigh_1d,
+                      dim=self.num_range_bins,
+                      inputs=[
+                          seed,
+                          self.r,
+                          self.max_range,
+                          ray_noise_param,
+                          central_peak,
+                          central_std,
+                      ],
+                      outputs=[self.range_dependent_ray_noise],
+                      device=self.device)
+
+            # Normalizes bin_sum in place and writes the (r, 0, intensity) map
+            wp.launch(kernel=self._make_sonar_map,
+                      dim=self.num_range_bins,
+                      inputs=[
+                          self.r,
+                          self.bin_sum,
+                          self._max_intensity,
+                          self.gau_noise,
+                          self.range_dependent_ray_noise,
+                          intensity_offset,
+                          intensity_gain,
+                      ],
+                      outputs=[self.side_sonar_data],
+                      device=self.device)
+
+            wp.launch(kernel=normalize_bin,
+                      dim=self.num_range_bins,
+                      inputs=[self.bin_sum, self.bin_count, self.out_array],
+                      device=self.device)
+
+        with self.profiler.stage("image"):
+            wp.launch(kernel=make_side_sonar_image,
+                      dim=self.num_range_bins,
+                      inputs=[self.side_sonar_data],
+                      outputs=[self.side_sonar_image],
+                      device=self.device)
+
+
+class SideScanGroupProcessor:
+    """Runs the fused ping pipeline of several sensors with one launch per stage.
+
+    The processors of the group must share the device and range grid and be single-channel, with
+    nearest-bin range assignment and the "all" normalizing method. side_group_point_process always
+    accumulates with atomics, so a processor's binning method must be "auto" or "atomic".
+    Their output arrays (bin_sum, bin_count, side_sonar_data, out_array, side_sonar_image, and the
+    sensor location and max intensity scratch) are rebound to rows of the group's (num_sensors, ...)
+    arrays, so after process() every processor holds its own ping as if it had run it alone and
+    everything downstream of a processor (waterfall, export, bin_semantics, estimate_altitude)
+    works unchanged. The bindings are fixed, so a grouped processor refuses to be reconfigured
+    (set_normalizing_method(), set_range_splat()).
+
+    The point streams are not copied together. process() uploads a small table with the
+    address, point count and normal columns of every sensor's buffers, and side_group_point_process
+    runs once over the concatenated index space, finding the sensor of a point from the point
+    offsets. Per ping the group costs the same number of launches as one sensor.
+
+        group = SideScanGroupProcessor([sensor_a_processor, sensor_b_processor])
+        group.process([frame_a, None], seeds=[id_a, 0])    # sensor b did not ping
+    """
+
+    def __init__(self, processors: list):
+        if len(processors) == 0:
+            raise ValueError("A sensor group needs at least one processor")
+        first = processors[0]
+        for processor in processors:
+            if processor.num_channels != 1:
+                raise ValueError("Sensor groups only support single-channel processors")
+            if processor.range_splat != "nearest":
+                raise ValueError("Sensor groups only support nearest-bin range assignment")
+            if processor.normalizing_method != "all":
+                raise ValueError("Sensor groups only support the 'all' normalizing method")
+            if processor.binning.method not in ("auto", "atomic"):
+                raise ValueError(f"Sensor groups always bin with atomics, got binning method '{processor.binning.method}'")
+            if processor._group is not None:
+                raise ValueError("A processor can only belong to one sensor group")
+            if processor.device != first.device:
+                raise ValueError("All processors of a group must be on the same device")
+            if (processor.min_range, processor.max_range, processor.range_res) != (first.min_range, first.max_range, first.range_res):
+                raise ValueError("All processors of a group must share the same range grid")
+        self.processors = list(processors)
+        self.device = first.device
+        self.num_sensors = len(processors)
+        self.num_range_bins = first.num_range_bins
+        self.max_range = first.max_range
+        self.r = first.r
+        self.sonar_grid = first.sonar_grid
+        self.profiler = PingProfiler(device=self.device)
+        self.reduction = ReductionEngine(device=self.device)
+
+        num_sensors = self.num_sensors
+        shape = (num_sensors, self.num_range_bins)
+        self.bin_sum = wp.zeros(shape=shape, dtype=wp.float32, device=self.device)
+        self.bin_count = wp.zeros(shape=shape, dtype=wp.int32, device=self.device)
+        self.side_sonar_data = wp.zeros(shape=shape, dtype=wp.vec3, device=self.device)
+        self.out_array = wp.zeros(shape=shape, dtype=wp.float32, device=self.device)
+        self.side_sonar_image = wp.zeros(shape=shape + (4,), dtype=wp.uint8, device=self.device)
+        self._max_intensity = wp.zeros(shape=(num_sensors,), dtype=wp.float32, device=self.device)
+        self._sensor_loc = wp.zeros(shape=(num_sensors,), dtype=wp.vec3, device=self.device)
+
+        # Per-ping sensor table: buffer addresses, and (point offsets, normal columns,
+        # reflectivity table sizes, seeds, active) packed in one int32 array
+        self._buffer_ptrs = wp.zeros(shape=(4, num_sensors), dtype=wp.uint64, device=self.device)
+        self._sensor_table = wp.zeros(shape=(5, num_sensors + 1), dtype=wp.int32, device=self.device)
+        self._view_transforms = wp.zeros(shape=(num_sensors,), dtype=wp.mat44, device=self.device)
+        self._keep_alive = []
+
+        for s, processor in enumerate(self.processors):
+            processor.bin_sum = self.bin_sum[s]
+            processor.bin_count = self.bin_count[s]
+            processor.side_sonar_data = self.side_sonar_data[s]
+            processor.out_array = self.out_array[s]
+            processor.side_sonar_image = self.side_sonar_image[s]
+            processor._max_intensity = self._max_intensity[s:s + 1]
+            processor._sensor_loc = self._sensor_loc[s:s + 1]
+            processor._group = self
+
+    @staticmethod
+    def _contiguous(array: wp.array, dtype) -> wp.array:
+        if array.dtype != dtype:
+            raise TypeError(f"Expected a {dtype.__name__} array, got {array.dtype.__name__}")
+        return array if array.is_contiguous else array.contiguous()
+
+    def process(self,
+                frames: list,
+                seeds: list,
+                attenuation: float = 1.0,
+                gau_noise_param: float = 0.05,
+                ray_noise_param: float = 0.05,
+                intensity_offset: float = 0.0,
+                intensity_gain: float = 1.0):
+        """Bin and post-process one ping of every sensor.
+
+        Args:
+            frames (list): Per sensor a dict with pcl, normals, semantics (wp.arrays on the group's
+                           device), viewTransform and indexToRefl, or None if the sensor did not ping
+            seeds (list): Per sensor RNG seed (the sensor's frame id)
+            attenuation, gau_noise_param, ray_noise_param, intensity_offset, intensity_gain:
+                Same as SideScanProcessor.bin_points() / post_process(), shared by the group
+        """
+        if len(frames) != self.num_sensors or len(seeds) != self.num_sensors:
+            raise ValueError(f"Expected {self.num_sensors} frames and seeds")
+
+        ptrs = np.zeros((4, self.num_sensors), dtype=np.uint64)
+        table = np.zeros((5, self.num_sensors + 1), dtype=np.int32)
+        views = np.tile(np.eye(4, dtype=np.float32), (self.num_sensors, 1, 1))
+        keep_alive = []
+        total = 0
+        for s, frame in enumerate(frames):
+            table[0, s] = total
+            table[3, s] = int(seeds[s])
+            if frame is None:
+                continue
+            pcl = self._contiguous(frame['pcl'], wp.float32)
+            normals = self._contiguous(frame['normals'], wp.float32)
+            semantics = self._contiguous(frame['semantics'], wp.uint32)
+            indexToRefl = self._contiguous(frame['indexToRefl'], wp.float32)
+            keep_alive += [pcl, normals, semantics, indexToRefl]
+            num_points = pcl.shape[0]
+            ptrs[:, s] = (pcl.ptr or 0, normals.ptr or 0, semantics.ptr or 0, indexToRefl.ptr)
+            table[1, s] = normals.shape[1] if normals.ndim == 2 else normals.size // max(num_points, 1)
+            table[2, s] = indexToRefl.shape[0]
+            table[4, s] = 1
+            views[s] = np.asarray(frame['viewTransform'], dtype=np.float32).reshape(4, 4)
+            total += num_points
+        table[0, self.num_sensors] = total
+        # The previous ping's launches are queued before this upload on the same stream
+        self._keep_alive = keep_alive
+        self._buffer_ptrs.assign(ptrs)
+        self._sensor_table.assign(table)
+        self._view_transforms.assign(views)
+
+        self.bin_sum.zero_()
+        self.bin_count.zero_()
+
+        wp.launch(kernel=side_group_sensor_location,
+                  dim=self.num_sensors,
+                  inputs=[self._view_transforms],
+                  outputs=[self._sensor_loc],
+                  device=self.device)
+        if total > 0:
+            with self.profiler.stage("intensity_binning"):
+                wp.launch(kernel=side_group_point_process,
+                          dim=total,
+                          inputs=[
+                              self._buffer_ptrs,
+                              self._sensor_table[0],
+                              self._sensor_table[1],
+                              self._sensor_table[2],
+                              self._view_transforms,
+                              attenuation,
+                              self._sensor_loc,
+                              self.sonar_grid,
+                          ],
+                          outputs=[
+                              self.bin_sum,
+                              self.bin_count,
+                          ],
+                          device=self.device)
+        with self.profiler.stage("max_reduction"):
+            self.reduction.reduce(self.bin_sum, "max", out=self._max_intensity)
+        with self.profiler.stage("normalization_image"):
+            wp.launch(kernel=side_group_post_process,
+                      dim=self.bin_sum.shape,
+                      inputs=[
+                          self._sensor_table[3],
+                          self._sensor_table[4],
+                          self.r,
+                          self.bin_sum,
+                          self.bin_count,
+                          self._max_intensity,
+                          self.max_range,
+                          gau_noise_param,
+                          ray_noise_param,
+                          intensity_offset,
+                          intensity_gain,
+                      ],
+                      outputs=[
+                          self.side_sonar_data,
+                          self.out_array,
+                          self.side_sonar_image,
+                      ],
+                      device=self.device)
+
+
+@dataclass
+class PingExport:
+    """Zero-copy views of one published ping.
+
+    Every array is a wp.array living on the sensor's device and supports __dlpack__ (and
+    __cuda_array_interface__ on CUDA), e.g. torch.from_dlpack(ping.bins) or wp.to_torch(ping.bins)
+    give a tensor sharing the memory, without a host round trip.
+
+    Lifetime: image_row, sonar_data, bins and semantic_row live in a slot of the SonarPingExporter
+    that is only rewritten num_slots publishes later (ping k stays valid until ping k + num_slots is
+    published; with the default double buffering that is while ping k + 1 is being processed).
+    Clone what has to be kept longer. waterfall_ring is the live ring buffer of SonarWaterfall:
+    the row of ping k, waterfall_ring[waterfall_head], is only rewritten waterfall_height pings later.
+    """
+    ping_id: int
+    slot: int
+    image_row: wp.array
+    sonar_data: wp.array
+    bins: wp.array
+    semantic_row: wp.array = None
+    waterfall_ring: wp.array = None
+    waterfall_head: int = 0
+    event: wp.Event = None
+
+    def wait(self, stream: wp.Stream = None):
+        """Make the consumer wait for the ping's copies to land.
+
+        Args:
+            stream (wp.Stream, optional): Consumer stream, e.g. wp.stream_from_torch(). The wait is
+                                          enqueued on the device, the host does not block.
+                                          None blocks the host until the ping is ready.
+        """
+        if self.event is None:
+            # CPU device, launches are already complete
+            return
+        if stream is None:
+            wp.synchronize_event(self.event)
+        else:
+            stream.wait_event(self.event)
+
+
+class SonarPingExporter:
+    """Double-buffered, zero-copy export of processed pings.
+
+    publish() copies the processor's small per-ping outputs (image row, sonar data, mean bins and
+    optionally the semantic row) into one of num_slots device slots with asynchronous device copies
+    and records an event, so the next ping can overwrite the processor's buffers while a consumer is
+    still reading the previous ping. See PingExport for the lifetime guarantees.
+    """
+
+    def __init__(self, processor: SideScanProcessor, num_slots: int = 2):
+        if num_slots < 2:
+            raise ValueError(f"num_slots must be at least 2, got {num_slots}")
+        self.processor = processor
+        self.device = processor.device
+        self.num_slots = num_slots
+        self.num_published = 0
+        self._latest = None
+        self._slots = [{
+            "image_row": wp.empty_like(processor.side_sonar_image),
+            "sonar_data": wp.empty_like(processor.side_sonar_data),
+            "bins": wp.empty_like(processor.out_array),
+            "semantic_row": None,
+        } for _ in range(num_slots)]
+
+    def publish(self, ping_id: int, waterfall: SonarWaterfall = None, semantic_row: wp.array = None) -> PingExport:
+        """Publish the ping currently held by the processor. Nothing is synchronized."""
+        slot_idx = self.num_published % self.num_slots
+        slot = self._slots[slot_idx]
+        wp.copy(slot["image_row"], self.processor.side_sonar_image)
+        wp.copy(slot["sonar_data"], self.processor.side_sonar_data)
+        wp.copy(slot["bins"], self.processor.out_array)
+        if semantic_row is not None:
+            if slot["semantic_row"] is None:
+                slot["semantic_row"] = wp.empty_like(semantic_row)
+            wp.copy(slot["semantic_row"], semantic_row)
+
+        event = wp.get_stream(self.device).record_event() if self.device.is_cuda else None
+        self._latest = PingExport(ping_id=ping_id,
+                                  slot=slot_idx,
+                                  image_row=slot["image_row"],
+                                  sonar_data=slot["sonar_data"],
+                                  bins=slot["bins"],
+                                  semantic_row=slot["semantic_row"] if semantic_row is not None else None,
+                                  waterfall_ring=None if waterfall is None else waterfall.ring,
+                                  waterfall_head=0 if waterfall is None else waterfall.head,
+                                  event=event)
+        self.num_published += 1
+        return self._latest
+
+    def latest(self) -> PingExport:
+        """The last published ping, None before the first publish()."""
+        return self._latest
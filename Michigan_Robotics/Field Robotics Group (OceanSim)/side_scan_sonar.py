@@ -1,15 +1,24 @@
 from isaacsim.sensors.camera import Camera
 import omni.replicator.core as rep
 import omni.ui as ui
+import omni.timeline
+from pxr import Usd, UsdGeom
 import numpy as np
 import matplotlib.pyplot as plt
 from omni.replicator.core.scripts.functional import write_np, write_image
 import warp as wp
 from isaacsim.oceansim.utils.ImagingSonar_kernels import *
 from isaacsim.oceansim.sensors.ImagingSonarSensor import ImagingSonarSensor
+from isaacsim.oceansim.utils.side_scan_pipeline import SideScanProcessor, SonarWaterfall, LabelTableCache, make_indexToProp_array, adaptive_fan_geometry, SonarPingExporter, AnnotatorIngest, PingProfiler, PingScheduler, SideScanGroupProcessor, PoseDeltaCache
+from isaacsim.oceansim.utils.survey_store import SurveyStore
+from isaacsim.oceansim.utils.waterfall_tiles import WaterfallTileExporter, export_survey_png
+from isaacsim.oceansim.utils.frame_recorder import FrameRecorder
+from isaacsim.oceansim.utils.mesh_raycast import SonarRayCaster
+from isaacsim.oceansim.utils.surfel_scene import SurfelGatherer
 from scipy.spatial.transform import Rotation as R
 import cv2
 import os
+import tempfile
 from datetime import datetime
 import json
 
@@ -33,8 +42,9 @@ class SideScanSonarSensor(Camera):
                hori_fov: float = 0.2, # 0.5 angled  (was .2)
                vert_fov: float = 90.0, # thin vertical FOV for side scan
                angular_res: float = 0.25, # deg
-               hori_res: int = 300 # (# of raycast) isaac camera render product only accepts square pixel,
+               hori_res: int = 300, # (# of raycast) isaac camera render product only accepts square pixel,
                                    # for now vertical res is automatically set with ratio of hori_fov vs.vert_fov
+               dual_channel: bool = False # port and starboard from one downward-looking fan, see SideScanProcessor
                ):
   
   
@@ -49,35 +59,38 @@ class SideScanSonarSensor(Camera):
        self.vert_fov = vert_fov
        self.angular_res = np.deg2rad(angular_res)
        self.hori_res = hori_res
+       self.dual_channel = dual_channel
 
 
        # Create a 1D grid in range to represent sonar bins
        # This models side-scan sonar behavior where echoes are stored per angle.
-       r_vals = np.arange(self.min_range, self.max_range, self.range_res)
-
-
-       self.num_range_bins = len(r_vals)
+       # The processor owns the range grid, bin accumulators and scratch buffers and runs the
+       # point stage of the pipeline; it does not depend on Isaac Sim.
+       self._processor = SideScanProcessor(min_range=self.min_range,
+                                           max_range=self.max_range,
+                                           range_res=self.range_res,
+                                           device=wp.get_preferred_device(),
+                                           num_channels=2 if dual_channel else 1)
+       self.num_range_bins = self._processor.num_range_bins
 
 
        # Creating meshgrid & Arrays for accumulating sonar return data.
        # Each bin collects total intensity and hit count to build a normalized sonar map.
-       self.r = wp.array(r_vals, dtype=wp.float32)
+       self.r = self._processor.r
 
 
-       self.bin_sum = wp.empty(shape=(self.num_range_bins), dtype=wp.float32)
-       self.bin_count = wp.empty(shape=(self.num_range_bins), dtype=wp.int32)
-       self.side_sonar_data = wp.empty(shape=self.r.shape, dtype=wp.vec3)
-       self.side_sonar_image = wp.empty(shape=(self.num_range_bins, 4), dtype=wp.uint8)
-       self.gau_noise = wp.empty(shape=(self.num_range_bins), dtype=wp.float32)
-       self.range_dependent_ray_noise = wp.empty(shape=(self.num_range_bins), dtype=wp.float32)
+       self.bin_sum = self._processor.bin_sum
+       self.bin_count = self._processor.bin_count
+       self.side_sonar_data = self._processor.side_sonar_data
+       self.side_sonar_image = self._processor.side_sonar_image
+       self.gau_noise = self._processor.gau_noise
+       self.range_dependent_ray_noise = self._processor.range_dependent_ray_noise
+       self.out_array = self._processor.out_array
 
 
        # Define sonar bin grid geometry for Warp-based binning kernels.
-       self.sonar_grid = sonarGrid()
-       self.sonar_grid.x_offset = self.min_range
-       self.sonar_grid.x_res = self.range_res
+       self.sonar_grid = self._processor.sonar_grid
        self.sonar_grid.y_res = self.angular_res
-       self.sonar_grid.x_num = self.num_range_bins # Use calculated num_range_bins
 
 
        # Maintain accurate aspect ratio between horizontal and vertical resolution to match sonar's physical beam shape.
@@ -86,20 +99,28 @@ class SideScanSonarSensor(Camera):
 
 
        # Define dimensions of sonar "waterfall" display
-       self.right_scan_width = self.num_range_bins # full width of the sonar image
+       # In dual-channel mode a row holds port (mirrored) and starboard side by side
+       self.right_scan_width = self._processor.side_sonar_image.shape[0] # full width of the sonar image
        self.channel_count = 4 # width of waterfall display
        self.waterfall_height = 720
 
      # Create a buffer to store the last few sonar scans for visualizing the waterfall effect
-       self.waterfall = wp.empty(shape=(self.waterfall_height, self.num_range_bins, 4), dtype=wp.uint8)
-       self.waterfall_buffer = wp.empty_like(self.waterfall)
+     # Stored as a ring buffer: a ping writes one row, the unrolled image is built only when read
+       self.waterfall_ring = SonarWaterfall(height=self.waterfall_height,
+                                            width=self.right_scan_width,
+                                            device=self._processor.device)
 
        # create saved output directory
        self.output_dir = None
     #    self.save_individuals_scans = False
        self.save_waterfall = False
+       self.export_tiles = False
        self.scan_counter = 0
-       self.complete_waterfall_history = []
+       # Every ping of the survey is appended to an on-disk chunked store instead of a python list,
+       # created on the first ping after set_output_directory()
+       self.survey_store = None
+       self.tile_exporter = None
+       self.frame_recorder = None
 
        # Init base class
        super().__init__(prim_path=prim_path,
@@ -140,33 +161,19 @@ class SideScanSonarSensor(Camera):
 
    # combined = np.hstack([self.left_waterfall_img, self.right_waterfall_img])
    '''
-   The get_right_scan_waterfall_row function extracts data from the "bottom" (last row) of its source.
-   However, the update_waterfall function then uses np.roll to move all existing data down and places this newly extracted "bottom" row at the top of the waterfall_buffer.
-   This is the standard way to create a waterfall display where new data appears at the top and pushes older data down.
+   The waterfall is a ring buffer: the newest row is written at waterfall_ring.head and the
+   older rows stay where they are. Reading self.waterfall unrolls it so that new data appears
+   at the top and older data is pushed down, the standard way to show a waterfall display.
    '''
+   @property
+   def waterfall(self) -> wp.array:
+       """(waterfall_height, right_scan_width, 4) RGBA waterfall with the newest ping in row 0."""
+       return self.waterfall_ring.unrolled()
+
    # Function to update the waterfall display with the latest sonar scan
    def update_waterfall(self):
-      
-       # # extract latest sonar row
-       # right_row = self.get_right_scan_waterfall_row()
-       # # left_row = self.get_left_scan_waterfall_row()
-
-
-       # # new_row = np.concatenate([left_row, right_row], axis=0)
-
-
-       # # remove oldest row and add new one to the top
-       # self.waterfall_buffer = np.roll(self.waterfall_buffer, 1, axis=0)
-       # self.waterfall_buffer[0, :, :] = new_row
-
-
-       # extract latest sonar row
-       new_row = self.get_right_scan_waterfall_row()
-
-
-       # remove oldest row and add new one to the top
-       self.waterfall_buffer = np.roll(self.waterfall_buffer, 1, axis=0)
-       self.waterfall_buffer[0, :, :] = new_row
+       # add the latest sonar row to the top; only that row is written
+       self.waterfall_ring.push_row(self.side_sonar_image)
 
 
 
@@ -174,60 +181,218 @@ class SideScanSonarSensor(Camera):
    def side_sonar_initialize(self,
                         normalizing_method: str = "all",
                         viewport: bool = True,
+                        headless: bool = False,
                         privileged_bbox: bool = False,
                         include_unlabelled = False,
-                        if_array_copy: bool = True):
+                        if_array_copy: bool = True,
+                        fused_kernels: bool = True,
+                        semantic_labels: str = "per_ping",
+                        id_to_labels: dict = None,
+                        adaptive_rays: bool = False,
+                        samples_per_bin: float = 2.0,
+                        altitude_retune_threshold: float = 0.1,
+                        export_pings: bool = False,
+                        export_semantic_row: bool = False,
+                        profile: bool = False,
+                        profile_window: int = 100,
+                        profile_sync: bool = False,
+                        ping_rate: float = None,
+                        sound_speed: float = 1500.0,
+                        skip_idle_renders: bool = True,
+                        pose_cache: bool = False,
+                        pose_cache_translation_tol: float = 0.005,
+                        pose_cache_rotation_tol: float = 0.1,
+                        pose_cache_max_reuse: int = None,
+                        ray_backend: str = "rtx",
+                        ray_scene=None,
+                        binning: str = "auto",
+                        range_splat: str = "nearest",
+                        pulse_width: float = None,
+                        range_window: int = 64,
+                        range_floor: float = 0.1):
        """Initialize sonar data processing pipeline and annotators.
   
        Args:
-           normalizing_method (str, optional): Choose between "range" for normalization per range (r) or "all" for the normalization from the whole map
+           normalizing_method (str, optional): Choose between "range" for normalization per range (r) or "all" for the normalization from the whole map.
+                                               "range" divides every bin by its maximum over the last range_window pings.
+                                               The first ping is normalized like "all" and the per-range normalization
+                                               builds up as the window fills, see range_floor.
            viewport (bool, optional): Enable viewport visualization. Defaults to True.
                                        Set to False for Sonar running without visualization.
+           headless (bool, optional): Run without any display work, e.g. for batch dataset generation on render nodes.
+                                      No omni.ui objects are created, nothing is uploaded to an image provider and
+                                      the ping path never synchronizes the device for display. Processed pings are
+                                      only available through the data API (get_ping(), get_sonar_data(), waterfall).
+                                      Implies viewport=False. Defaults to False.
            include_unlabelled (bool, optional): Include unlabelled objects to be scanned into sonar view. Defaults to False.
            if_array_copy (bool, optional): If True, retrieve a copy of the data array.
                                            This is recommended for workflows using asynchronous backends to manage the data lifetime.
-                                           Can be set to False to gain performance if the data is expected to be used immediately within the writer.
-                                           Defaults to True.
+                                           Set to False to consume the point cloud annotator's buffers in place through an
+                                           AnnotatorIngest, which saves a full point-cloud and normals copy per ping at the
+                                           price of one host synchronization after the point stage. Only safe while
+                                           Replicator renders one frame at a time. CameraParams and bounding boxes are
+                                           always copied. Defaults to True.
+           fused_kernels (bool, optional): Run the fused single-launch kernels. Set to False to run the
+                                           original kernel chain as a reference. Defaults to True.
+           semantic_labels (str, optional): Where idToLabels comes from. Per-point semantics always come from
+                                           the pointcloud annotator's pointSemantic.
+                                           "per_ping": read from the semantic segmentation annotator every ping.
+                                           "once": read it until a non-empty table arrives, then detach the annotator
+                                                   (it renders a full extra image every frame). Call refresh_labels()
+                                                   after the stage changes.
+                                           "static": never attach it and use id_to_labels.
+                                           Defaults to "per_ping".
+           id_to_labels (dict, optional): Label table used with semantic_labels="static".
+           adaptive_rays (bool, optional): Size the ray fan from the altitude seen in the previous ping instead of
+                                           rendering the full vertical FOV. Only the depression angles that can reach
+                                           [min_range, max_range] are rendered, with just enough rays for
+                                           samples_per_bin rays per range bin. Assumes a z-up world. Defaults to False.
+           samples_per_bin (float, optional): Rays per range bin across track in adaptive mode. Defaults to 2.0.
+           altitude_retune_threshold (float, optional): Relative altitude drift that triggers a new render product
+                                                        resolution and aperture in adaptive mode. Defaults to 0.1.
+           export_pings (bool, optional): Publish every ping into double-buffered device slots readable as zero-copy
+                                          DLPack / __cuda_array_interface__ views, see get_ping_export(). Defaults to False.
+           export_semantic_row (bool, optional): Also compute and export the semantic id of the strongest return of
+                                                 every range bin. Defaults to False.
+           profile (bool, optional): Record per-stage timings and counters of every ping, see get_ping_stats(). Defaults to False.
+           profile_window (int, optional): Number of pings the rolling statistics cover. Defaults to 100.
+           profile_sync (bool, optional): Synchronize the device around every stage so the timings are device times
+                                          rather than launch times. Serializes the pipeline. Defaults to False.
+           ping_rate (float, optional): Pings per second of simulation time. make_side_sonar_data() only processes a
+                                        ping on the steps the PingScheduler fires, and at most once per step however
+                                        often it is called. Defaults to the two-way travel time to max_range.
+           sound_speed (float, optional): Speed of sound in m/s for the default ping rate. Defaults to 1500.0.
+           skip_idle_renders (bool, optional): Switch off the hydra texture updates of the sensor's render product (and so
+                                               its annotators) on the steps that will not ping. Defaults to True.
+           pose_cache (bool, optional): Reuse the binned response of an earlier ping while the sensor pose stays within
+                                        the tolerances below, and only apply fresh noise, see PoseDeltaCache. Saves the
+                                        point stage while hovering. Requires fused_kernels. Defaults to False.
+           pose_cache_translation_tol (float, optional): Position tolerance in meters. Defaults to 0.005.
+           pose_cache_rotation_tol (float, optional): Orientation tolerance in degrees. Defaults to 0.1.
+           pose_cache_max_reuse (int, optional): Recompute after this many cached pings in a row, e.g. to pick up
+                                                 moving objects. Defaults to no limit.
+           ray_backend (str, optional): Where the hit points come from.
+                                        "rtx": the render product and its pointcloud, camera params and semantic
+                                               segmentation annotators.
+                                        "mesh": cast the same ray fan against ray_scene in a Warp kernel
+                                                (mesh_raycast.SonarRayCaster). No annotator is attached and the
+                                                render product is paused. Not available with adaptive_rays or
+                                                privileged_bbox.
+                                        "surfel": gather the visible surfels of a baked static scene from its hash
+                                                  grid (surfel_scene.SurfelGatherer); per-ping cost follows the
+                                                  swath footprint. Same restrictions as "mesh".
+                                        Defaults to "rtx".
+           ray_scene (MeshRayScene or SurfelScene, optional): Static scene of the "mesh" (MeshRayScene.from_stage(stage),
+                                               MeshRayScene.from_heightmap(...)) or "surfel" (SurfelScene.bake(...),
+                                               SurfelScene.load(...)) backend, on the sensor's device.
+           binning (str, optional): Accumulation strategy of the fused point stage: "atomic", "privatized", "sorted",
+                                    or "auto" to choose per ping from the points-per-bin ratio, see
+                                    side_scan_pipeline.BinningEngine. Defaults to "auto".
+           range_splat (str, optional): "nearest" adds every return to its range bin. "linear" or "gaussian" spread it
+                                        over the neighbouring bins with that pulse kernel, so a range_res 4-5x coarser
+                                        (fewer bins and vert_res) keeps the fine-range profile. Requires fused_kernels.
+                                        Defaults to "nearest".
+           pulse_width (float, optional): Half-width of the "linear" or sigma of the "gaussian" pulse in meters.
+                                          Defaults to range_res.
+           range_window (int, optional): Pings of the per-range maximum of normalizing_method="range". Defaults to 64.
+           range_floor (float, optional): Lower bound of the per-range maximum as a fraction of the ping maximum once
+                                          range_window pings are in, so a bin is amplified at most 1 / range_floor times
+                                          relative to "all". Before that it falls linearly from 1, see
+                                          SideScanProcessor.set_normalizing_method(). Defaults to 0.1.
                                           
        Note:
            - Attaches pointcloud, camera params, and semantic segmentation annotators
            - Sets up Warp arrays for sonar image processing
            - Can optionally write data to disk if output_dir specified
        """
-       self._viewport = viewport
+       if self.dual_channel and not fused_kernels:
+           raise ValueError("dual_channel requires fused_kernels=True")
+       if pose_cache and not fused_kernels:
+           # The reference chain normalizes bin_sum in place
+           raise ValueError("pose_cache requires fused_kernels=True")
+       if range_splat != "nearest" and not fused_kernels:
+           raise ValueError("range_splat requires fused_kernels=True")
+       self._processor.binning.set_method(binning)
+       self._processor.set_range_splat(range_splat, pulse_width)
+       if ray_backend not in ("rtx", "mesh", "surfel"):
+           raise ValueError(f"Unknown ray_backend: {ray_backend}. Use 'rtx', 'mesh' or 'surfel'.")
+       self._ray_caster = None
+       if ray_backend != "rtx":
+           if ray_scene is None:
+               raise ValueError(f"ray_backend='{ray_backend}' requires ray_scene")
+           if adaptive_rays or privileged_bbox:
+               raise ValueError(f"ray_backend='{ray_backend}' does not support adaptive_rays or privileged_bbox")
+           if ray_scene.device != self._processor.device:
+               raise ValueError(f"ray_scene is on {ray_scene.device}, the sensor processes on {self._processor.device}")
+           # Both hand out scan_data from cast(camera_to_world)
+           caster_cls = SonarRayCaster if ray_backend == "mesh" else SurfelGatherer
+           self._ray_caster = caster_cls(ray_scene,
+                                         hori_fov=self.hori_fov,
+                                         hori_res=self.hori_res,
+                                         vert_res=self.vert_res,
+                                         min_range=self.min_range,
+                                         max_range=self.max_range)
+       self._headless = headless
+       self._viewport = viewport and not headless
        self._privileged_bbox = privileged_bbox
+       self._fused_kernels = fused_kernels
        self._device = str(wp.get_preferred_device())
        self.scan_data = {}
        self.id = 0
 
+       if semantic_labels not in ("per_ping", "once", "static"):
+           raise ValueError(f"Unknown semantic_labels: {semantic_labels}. Use 'per_ping', 'once' or 'static'.")
+       if semantic_labels == "static" and not id_to_labels:
+           raise ValueError("semantic_labels='static' requires id_to_labels")
+       self._semantic_labels = semantic_labels
+       self._id_to_labels = id_to_labels if semantic_labels == "static" else None
+       self._semanticSeg_attached = False
+       # indexToRefl & co. live on the device and are only rebuilt when idToLabels changes
+       self._label_tables = LabelTableCache(device=self._device)
 
-       self.pointcloud_annot = rep.AnnotatorRegistry.get_annotator(
-           name="pointcloud",
-           init_params={"includeUnlabelled": include_unlabelled},
-           do_array_copy=if_array_copy,
-           device=self._device
-           )
+
+       # Shared with the processor so its kernel stages land in the same report
+       self.profiler = PingProfiler(enabled=profile, window=profile_window, sync=profile_sync, device=self._device)
+       self._processor.profiler = self.profiler
+
+       # Zero-copy ingestion of the annotator buffers, see AnnotatorIngest
+       self._ingest = None if if_array_copy or self._ray_caster is not None else AnnotatorIngest(device=self._device)
+
+       if ray_backend == "mesh":
+           print(f'[{self._name}] Mesh ray backend: {self.hori_res} x {self.vert_res} rays, {ray_scene.num_faces} faces. Num Range Bins: {self.num_range_bins}')
+       elif ray_backend == "surfel":
+           print(f'[{self._name}] Surfel backend: {ray_scene.num_surfels} surfels, {ray_scene.spacing} m spacing. Num Range Bins: {self.num_range_bins}')
+       else:
+           self.pointcloud_annot = rep.AnnotatorRegistry.get_annotator(
+               name="pointcloud",
+               init_params={"includeUnlabelled": include_unlabelled},
+               do_array_copy=if_array_copy,
+               device=self._device
+               )
       
-       self.cameraParams_annot = rep.AnnotatorRegistry.get_annotator(
-           name="CameraParams",
-           do_array_copy=if_array_copy,
-           device=self._device
-           )
+           # Small, and viewTransform is kept past the ping (get_ping(), pose cache): always a copy
+           self.cameraParams_annot = rep.AnnotatorRegistry.get_annotator(
+               name="CameraParams",
+               do_array_copy=True,
+               device=self._device
+               )
       
-       self.semanticSeg_annot = rep.AnnotatorRegistry.get_annotator(
-           name="semantic_segmentation",
-           init_params={"colorize": False},
-           do_array_copy=if_array_copy,
-           device=self._device
-       )
+           self.semanticSeg_annot = rep.AnnotatorRegistry.get_annotator(
+               name="semantic_segmentation",
+               init_params={"colorize": False},
+               do_array_copy=if_array_copy,
+               device=self._device
+           )
 
 
-       print(f'[{self._name}] Render query res: {self.hori_res} x {self.vert_res}. Num Range Bins: {self.num_range_bins}')
+           print(f'[{self._name}] Render query res: {self.hori_res} x {self.vert_res}. Num Range Bins: {self.num_range_bins}')
 
 
-       self.pointcloud_annot.attach(self._render_product_path)
-       self.cameraParams_annot.attach(self._render_product_path)
-       self.semanticSeg_annot.attach(self._render_product_path)
+           self.pointcloud_annot.attach(self._render_product_path)
+           self.cameraParams_annot.attach(self._render_product_path)
+           if self._semantic_labels != "static":
+               self.semanticSeg_annot.attach(self._render_product_path)
+               self._semanticSeg_attached = True
 
 
       
@@ -237,21 +402,152 @@ class SideScanSonarSensor(Camera):
        if self._privileged_bbox:
            self.bbox_annot = rep.AnnotatorRegistry.get_annotator(
                name='bounding_box_3d_fast',
-               do_array_copy=if_array_copy,
+               do_array_copy=True,
            )
            self.bbox_annot.attach(self._render_product_path)
 
 
-       if normalizing_method == "all":
-           self._max_intensity = wp.zeros(shape=(1,), dtype=wp.float32)
-           self._left_max_intensity = wp.zeros(shape=(1,), dtype=wp.float32)
-           self._compute_max_intensity = side_compute_max_intensity_all
-           self._make_sonar_map = side_make_sonar_map_all
-       elif normalizing_method == "range":
-           self._max_intensity = wp.zeros(shape=(self.r.shape[0],), dtype=wp.float32)
-           self._left_max_intensity = wp.zeros(shape=(self.r.shape[0],), dtype=wp.float32)
-           self._compute_max_intensity = side_compute_max_intensity_range
-           self._make_sonar_map = side_make_sonar_map_range
+       self._processor.set_normalizing_method(normalizing_method, range_window, range_floor)
+
+       self._adaptive_rays = adaptive_rays
+       self._samples_per_bin = samples_per_bin
+       self._altitude_retune_threshold = altitude_retune_threshold
+       self._tuned_altitude = None
+       self.altitude = None
+       self.active_fan = None
+       # Bumped by every fan retune; _frame_fan is the generation the current frame was rendered with
+       self._fan_generation = 0
+       self._frame_fan = 0
+
+       self._export_semantic_row = export_semantic_row
+       self._ping_exporter = SonarPingExporter(self._processor) if export_pings else None
+
+       self.ping_scheduler = PingScheduler(max_range=self.max_range, ping_rate=ping_rate, sound_speed=sound_speed)
+       self._skip_idle_renders = skip_idle_renders and self._ray_caster is None
+       self._rendering = True
+       if self._ray_caster is not None:
+           # Nothing reads the render product
+           self._set_rendering(False)
+
+       self._pose_cache = PoseDeltaCache(translation_tol=pose_cache_translation_tol,
+                                         rotation_tol=pose_cache_rotation_tol,
+                                         max_reuse=pose_cache_max_reuse) if pose_cache else None
+       print(f'[{self._name}] Ping rate: {self.ping_scheduler.ping_rate:.1f} Hz')
+
+   def _bind_processor_outputs(self):
+       # The processor's output arrays were rebound, e.g. to rows of a SideScanSonarGroup
+       self.bin_sum = self._processor.bin_sum
+       self.bin_count = self._processor.bin_count
+       self.side_sonar_data = self._processor.side_sonar_data
+       self.side_sonar_image = self._processor.side_sonar_image
+       self.out_array = self._processor.out_array
+
+   def _set_rendering(self, enabled: bool):
+       # Camera.pause()/resume() only stop the Camera's own data acquisition callback. The render
+       # product and its annotators keep rendering unless its hydra texture stops updating.
+       if enabled == self._rendering:
+           return
+       hydra_texture = getattr(getattr(self, "_render_product", None), "hydra_texture", None)
+       if hydra_texture is None:
+           if not enabled:
+               # e.g. a render product passed in by path: nothing to switch, keep rendering every step
+               print(f'[{self._name}] WARNING: No hydra texture on the render product, idle renders are not skipped')
+               self._skip_idle_renders = False
+           return
+       self._rendering = enabled
+       hydra_texture.set_updates_enabled(enabled)
+       if enabled:
+           self.resume()
+       else:
+           self.pause()
+
+   def _retune_ray_fan(self, altitude: float):
+       """Resize the render product to the ray fan needed at this altitude.
+
+       The camera prim is not rotated: the fan is re-centred on the useful depression angles with
+       the vertical aperture offset (off-axis projection) and narrowed through the resolution and
+       aperture, keeping square pixels.
+       """
+       fan = adaptive_fan_geometry(altitude=altitude,
+                                   min_range=self.min_range,
+                                   max_range=self.max_range,
+                                   range_res=self.range_res,
+                                   hori_fov=self.hori_fov,
+                                   samples_per_bin=self._samples_per_bin,
+                                   two_sided=self.dual_channel)
+       if fan is None:
+           # Range window out of reach, keep rendering the current fan
+           return
+
+       # Depression of the optical axis and orientation of the image up axis, world z up
+       viewTransform = np.asarray(self.scan_data['viewTransform'], dtype=np.float64)
+       rot_world = viewTransform[:3, :3].T
+       forward = rot_world @ np.array([0.0, 0.0, -1.0])
+       up = rot_world @ np.array([0.0, 1.0, 0.0])
+       axis_depression = np.rad2deg(np.arcsin(np.clip(-forward[2], -1.0, 1.0)))
+       up_sign = 1.0 if up[2] >= 0.0 else -1.0
+
+       self.hori_res = fan["hori_res"]
+       self.vert_res = fan["vert_res"]
+       self.set_resolution([self.hori_res, self.vert_res])
+       horizontal_aper = 2 * self.focal_length * np.tan(np.deg2rad(self.hori_fov) / 2)
+       self.set_horizontal_aperture(horizontal_aper)
+
+       # Offset in the prim's own units, same as its focalLength attribute
+       focal_length_attr = self.prim.GetAttribute("focalLength").Get()
+       offset = up_sign * focal_length_attr * np.tan(np.deg2rad(axis_depression - fan["depression_center"]))
+       self.prim.GetAttribute("verticalApertureOffset").Set(float(offset))
+
+       self._tuned_altitude = altitude
+       self.active_fan = fan
+       self._fan_generation += 1
+       if self._pose_cache is not None:
+           # The rays change, a stored response no longer matches the next frames
+           self._pose_cache.invalidate()
+       print(f'[{self._name}] Altitude {altitude:.2f} m: render query res {self.hori_res} x {self.vert_res}, '
+             f'depression {fan["depression_lo"]:.1f}-{fan["depression_hi"]:.1f} deg')
+
+   def _update_ray_budget(self):
+       """Read the previous ping's altitude estimate and retune the fan if the altitude drifted."""
+       altitude = self._processor.read_altitude()
+       if altitude is None:
+           return
+       self.altitude = altitude
+       if (self._tuned_altitude is None
+               or abs(altitude - self._tuned_altitude) > self._altitude_retune_threshold * self._tuned_altitude):
+           self._retune_ray_fan(altitude)
+
+   def _get_id_to_labels(self) -> dict:
+       """Return the current idToLabels table, or None if it is not available yet."""
+       if self._id_to_labels is not None:
+           return self._id_to_labels
+
+       semantic_data = self.semanticSeg_annot.get_data()
+       if semantic_data is None or 'info' not in semantic_data:
+           return None
+       idToLabels = semantic_data.get('info', {}).get('idToLabels', {})
+       if len(idToLabels) == 0:
+           return None
+
+       if self._semantic_labels == "once":
+           # Keep the table and stop rendering the segmentation image
+           self._id_to_labels = idToLabels
+           self.semanticSeg_annot.detach(self._render_product_path)
+           self._semanticSeg_attached = False
+           print(f"[{self._name}] Label table cached ({len(idToLabels)} ids), semantic segmentation annotator detached")
+       return idToLabels
+
+   def refresh_labels(self):
+       """Re-read idToLabels on the next ping, e.g. after objects were added to the stage.
+
+       With semantic_labels="once" this re-attaches the semantic segmentation annotator until a new table arrives.
+       """
+       if self._semantic_labels == "static" or self._ray_caster is not None:
+           return
+       self._id_to_labels = None
+       if not self._semanticSeg_attached:
+           self.semanticSeg_annot.attach(self._render_product_path)
+           self._semanticSeg_attached = True
       
    def scan(self):
     """Capture a single sonar scan frame and store the raw data.
@@ -259,6 +555,8 @@ class SideScanSonarSensor(Camera):
     Returns:
         bool: True if scan was successful (valid data received), False otherwise
     """
+    if self._ray_caster is not None:
+        return self._scan_mesh()
     
     self.scan_data = {
         "pcl": None,
@@ -270,18 +568,14 @@ class SideScanSonarSensor(Camera):
     
     try:
         # Check if annotators are ready
-        if not hasattr(self, 'semanticSeg_annot'):
+        if not hasattr(self, 'pointcloud_annot'):
             print(f"[{self._name}] Annotators not initialized yet")
             return False
         
-        # Try to get semantic data first (smallest/fastest)
+        # Try to get the label table first (smallest/fastest, cached unless semantic_labels="per_ping")
         try:
-            semantic_data = self.semanticSeg_annot.get_data()
-            if semantic_data is None or 'info' not in semantic_data:
-                return False
-            
-            idToLabels = semantic_data.get('info', {}).get('idToLabels', {})
-            if len(idToLabels) == 0:
+            idToLabels = self._get_id_to_labels()
+            if idToLabels is None:
                 return False
                 
         except Exception as e:
@@ -325,6 +619,9 @@ class SideScanSonarSensor(Camera):
             return False
         
         # If we made it here, all data is valid
+        if self._ingest is not None:
+            # Point cloud buffers are used in place until the point stage of make_side_sonar_data() is done
+            self._ingest.acquire(pcl=pcl, normals=normals, semantics=point_semantics)
         self.scan_data['pcl'] = pcl
         self.scan_data['normals'] = normals
         self.scan_data['semantics'] = point_semantics
@@ -341,6 +638,14 @@ class SideScanSonarSensor(Camera):
         self.id += 1
         return False
 
+   def _scan_mesh(self) -> bool:
+       """scan() for the mesh and surfel backends: cast the fan from the camera prim's current world pose."""
+       # Gf matrices are row-vector convention
+       camera_to_world = np.asarray(UsdGeom.Xformable(self.prim).ComputeLocalToWorldTransform(Usd.TimeCode.Default())).T
+       self.scan_data = self._ray_caster.cast(camera_to_world)
+       self.id += 1
+       return self.scan_data['pcl'].shape[0] > 0
+
 
 #    def scan(self):
 
@@ -398,13 +703,7 @@ class SideScanSonarSensor(Camera):
        First two entry are always zero because {'0': {'class': 'BACKGROUND'}, '1': {'class': 'UNLABELLED'}}
        eg: indexToProp = [0, 0, 0.1, 1 .....]
        """
-       max_id = max(idToLabels.keys(), default=-1)
-       indexToProp_array = np.ones((int(max_id)+1,))
-       for id in idToLabels.keys():
-           for property in idToLabels.get(id):
-               if property == query_property:
-                   indexToProp_array[int(id)] = idToLabels.get(id).get(property)
-       return indexToProp_array
+       return make_indexToProp_array(idToLabels, query_property)
       
 
 
@@ -417,7 +716,8 @@ class SideScanSonarSensor(Camera):
                        intensity_gain: float = 1.0, # scale intensity after normalization
                        central_peak: float = 0.0, # control the strength of the streak
                        central_std: float = 0.001, # control the spread of the streak
-                       ):
+                       sim_time: float = None, # simulation time of the step, defaults to the timeline time
+                       ) -> bool:
        """Process raw scan data into a sonar image with configurable parameters.
 
 
@@ -431,224 +731,187 @@ class SideScanSonarSensor(Camera):
            intensity_gain (float): Post-normalization intensity multiplier
            central_peak (float): Central beam streak intensity
            central_std (float): Central beam streak width
-  
+           sim_time (float, optional): Simulation time of the current step, used by the ping scheduler.
+                                       Defaults to the timeline's current time.
+
+       Returns:
+           bool: True if a ping was processed on this call. Steps the scheduler does not fire
+                 and repeated calls within one step return False without any work.
        """
+       if sim_time is None:
+           sim_time = omni.timeline.get_timeline_interface().get_current_time()
+       ping = self.ping_scheduler.request(sim_time)
+       if self._skip_idle_renders:
+           # The frame rendered after this step is read by the next one
+           self._set_rendering(self.ping_scheduler.render_next)
+       if not ping:
+           self.profiler.count("idle_steps")
+           return False
+
+       indexToRefl = self._acquire_ping(query_prop)
+       if indexToRefl is None:
+           return False
+
+       # Point-stage inputs besides the pose and reflectivity table: the ray fan of the frame and the
+       # processor settings cover runtime reconfiguration
+       cache_params = (query_prop, attenuation, self._frame_fan) + self._processor.config_key()
+       if self._pose_cache is not None and self._pose_cache.hit(self.scan_data['viewTransform'], indexToRefl, cache_params):
+           # Sensor has not moved: bin_sum/bin_count of the cached ping are still in place
+           self.profiler.count("cached_pings")
+           semantic_row = self._release_cached_ping()
+       else:
+           # Compute intensity and slant range for each ray query and collapse them into range bins
+           # Simply sum intensity return and compute number of return that falls into the same bin
+           self._processor.bin_points(pcl=self.scan_data['pcl'],
+                                      normals=self.scan_data['normals'],
+                                      semantics=self.scan_data['semantics'],
+                                      viewTransform=self.scan_data['viewTransform'],
+                                      indexToRefl=indexToRefl,
+                                      attenuation=attenuation,
+                                      fused=self._fused_kernels)
+           semantic_row = self._finish_binning(indexToRefl, attenuation)
+           if self._pose_cache is not None:
+               self._pose_cache.store(self.scan_data['viewTransform'], indexToRefl, cache_params)
+
+       # Normalize, add noise and build the sonar map, mean-per-bin output and image row
+       self._processor.post_process(seed=self.id,   # use frame num for RNG seed increment
+                                    gau_noise_param=gau_noise_param,
+                                    ray_noise_param=ray_noise_param,
+                                    intensity_offset=intensity_offset,
+                                    intensity_gain=intensity_gain,
+                                    central_peak=central_peak,
+                                    central_std=central_std,
+                                    fused=self._fused_kernels)
+
+       self._publish_ping(semantic_row, sim_time)
+       return True
+
+   def _acquire_ping(self, query_prop: str = 'reflectivity'):
+       """Fetch this step's annotator frame into scan_data. Returns the device reflectivity table, or None if no frame."""
+       with self.profiler.stage("fetch"):
+           scanned = self.scan()
+       if not scanned:
+           self.profiler.count("dropped_frames")
+           return None
+       self.profiler.count("pings")
+       self.profiler.record("points", self.scan_data['pcl'].shape[0])
+       if self.frame_recorder is not None:
+           # Must happen before the annotator buffers are released
+           with self.profiler.stage("record"):
+               self.frame_recorder.append(self.scan_data, ping_id=self.id)
+       if self.profiler.enabled and self._ingest is None and self._ray_caster is None:
+           # Annotators copied their outputs for this ping
+           self.profiler.record("bytes_annotator_copy", sum(self.scan_data[key].capacity for key in ('pcl', 'normals', 'semantics')))
+
+       # A retune below only affects the frames rendered after this step
+       self._frame_fan = self._fan_generation
+       if self._adaptive_rays:
+           # Estimate launched during an earlier ping, read without waiting for the device
+           self._update_ray_budget()
+
+
+       # Device-side reflectivity table, only rebuilt and uploaded when idToLabels changes
+       with self.profiler.stage("label_table"):
+           indexToRefl = self._label_tables.get(self.scan_data['idToLabels'], query_prop)
+       return indexToRefl
+
+   def _finish_binning(self, indexToRefl: wp.array, attenuation: float):
+       """Work on the binned ping that still reads the annotator buffers, then release them. Returns the semantic row if exported."""
+       if self._adaptive_rays:
+           self._processor.estimate_altitude(self.scan_data['pcl'])
+       semantic_row = None
+       if self._ping_exporter is not None and self._export_semantic_row:
+           with self.profiler.stage("semantic_row"):
+               semantic_row = self._processor.bin_semantics(pcl=self.scan_data['pcl'],
+                                                            normals=self.scan_data['normals'],
+                                                            semantics=self.scan_data['semantics'],
+                                                            viewTransform=self.scan_data['viewTransform'],
+                                                            indexToRefl=indexToRefl,
+                                                            attenuation=attenuation)
+       if self._ingest is not None:
+           # Nothing after this point reads the annotator buffers
+           with self.profiler.stage("ingest_release"):
+               self._ingest.release()
+       return semantic_row
+
+   def _release_cached_ping(self):
+       """_finish_binning() for a ping that reuses the cached binned response. Returns the cached semantic row if exported."""
+       if self._ingest is not None:
+           with self.profiler.stage("ingest_release"):
+               self._ingest.release()
+       if self._ping_exporter is not None and self._export_semantic_row:
+           return self._processor.semantic_row
+       return None
+
+   def _publish_ping(self, semantic_row: wp.array = None, sim_time: float = None):
+       """Display, export and history of the processed ping."""
+       with self.profiler.stage("waterfall"):
+           self.get_side_sonar_image()
+
+       if self._ping_exporter is not None:
+           with self.profiler.stage("export"):
+               self._ping_exporter.publish(self.id, waterfall=self.waterfall_ring, semantic_row=semantic_row)
+
+       with self.profiler.stage("history"):
+           self.save_waterfall_frame_to_history(sim_time)
+
+   def start_frame_recording(self, path: str = None) -> str:
+       """Record the raw annotator frame of every following ping for offline replay (see frame_recorder.SideScanReplay).
 
+       Args:
+           path (str, optional): Recording directory. Defaults to <output_dir>/frames/frames_<timestamp>.
 
-       if not self.scan():
+       Returns:
+           str: the recording directory
+       """
+       if path is None:
+           if self.output_dir is None:
+               raise ValueError("No path given and no output directory set")
+           path = os.path.join(self.output_dir, "frames", f"frames_{datetime.now().strftime('%Y%m%d_%H%M%S')}")
+       self.stop_frame_recording()
+       self.frame_recorder = FrameRecorder.create(path, sensor_config={
+           "min_range": self.min_range,
+           "max_range": self.max_range,
+           "range_res": self.range_res,
+           "num_channels": self._processor.num_channels,
+           "normalizing_method": self._processor.normalizing_method,
+           "range_window": self._processor.range_window,
+           "range_floor": self._processor.range_floor,
+           "range_splat": self._processor.range_splat,
+           "pulse_width": self._processor.pulse_width,
+           "fused": self._fused_kernels,
+       })
+       print(f"[{self._name}] Recording frames to {path}")
+       return path
+
+   def stop_frame_recording(self):
+       if self.frame_recorder is None:
            return
+       self.frame_recorder.close()
+       print(f"[{self._name}] Recorded {len(self.frame_recorder)} frames to {self.frame_recorder.path}")
+       self.frame_recorder = None
 
+   def get_ping_stats(self) -> dict:
+       """Rolling per-stage timings (time_ms/<stage>), point counts, bytes moved and counters
+       (pings, dropped_frames, idle_steps, cached_pings) of the ping pipeline. Empty unless side_sonar_initialize(profile=True).
 
-       num_points = self.scan_data['pcl'].shape[0]
-       # Load these small numpy arrays to cuda
-       indexToRefl_np = self.make_indexToProp_array(idToLabels=self.scan_data['idToLabels'],
-                                                       query_property=query_prop)
-       indexToRefl = wp.array(data=indexToRefl_np, dtype=wp.float32)
-       viewTransform = wp.mat44(self.scan_data['viewTransform'])
-
-
-
-
-       # Compute intensity for each ray query
-       intensity = wp.empty(shape=(num_points,), dtype=wp.float32)
-
-
-       wp.launch(kernel=compute_intensity,
-               dim=num_points,
-               inputs=[
-                   self.scan_data['pcl'],
-                   self.scan_data['normals'],
-                   viewTransform,
-                   self.scan_data['semantics'],
-                   indexToRefl,
-                   attenuation,
-               ],
-               outputs=[intensity]
-               )
-
-
-       # print("BEFORE intensity first 100:", intensity.numpy()[:100])       
-
-
-              
-       # Transform pointcloud from world cooridates to sonar local and convert to spherical coord
-       pcl_bin_idx = wp.empty(shape=(num_points, ), dtype=wp.vec2ui)
-       pcl_range = wp.empty(shape=(num_points, ), dtype=wp.float32)
-
-
-       # Inject Gaussian and Rayleigh noise to mimic real sonar distortions.
-       # Central streak simulates typical strong beamline artifacts.
-  
-       wp.launch(kernel=side_world2local,
-               dim=num_points,
-               inputs=[
-                   viewTransform,
-                   self.scan_data['pcl']
-               ],
-                   outputs=[
-                   pcl_range
-                   ]
-               )
-      
-       # Collapse three dimensional intensity data to 2D
-       # Simply sum intensity return and compute number of return that falls into the same bin
-       # Zero out intensity in each bin (do not omit this, this is necessary)
-       self.bin_sum.zero_()
-       self.bin_count.zero_()
-
-
-       # self.left_bin_sum.zero_()
-       # self.left_bin_count.zero_()
-
-
-       # self.side_bin_semantics.zero_()
-       # self.left_side_bin_semantics.zero_()
-
-
-       wp.launch(kernel=side_bin_process,
-                 dim=pcl_range.shape[0],
-               # dim=num_points,
-               inputs=[
-                   pcl_range,
-                   intensity,
-                   self.sonar_grid
-               ],
-               outputs=[
-                   self.bin_sum,
-                   self.bin_count,
-                   # pcl_bin_idx,
-               ]
-               )
-      
-       # print("x_offset:", self.sonar_grid.x_offset)
-       # print("x_res:", self.sonar_grid.x_res)
-       # print("x_num:", self.sonar_grid.x_num)
-    #    print("bin_count:", self.bin_count.size())
-       # print("Total bins span:", self.sonar_grid.x_offset + self.sonar_grid.x_res * self.sonar_grid.x_num)
-       # print("pcl_range min:", pcl_range.numpy().min())
-       # print("pcl_range max:", pcl_range.numpy().max())
-       # print("intensity min:", intensity.numpy().min())
-       # print("intensity max:", intensity.numpy().max())
-      
-       wp.launch(
-           kernel=side_normal_1d,
-           dim=self.bin_sum.shape,
-           inputs=[
-               self.id,   # use frame num for RNG seed increment
-               0.0,
-               gau_noise_param
-           ],
-           outputs=[
-               self.gau_noise
-           ]
-       )
-
-
-       wp.launch(
-           kernel=side_range_dependent_rayleigh_1d,
-           dim=self.bin_sum.shape,
-           inputs=[
-               self.id,   # use frame num for RNG seed increment
-               self.r,
-               # self.azi,
-               self.max_range,
-               ray_noise_param,
-               central_peak,
-               central_std,
-           ],
-           outputs=[
-               self.range_dependent_ray_noise
-
-
-           ]
-       )
-
-
-       # pre-normalization intensity for one row of the sonar image
-    #    print("[DEBUG] bin_sum row before normalization:", bin_sum_np[row_idx])
-
-
-       self._max_intensity.fill_(-wp.inf)
-       # Normalizing intensity at each bin either by global maximum or rangewise maximum
-       wp.launch(
-           # dim=self.bin_sum.shape,
-           dim=self.bin_sum.shape[0],
-           kernel=self._compute_max_intensity,
-           inputs=[
-               self.bin_sum,
-           ],
-           outputs=[
-               self._max_intensity
-           ]
-       )
-      
-       wp.synchronize()
-
-
-       # print("Max intensity array sample:", self._max_intensity.numpy()[:])
-       # print("Max intensity array min/max:", self._max_intensity.numpy().min(), self._max_intensity.numpy().max())
-
-
-       wp.launch(
-           kernel=self._make_sonar_map, # Convert binned (range, azimuth) sonar data into a flat intensity map.
-                                        # This is the classic sonar swath image representation.
-           dim=self.side_sonar_data.shape,
-           inputs=[
-               self.r,
-               # self.azi,
-               self.bin_sum,
-               self._max_intensity,
-               self.gau_noise,
-               self.range_dependent_ray_noise,
-               intensity_offset,
-               intensity_gain,
-               # num_intensity
-               # attenuation
-           ],
-           outputs=[
-               self.side_sonar_data
-           ]
-           )
-    
-       
-       # Create output array with same shape as bin_sum
-       self.out_array = wp.empty(self.bin_count.shape[0], dtype=wp.float32)
-
-       wp.launch(kernel=normalize_bin,
-                dim=self.bin_sum.shape[0],
-                inputs=[self.bin_sum, self.bin_count,self.out_array])
-
-    #    np.save("/home/nsieh/Desktop/before_bin_sum.npy",arr=self.out_array.numpy())
-    #    if self.output_dir is not None and self.save_individual_scans:
-    #        self.save_current_scan()
-
-      
-       # print("Intensity min/max:", intensity.numpy().min(), intensity.numpy().max())
-       # print("Max intensity min/max:", self._max_intensity.numpy().min(), self._max_intensity.numpy().max())
-       # print("Gau noise min/max:", self.gau_noise.numpy().min(), self.gau_noise.numpy().max())
-       # print("Ray noise min/max:", self.range_dependent_ray_noise.numpy().min(), self.range_dependent_ray_noise.numpy().max())
-
-
-       # side_sonar_data_np = self.side_sonar_data.numpy()
-       # print("AFTER normalization (actual intensity values):", side_sonar_data_np[:, 2])   
-       # print("AFTER intensity first 100:", self.side_sonar_data.numpy()[:100])   
-       self.get_side_sonar_image() 
-      
-    #    if self._viewport:
-    #     #    self.get_side_sonar_image()
-    #     pass
-           
-    #        # self.get_left_side_sonar_image()
-    #        # self.get_side_semantics_image()
-
-       self.save_waterfall_frame_to_history()
+       Returns:
+           dict: see PingProfiler.report()
+       """
+       return self.profiler.report()
 
+   def dump_ping_stats(self, path: str = None) -> str:
+       """Write get_ping_stats() as JSON, by default to <output_dir>/ping_stats.json.
 
-       # print("[SSS] bin_sum total:", self.bin_sum.numpy().sum())
-    #    print("[SSS] bin_count total:", self.bin_count.numpy().sum())
-       np.save("/home/nsieh/Desktop/bin_sum.npy",arr=self.out_array.numpy())
-       # print("[SSS] Max intensity after normalization:", self._max_intensity.numpy().max())
-       # print("[SSS] Sample sonar data [0,0]:", self.side_sonar_data.numpy()[0, 0])
+       Returns:
+           str: path of the written file
+       """
+       if path is None:
+           if self.output_dir is None:
+               raise ValueError("No path given and no output directory set")
+           path = os.path.join(self.output_dir, "ping_stats.json")
+       self.profiler.dump(path)
+       return path
 
 
    def get_sonar_data(self) -> wp.array:
@@ -660,6 +923,14 @@ class SideScanSonarSensor(Camera):
        with (x, y) are cartesian coordinates of the (r, azi) of the bin.
        """
        return self.side_sonar_data
+
+   def get_buffer_pool_report(self) -> dict:
+       """Get capacity and high-water mark of the per-ping scratch buffers.
+
+       Returns:
+           dict: see SonarBufferPool.report()
+       """
+       return self._processor.buffer_pool.report()
   
    # def get_left_sonar_data(self) -> wp.array:
    #     """Get GPU array of sonar data
@@ -671,8 +942,43 @@ class SideScanSonarSensor(Camera):
    #     """
    #     return self.left_side_sonar_data
   
+   def get_ping(self) -> dict:
+       """Get the latest processed ping. This is the data API of the sensor, also in headless mode.
+
+       The arrays are the sensor's own device buffers, no copy is made and nothing is synchronized:
+       they are overwritten by the next ping, and reading them on the host (e.g. .numpy()) waits
+       for the ping's kernels to finish.
+
+       Returns:
+           dict: ping_id, sonar_data (side_sonar_data), bins (out_array, mean intensity per bin),
+                 image_row (side_sonar_image RGBA row) and viewTransform of the scan
+       """
+       return {
+           "ping_id": self.id,
+           "sonar_data": self.side_sonar_data,
+           "bins": self.out_array,
+           "image_row": self.side_sonar_image,
+           "viewTransform": self.scan_data.get('viewTransform'),
+       }
+
+   def get_ping_export(self):
+       """Get the latest ping as zero-copy device views for consumers such as PyTorch.
+
+       Example:
+           ping = sensor.get_ping_export()
+           ping.wait(wp.stream_from_torch(torch.cuda.current_stream()))
+           bins = wp.to_torch(ping.bins)   # or torch.from_dlpack(ping.bins)
+
+       Returns:
+           PingExport: see side_scan_pipeline.PingExport for the lifetime guarantees,
+                       None if export_pings is off or no ping was processed yet
+       """
+       if self._ping_exporter is None:
+           return None
+       return self._ping_exporter.latest()
+
    def get_side_sonar_image(self) -> wp.array:
-        """Convert processed sonar data to a viewable grayscale image.
+        """Push the latest grayscale image row into the waterfall display.
     
         Returns:
             sonar_image (wp.array(dtype=wp.uint8)): GPU array containing the sonar image (RGBA format) 
@@ -680,38 +986,21 @@ class SideScanSonarSensor(Camera):
         Note:
             - Used internally for viewport display
             - Image dimensions match the sonar's polar binning resolution
+            - Without a viewport (and in headless mode) only the waterfall row is written, asynchronously
         """
 
-        wp.launch(
-            dim=(self.side_sonar_image.shape[0],),  # <-- positional `dim`
-            # dim=(self.num_range_bins,),
-            kernel=make_side_sonar_image,  # <-- positional `kernel`
-            inputs=[self.side_sonar_data],  # <-- keyword
-            outputs=[self.side_sonar_image],  # <-- keyword
-        )
-        # Synchronize to ensure all GPU operations are complete before accessing the image
-        wp.synchronize()
+        # The image row itself is produced by the processor's post-processing stage
+        self.update_waterfall()
 
+        if not self._viewport:
+            return self.side_sonar_image
 
-        wp.launch(
-                  dim=(self.waterfall_height-1, self.num_range_bins, 4),
-                  kernel=update_waterfall,
-                  inputs=[
-                      self.waterfall,
-                      self.waterfall_buffer,
-                  ])
-        
-        wp.launch(
-            dim=(self.num_range_bins, 4),
-            kernel=update_first_row,
-            inputs=[
-                self.side_sonar_image,
-                self.waterfall,
-            ]
-        )
-        wp.copy(self.waterfall_buffer, self.waterfall)
+        # Synchronize to ensure all GPU operations are complete before accessing the image
+        wp.synchronize()
+        waterfall = self.waterfall
 
-        self._sonar_provider.set_bytes_data_from_gpu(self.waterfall.ptr, [self.num_range_bins, self.waterfall_height])
+        self._sonar_provider.set_bytes_data_from_gpu(waterfall.ptr, [self.right_scan_width, self.waterfall_height])
+        self.profiler.record("bytes_viewport", waterfall.capacity)
 
 
         return self.side_sonar_image
@@ -797,7 +1086,7 @@ class SideScanSonarSensor(Camera):
            bbox_min: is the [(x_min, y_min), ...] that defines all the detected bboxes in the image frame
            bbox_max: is the [(x_max, y_max), ...] that defines all the detected bboxes in the image frame
        """
-       if self._privileged_bbox and len(self.semanticSeg_annot.get_data()['info']['idToLabels']) !=0:
+       if self._privileged_bbox and self._get_id_to_labels():
            self.scan_data['bbox'] = self.bbox_annot.get_data()['data']
            self.scan_data['bbox_ids'] = self.bbox_annot.get_data()['info']['bboxIds']
            # Compute the privileged bbox
@@ -888,9 +1177,11 @@ class SideScanSonarSensor(Camera):
 
 
    def update_viewport_img(self):
+       if not self._viewport:
+           return
        # Get latest sonar image as a np array
        # img_np = np.flipud(self.waterfall_buffer)
-       img_np = (self.waterfall_buffer)
+       img_np = self.waterfall_ring.numpy()
 
 
         # Ensure img_np is C-contiguous for tobytes()
@@ -912,11 +1203,20 @@ class SideScanSonarSensor(Camera):
 
    def set_output_directory(self, output_dir: str, 
                         # save_individual: bool = True, 
-                        save_waterfall: bool = True):
-        """Set the output directory and saving preferences."""
+                        save_waterfall: bool = True,
+                        export_tiles: bool = True):
+        """Set the output directory and saving preferences.
+
+        Args:
+            output_dir (str): Root directory for all sonar outputs
+            save_waterfall (bool, optional): Save the waterfall images. Defaults to True.
+            export_tiles (bool, optional): Build a tiled, multi-resolution waterfall while the survey runs
+                                           (see WaterfallTileExporter). Defaults to True.
+        """
         self.output_dir = output_dir
         # self.save_individual_scans = save_individual
         self.save_waterfall = save_waterfall
+        self.export_tiles = export_tiles
         
         os.makedirs(output_dir, exist_ok=True)
         # if save_individual:
@@ -984,67 +1284,130 @@ class SideScanSonarSensor(Camera):
         
         csv_path = os.path.join(self.output_dir, f"sonar_data_{timestamp}.csv")
         with open(csv_path, 'w') as f:
-            f.write("Range_m,Intensity\n")
-            for r, intensity in zip(range_values, bin_data):
-                f.write(f"{r:.3f},{intensity:.6f}\n")
+            if self.dual_channel:
+                f.write("Range_m,Port_Intensity,Starboard_Intensity\n")
+                for r, port, starboard in zip(range_values, bin_data[0], bin_data[1]):
+                    f.write(f"{r:.3f},{port:.6f},{starboard:.6f}\n")
+            else:
+                f.write("Range_m,Intensity\n")
+                for r, intensity in zip(range_values, bin_data):
+                    f.write(f"{r:.3f},{intensity:.6f}\n")
         print(f"[SSS] CSV saved: {csv_path}")
 
-   def save_waterfall_frame_to_history(self):
-    """Store each scan line exactly as displayed."""
-    if hasattr(self, 'side_sonar_image'):
-        # Get the raw scan line data without any reshaping and cv2
-        scan_line = self.side_sonar_image.numpy().copy()  # Add .copy() to ensure data is copied
-        self.complete_waterfall_history.append(scan_line)
-        
-        # Progress indicator
-        if len(self.complete_waterfall_history) % 100 == 0:
-            print(f"[SSS] Captured {len(self.complete_waterfall_history)} frames so far")
-    else:
+   def get_sensor_pose(self) -> np.ndarray:
+       """Sensor pose in world frame recovered from the last scan's viewTransform.
+
+       Returns:
+           np.ndarray: [x, y, z, qw, qx, qy, qz] (camera frame convention)
+       """
+       viewTransform = np.asarray(self.scan_data['viewTransform'], dtype=np.float64)
+       rot_world = viewTransform[:3, :3].T
+       position = -rot_world @ viewTransform[:3, 3]
+       qx, qy, qz, qw = R.from_matrix(rot_world).as_quat()
+       return np.array([*position, qw, qx, qy, qz])
+
+   def save_waterfall_frame_to_history(self, sim_time: float = None):
+    """Store each scan line exactly as displayed, together with ping id, simulation time and pose.
+
+    Args:
+        sim_time (float, optional): Simulation time of the ping. Defaults to the timeline's current time.
+    """
+    if not hasattr(self, 'side_sonar_image'):
         print("[SSS] WARNING: side_sonar_image does not exist!")
+        return
+
+    if self.survey_store is None:
+        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+        if self.output_dir is None:
+            # Keep capturing like before set_output_directory() existed, but on disk
+            waterfall_dir = tempfile.mkdtemp(prefix="sss_waterfall_")
+            print(f"[SSS] WARNING: No output directory set, survey history goes to {waterfall_dir}. "
+                  f"Call set_output_directory() to choose where it is kept.")
+        else:
+            waterfall_dir = os.path.join(self.output_dir, "waterfall")
+        survey_path = os.path.join(waterfall_dir, f"survey_{timestamp}")
+        self.survey_store = SurveyStore.create(survey_path, row_shape=self.side_sonar_image.shape)
+        if self.export_tiles:
+            self.tile_exporter = WaterfallTileExporter(os.path.join(survey_path, "tiles"),
+                                                       width=self.side_sonar_image.shape[0])
+        print(f"[SSS] Recording survey to {survey_path}")
+
+    # Get the raw scan line data without any reshaping and cv2
+    scan_line = self.side_sonar_image.numpy()
+    self.profiler.record("bytes_to_host", scan_line.nbytes)
+    if sim_time is None:
+        sim_time = omni.timeline.get_timeline_interface().get_current_time()
+    self.survey_store.append(scan_line,
+                             ping_id=self.id,
+                             timestamp=sim_time,
+                             pose=self.get_sensor_pose())
+    # Tiles are cut and encoded in the background as soon as enough rows have arrived
+    if self.tile_exporter is not None:
+        self.tile_exporter.add_row(scan_line)
+
+    # Progress indicator, also keeps the on-disk index current in case the session dies
+    if len(self.survey_store) % 100 == 0:
+        self.survey_store.flush()
+        if self.tile_exporter is not None:
+            self.tile_exporter.flush()
+        print(f"[SSS] Captured {len(self.survey_store)} frames so far")
 
    def save_complete_survey_waterfall(self, filename: str = None):
-        """Save raw waterfall data as numpy array and simple image."""
-        print(f"[SSS] Total frames in history: {len(self.complete_waterfall_history)}")
+        """Save raw waterfall data as numpy array and simple image.
+
+        The pings are streamed from the on-disk survey store chunk by chunk, for the .npy as well
+        as for the PNG, so exporting does not need the whole survey in memory.
+        """
+        num_frames = 0 if self.survey_store is None else len(self.survey_store)
+        print(f"[SSS] Total frames in history: {num_frames}")
         
-        if not self.complete_waterfall_history:
+        if num_frames == 0:
             print("[SSS] ERROR: No waterfall history stored!")
             return
             
+        if self.output_dir is None:
+            print(f"[SSS] ERROR: No output directory set, call set_output_directory() first. "
+                  f"The survey is kept at {self.survey_store.path}")
+            return
+
         if filename is None:
             timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
             filename = f"complete_survey_waterfall_{timestamp}"
+
+        store = self.survey_store
+        store.close()
+        if self.tile_exporter is not None:
+            self.tile_exporter.finalize()
+            print(f"[SSS] Tiled waterfall saved: {self.tile_exporter.output_dir}")
+        print(f"[SSS] Complete waterfall shape: {(num_frames,) + store.row_shape}")
         
-        # Stack all data - use np.stack() or np.array() instead of np.vstack()
-        # This preserves the 2D structure of each scan line
-        complete_waterfall = np.array(self.complete_waterfall_history)  # Shape: (num_frames, num_range_bins, 4)
-        print(f"[SSS] Complete waterfall shape: {complete_waterfall.shape}")
-        
-        # Save as numpy file (no distortion possible)
+        # Save as numpy file (no distortion possible), written chunk by chunk
         npy_path = os.path.join(self.output_dir, "waterfall", f"{filename}.npy")
-        np.save(npy_path, complete_waterfall)
-        
-        # Save as simple grayscale image
-        if complete_waterfall.ndim == 3 and complete_waterfall.shape[2] == 4:
-            # Take just the first channel (R from RGBA) 
-            img_data = complete_waterfall[:, :, 0]
-        else:
-            img_data = complete_waterfall
+        complete_waterfall = np.lib.format.open_memmap(npy_path, mode="w+", dtype=store.dtype,
+                                                       shape=(num_frames,) + store.row_shape)
+        for start, rows, _ in store.iter_chunks():
+            complete_waterfall[start:start + rows.shape[0]] = rows
+        complete_waterfall.flush()
+        del complete_waterfall
         
+        # Save as simple grayscale image (first channel of RGBA), encoded chunk by chunk
         png_path = os.path.join(self.output_dir, "waterfall", f"{filename}.png")
         
         # Check if image dimensions are reasonable for PNG
-        if img_data.shape[0] > 65535 or img_data.shape[1] > 65535:
-            print(f"[SSS] WARNING: Image dimensions {img_data.shape} exceed PNG limits (65535x65535)")
-            print(f"[SSS] Saving as .npy only. Use the .npy file for analysis.")
+        if num_frames > 65535 or store.row_shape[0] > 65535:
+            print(f"[SSS] WARNING: Image dimensions {(num_frames, store.row_shape[0])} exceed PNG limits (65535x65535)")
+            print(f"[SSS] Saving as .npy only. Use the .npy file or the tiled waterfall for analysis.")
         else:
-            cv2.imwrite(png_path, img_data)
+            export_survey_png(store, png_path)
             print(f"[SSS] PNG saved: {png_path}")
         
-        print(f"[SSS] Complete survey saved with {len(self.complete_waterfall_history)} frames")
+        print(f"[SSS] Complete survey saved with {num_frames} frames")
         print(f"[SSS] Raw waterfall (.npy) saved: {npy_path}")
+        print(f"[SSS] Per-ping survey store (with metadata) kept at: {store.path}")
         
-        # *** CLEAR THE HISTORY FOR THE NEXT SCAN ***
-        self.complete_waterfall_history.clear()
+        # *** START A NEW SURVEY STORE FOR THE NEXT SCAN ***
+        self.survey_store = None
+        self.tile_exporter = None
         print(f"[SSS] History cleared for next scan")
 
 # # save complete waterfall image by appending to previous ones (1 large png)
@@ -1117,9 +1480,20 @@ class SideScanSonarSensor(Camera):
            - Required for proper shutdown when done using the sensor
            - Also closes viewport window if one was created
        """
+       self.stop_frame_recording()
+       self._set_rendering(True)
+       if self._ingest is not None:
+           self._ingest.clear()
+       if self._ray_caster is not None:
+           # No annotator was attached
+           if self._viewport:
+               self.ui_destroy()
+           return
        self.pointcloud_annot.detach(self._render_product_path)
        self.cameraParams_annot.detach(self._render_product_path)
-       self.semanticSeg_annot.detach(self._render_product_path)
+       if self._semanticSeg_attached:
+           self.semanticSeg_annot.detach(self._render_product_path)
+           self._semanticSeg_attached = False
 
 
        rep.AnnotatorCache.clear(self.pointcloud_annot)
@@ -1155,3 +1529,108 @@ class SideScanSonarSensor(Camera):
 
 
 
+class SideScanSonarGroup:
+   """Runs the sonars of a scene (several sensors or vehicles) as one batched pipeline.
+
+   Every sensor still fetches its own annotator frame, keeps its own waterfall, exporter, history
+   and profiler, but the intensity, binning, normalization and image stages run once for the whole
+   group through a SideScanGroupProcessor, so N sensors cost about the launches of one. The
+   sensors must be initialized with side_sonar_initialize() and share the range grid. The group
+   only runs a subset of the sensor settings and raises on any other:
+       - fused_kernels=True and single channel (no dual_channel)
+       - normalizing_method="all": the per-range history of "range" is not batched, so the group
+         cannot run sensors set up like the scenario's (normalizing_method="range")
+       - range_splat="nearest"
+       - binning="auto" or "atomic": the group always accumulates with atomics
+   The group has its own ping scheduler; the sensors' schedulers are not used.
+
+       group = SideScanSonarGroup([sonar_a, sonar_b])
+       group.make_side_sonar_data(sim_time=t)     # instead of sonar_a/b.make_side_sonar_data()
+   """
+
+   def __init__(self, sensors: list, ping_rate: float = None, sound_speed: float = 1500.0, profile: bool = False):
+       """
+       Args:
+           sensors (list): Initialized SideScanSonarSensor instances
+           ping_rate (float, optional): Pings per second of the group. Defaults to the two-way travel time to max_range.
+           sound_speed (float, optional): Speed of sound in m/s for the default ping rate. Defaults to 1500.0.
+           profile (bool, optional): Time the group's kernel stages, see get_ping_stats(). Defaults to False.
+       """
+       for sensor in sensors:
+           if not sensor._fused_kernels or sensor.dual_channel:
+               raise ValueError(f"[{sensor._name}] Sensor groups need single-channel sensors with fused_kernels=True")
+       self.sensors = list(sensors)
+       self.processor = SideScanGroupProcessor([sensor._processor for sensor in self.sensors])
+       for sensor in self.sensors:
+           sensor._bind_processor_outputs()
+       self.profiler = PingProfiler(enabled=profile, device=self.processor.device)
+       self.processor.profiler = self.profiler
+       self.ping_scheduler = PingScheduler(max_range=self.sensors[0].max_range, ping_rate=ping_rate, sound_speed=sound_speed)
+
+   def make_side_sonar_data(self,
+                            query_prop: str = 'reflectivity',
+                            attenuation: float = 1.0,
+                            gau_noise_param: float = 0.05,
+                            ray_noise_param: float = 0.05,
+                            intensity_offset: float = 0.0,
+                            intensity_gain: float = 1.0,
+                            central_peak: float = 0.0,
+                            central_std: float = 0.001,
+                            sim_time: float = None) -> int:
+       """Ping every sensor of the group, same arguments as SideScanSonarSensor.make_side_sonar_data().
+
+       central_peak and central_std have no effect on the 1D side-scan map (see
+       SideScanProcessor.post_process()); the group accepts them so calls can be switched over unchanged.
+
+       Returns:
+           int: Number of sensors that produced a ping on this call
+       """
+       if sim_time is None:
+           sim_time = omni.timeline.get_timeline_interface().get_current_time()
+       ping = self.ping_scheduler.request(sim_time)
+       for sensor in self.sensors:
+           if sensor._skip_idle_renders:
+               sensor._set_rendering(self.ping_scheduler.render_next)
+       if not ping:
+           self.profiler.count("idle_steps")
+           return 0
+
+       frames = []
+       for sensor in self.sensors:
+           indexToRefl = sensor._acquire_ping(query_prop)
+           if indexToRefl is None:
+               frames.append(None)
+               continue
+           frames.append({
+               'pcl': sensor.scan_data['pcl'],
+               'normals': sensor.scan_data['normals'],
+               'semantics': sensor.scan_data['semantics'],
+               'viewTransform': sensor.scan_data['viewTransform'],
+               'indexToRefl': indexToRefl,
+           })
+       num_pings = sum(frame is not None for frame in frames)
+       if num_pings == 0:
+           return 0
+       self.profiler.count("pings")
+
+       self.processor.process(frames,
+                              seeds=[sensor.id for sensor in self.sensors],
+                              attenuation=attenuation,
+                              gau_noise_param=gau_noise_param,
+                              ray_noise_param=ray_noise_param,
+                              intensity_offset=intensity_offset,
+                              intensity_gain=intensity_gain)
+
+       for sensor, frame in zip(self.sensors, frames):
+           if sensor._pose_cache is not None:
+               # The group recomputes every ping and zeroes the bins of sensors without a frame
+               sensor._pose_cache.invalidate()
+           if frame is None:
+               continue
+           semantic_row = sensor._finish_binning(frame['indexToRefl'], attenuation)
+           sensor._publish_ping(semantic_row, sim_time)
+       return num_pings
+
+   def get_ping_stats(self) -> dict:
+       """Statistics of the group's batched stages (the sensors keep their own, see SideScanSonarSensor.get_ping_stats())."""
+       return self.profiler.report()
@@ -0,0 +1,281 @@
+import itertools
+import json
+import os
+
+import numpy as np
+import warp as wp
+
+try:
+    from isaacsim.oceansim.utils.ImagingSonar_kernels import (side_sensor_location,
+                                                              side_sweep_point_process,
+                                                              side_push_range_history,
+                                                              side_floor_range_max,
+                                                              side_sweep_post_process)
+    from isaacsim.oceansim.utils.side_scan_pipeline import SideScanProcessor, LabelTableCache, range_normalization_floor
+    from isaacsim.oceansim.utils.survey_store import SurveyStore
+    from isaacsim.oceansim.utils.frame_recorder import FrameReplay
+except ImportError:
+    # Running outside Isaac Sim (tuning scripts): use the local modules
+    from imaging_sonar_kernels import (side_sensor_location,
+                                       side_sweep_point_process,
+                                       side_push_range_history,
+                                       side_floor_range_max,
+                                       side_sweep_post_process)
+    from side_scan_pipeline import SideScanProcessor, LabelTableCache, range_normalization_floor
+    from survey_store import SurveyStore
+    from frame_recorder import FrameReplay
+
+
+# Parameters a sweep can vary, with the defaults of SideScanSonarSensor.make_side_sonar_data()
+SWEEP_DEFAULTS = {
+    "attenuation": 1.0,
+    "gau_noise_param": 0.05,
+    "ray_noise_param": 0.05,
+    "intensity_offset": 0.0,
+    "intensity_gain": 1.0,
+}
+
+
+def parameter_grid(**axes) -> list:
+    """Cartesian product of parameter values, as a list of parameter set dicts.
+
+        parameter_grid(attenuation=[0.5, 1.0], intensity_gain=[1.0, 2.0, 4.0])   # 6 sets
+    """
+    names = list(axes.keys())
+    return [dict(zip(names, values)) for values in itertools.product(*(axes[name] for name in names))]
+
+
+class SideScanSweep:
+    """Renders a recorded ping stream under many parameter sets at once.
+
+    The per-point work (slant range, incidence, reflectivity lookup, binning) does not depend on
+    the noise, offset and gain parameters, and the attenuation only scales each point's
+    contribution. Every ping is therefore binned in a single launch for all distinct attenuation
+    values (bin_sum has one row per attenuation), and post-processed in a single launch over
+    (parameter set, range bin). Each parameter set sees the same noise draws as a SideScanReplay
+    of the recording with that set, so a slice of the sweep equals the corresponding replay.
+
+    Single-channel recordings with nearest-bin range assignment only. The normalizing method and
+    range window and floor default to the recorded ones; with "range" every attenuation keeps its own
+    per-range history, like a replay at that attenuation.
+
+        sweep = SideScanSweep(path, parameter_grid(attenuation=[0.5, 1.0], intensity_gain=[1.0, 2.0]))
+        rows = sweep.render()                       # (num_sets, num_pings, width, 4)
+        sweep.write(output_dir)                     # one SurveyStore waterfall per parameter set
+    """
+
+    def __init__(self, path: str, param_sets: list, device="cpu", query_prop: str = 'reflectivity',
+                 normalizing_method: str = None, range_window: int = None, range_floor: float = None):
+        """
+        Args:
+            path (str): FrameRecorder recording directory
+            param_sets (list): Parameter set dicts, keys from SWEEP_DEFAULTS. Missing keys take the default.
+            device (optional): Warp device. Defaults to "cpu".
+            query_prop (str, optional): Semantic property used as reflectivity. Defaults to 'reflectivity'.
+            normalizing_method (str, optional): "all" or "range". Defaults to the recorded one.
+            range_window (int, optional): Pings of the per-range maximum. Defaults to the recorded one.
+            range_floor (float, optional): Floor of the per-range maximum, see SideScanProcessor.set_normalizing_method().
+                                           Defaults to the recorded one.
+        """
+        self.frames = FrameReplay.open(path)
+        self.device = wp.get_device(device)
+        self.query_prop = query_prop
+        config = self.frames.sensor_config
+        if config.get("num_channels", 1) != 1:
+            raise ValueError("Parameter sweeps only support single-channel recordings")
+        if config.get("range_splat", "nearest") != "nearest":
+            # side_sweep_point_process bins every return into a single bin
+            raise ValueError("Parameter sweeps only support recordings with nearest-bin range assignment")
+        if len(param_sets) == 0:
+            raise ValueError("At least one parameter set is required")
+
+        self.param_sets = []
+        for params in param_sets:
+            unknown = set(params) - set(SWEEP_DEFAULTS)
+            if unknown:
+                raise ValueError(f"Unknown sweep parameters: {sorted(unknown)}")
+            self.param_sets.append({**SWEEP_DEFAULTS, **params})
+
+        # The processor provides the range grid; its own buffers are not used
+        self.processor = SideScanProcessor(min_range=config["min_range"],
+                                           max_range=config["max_range"],
+                                           range_res=config["range_res"],
+                                           device=self.device)
+        self.label_tables = LabelTableCache(device=self.device)
+
+        attenuations = sorted({float(params["attenuation"]) for params in self.param_sets})
+        att_index = [attenuations.index(float(params["attenuation"])) for params in self.param_sets]
+        num_sets = len(self.param_sets)
+        num_bins = self.processor.num_range_bins
+
+        def param_array(name):
+            return wp.array([params[name] for params in self.param_sets], dtype=wp.float32, device=self.device)
+
+        self._attenuations = wp.array(attenuations, dtype=wp.float32, device=self.device)
+        self._att_index = wp.array(att_index, dtype=wp.int32, device=self.device)
+        self._gau_noise_param = param_array("gau_noise_param")
+        self._ray_noise_param = param_array("ray_noise_param")
+        self._offset = param_array("intensity_offset")
+        self._gain = param_array("intensity_gain")
+
+        self.bin_sum = wp.empty(shape=(len(attenuations), num_bins), dtype=wp.float32, device=self.device)
+        self.bin_count = wp.empty(shape=(num_bins,), dtype=wp.int32, device=self.device)
+        if normalizing_method is None:
+            normalizing_method = config.get("normalizing_method", "all")
+        if range_window is None:
+            range_window = config.get("range_window", 64)
+        if range_floor is None:
+            range_floor = config.get("range_floor", 0.1)
+        if normalizing_method == "all":
+            self._max_intensity = wp.empty(shape=(len(attenuations), 1), dtype=wp.float32, device=self.device)
+            self._range_history = None
+        elif normalizing_method == "range":
+            if range_window < 1:
+                raise ValueError(f"range_window must be >= 1, got {range_window}")
+            if not 0.0 < range_floor <= 1.0:
+                raise ValueError(f"range_floor must be in (0, 1], got {range_floor}")
+            self._max_intensity = wp.empty(shape=(len(attenuations), num_bins), dtype=wp.float32, device=self.device)
+            # (attenuation x range bin) rows of pings, see SideScanProcessor.set_normalizing_method()
+            self._range_history = wp.full(shape=(len(attenuations) * num_bins, range_window), value=-wp.inf,
+                                          dtype=wp.float32, device=self.device)
+            self._range_slot = 0
+            self._range_filled = 0
+            self._ping_max = wp.empty(shape=(len(attenuations),), dtype=wp.float32, device=self.device)
+        else:
+            raise ValueError(f"Unknown normalizing_method: {normalizing_method}. Use 'all' or 'range'.")
+        self.normalizing_method = normalizing_method
+        self.range_window = range_window
+        self.range_floor = range_floor
+        self._sensor_loc = wp.empty(shape=(1,), dtype=wp.vec3, device=self.device)
+        self.out_array = wp.empty(shape=(num_sets, num_bins), dtype=wp.float32, device=self.device)
+        self.side_sonar_image = wp.empty(shape=(num_sets, num_bins, 4), dtype=wp.uint8, device=self.device)
+
+    def __len__(self):
+        return len(self.frames)
+
+    @property
+    def num_sets(self) -> int:
+        return len(self.param_sets)
+
+    def process(self, frame: dict):
+        """Process one frame for every parameter set. The results are left in out_array and
+        side_sonar_image, (num_sets, num_range_bins[, 4])."""
+        viewTransform = wp.mat44(frame['viewTransform'])
+        pcl = wp.array(frame['pcl'], dtype=wp.float32, device=self.device)
+        normals = wp.array(frame['normals'], dtype=wp.float32, device=self.device)
+        semantics = wp.array(frame['semantics'], dtype=wp.uint32, device=self.device)
+        indexToRefl = self.label_tables.get(frame['idToLabels'], self.query_prop)
+
+        self.bin_sum.zero_()
+        self.bin_count.zero_()
+
+        wp.launch(kernel=side_sensor_location,
+                  dim=1,
+                  inputs=[viewTransform],
+                  outputs=[self._sensor_loc],
+                  device=self.device)
+        wp.launch(kernel=side_sweep_point_process,
+                  dim=pcl.shape[0],
+                  inputs=[
+                      pcl,
+                      normals,
+                      viewTransform,
+                      semantics,
+                      indexToRefl,
+                      self._attenuations,
+                      self._sensor_loc,
+                      self.processor.sonar_grid,
+                  ],
+                  outputs=[
+                      self.bin_sum,
+                      self.bin_count,
+                  ],
+                  device=self.device)
+        if self._range_history is None:
+            self.processor.reduction.reduce(self.bin_sum, "max", out=self._max_intensity.flatten())
+        else:
+            self.processor.reduction.reduce(self.bin_sum, "max", out=self._ping_max)
+            wp.launch(kernel=side_push_range_history,
+                      dim=self.bin_sum.size,
+                      inputs=[self.bin_sum.flatten(), self._range_slot],
+                      outputs=[self._range_history],
+                      device=self.device)
+            self._range_slot = (self._range_slot + 1) % self._range_history.shape[1]
+            self._range_filled = min(self._range_filled + 1, self.range_window)
+            self.processor.reduction.reduce(self._range_history, "max", out=self._max_intensity.flatten())
+            wp.launch(kernel=side_floor_range_max,
+                      dim=self._max_intensity.size,
+                      inputs=[self._ping_max,
+                              range_normalization_floor(self._range_filled, self.range_window, self.range_floor),
+                              self.processor.num_range_bins],
+                      outputs=[self._max_intensity.flatten()],
+                      device=self.device)
+        wp.launch(kernel=side_sweep_post_process,
+                  dim=(self.num_sets, self.processor.num_range_bins),
+                  inputs=[
+                      frame['ping_id'],
+                      self.processor.r,
+                      self.bin_sum,
+                      self.bin_count,
+                      self._max_intensity,
+                      self._att_index,
+                      self._gau_noise_param,
+                      self._ray_noise_param,
+                      self._offset,
+                      self._gain,
+                      self.processor.max_range,
+                  ],
+                  outputs=[
+                      self.out_array,
+                      self.side_sonar_image,
+                  ],
+                  device=self.device)
+
+    def run(self):
+        """Process every frame in order, yielding the frame after processing it."""
+        if self._range_history is not None:
+            # Every run starts like the live sensor, without earlier pings in the per-range maximum
+            self._range_history.fill_(-wp.inf)
+            self._range_slot = 0
+            self._range_filled = 0
+        for frame in self.frames:
+            self.process(frame)
+            yield frame
+
+    def render(self) -> np.ndarray:
+        """Image rows of every ping for every parameter set, (num_sets, num_pings, width, 4) uint8."""
+        rows = np.empty((self.num_sets, len(self.frames)) + tuple(self.side_sonar_image.shape[1:]), dtype=np.uint8)
+        for i, _ in enumerate(self.run()):
+            rows[:, i] = self.side_sonar_image.numpy()
+        return rows
+
+    def write(self, output_dir: str, chunk_size: int = 1024) -> list:
+        """Write one waterfall per parameter set, streaming ping by ping.
+
+        Layout of the output directory:
+            sweep.json      recording path and the parameter set of every waterfall
+            set_000/        SurveyStore of parameter set 0 (rows of (width, 4) uint8)
+            ...
+
+        Returns:
+            list: SurveyStore directory of every parameter set
+        """
+        os.makedirs(output_dir, exist_ok=True)
+        paths = [os.path.join(output_dir, f"set_{k:03d}") for k in range(self.num_sets)]
+        stores = [SurveyStore.create(p, row_shape=tuple(self.side_sonar_image.shape[1:]), chunk_size=chunk_size)
+                  for p in paths]
+        try:
+            for frame in self.run():
+                rows = self.side_sonar_image.numpy()
+                for store, row in zip(stores, rows):
+                    store.append(row, ping_id=frame['ping_id'], timestamp=np.nan)
+        finally:
+            for store in stores:
+                store.close()
+
+        with open(os.path.join(output_dir, "sweep.json"), "w") as f:
+            json.dump({
+                "recording": os.path.abspath(self.frames.path),
+                "sets": [{"path": os.path.basename(p), "params": params} for p, params in zip(paths, self.param_sets)],
+            }, f, indent=2)
+        return paths
@@ -0,0 +1,302 @@
+import json
+
+import numpy as np
+import warp as wp
+
+try:
+    from isaacsim.oceansim.utils.ImagingSonar_kernels import surfel_gather_candidates, surfel_compact_visible
+    from isaacsim.oceansim.utils.mesh_raycast import MeshRayScene
+except ImportError:
+    # Running outside Isaac Sim (baking scripts, tests on the Warp CPU device): use the local modules
+    from imaging_sonar_kernels import surfel_gather_candidates, surfel_compact_visible
+    from mesh_raycast import MeshRayScene
+
+
+class SurfelScene:
+    """Static scene baked into surfels (position, normal, semantic id) behind a wp.HashGrid.
+
+    bake() samples every triangle of a MeshRayScene uniformly by area at the given spacing, so a
+    static stage (e.g. the shipwreck of UIBuilder._setup_scene) is converted once and then queried
+    by SurfelGatherer on every ping. Reflectivity stays with the semantic id: id_to_labels is the
+    scene's idToLabels and the sensor's label table turns it into per-surfel reflectivity, exactly
+    as for rendered points. The bake can be saved to a single .npz and loaded on any device.
+
+        scene = SurfelScene.bake(MeshRayScene.from_stage(stage), spacing=0.02)
+        scene.save("shipwreck_surfels.npz")
+        scene = SurfelScene.load("shipwreck_surfels.npz", device="cuda:0")
+    """
+
+    def __init__(self,
+                 positions: np.ndarray,
+                 normals: np.ndarray,
+                 semantics: np.ndarray,
+                 id_to_labels: dict,
+                 spacing: float,
+                 cell_width: float = None,
+                 grid_dim: int = 128,
+                 device=None):
+        """
+        Args:
+            positions (np.ndarray): (S, 3) surfel centres in world frame
+            normals (np.ndarray): (S, 3) unit normals
+            semantics (np.ndarray): (S,) semantic ids, keys of id_to_labels
+            id_to_labels (dict): idToLabels of the semantic ids
+            spacing (float): Mean distance between neighbouring surfels
+            cell_width (float, optional): Hash grid cell size. Defaults to 4 * spacing.
+            grid_dim (int, optional): Hash table size per axis. Defaults to 128.
+            device (optional): Warp device. Defaults to the preferred device.
+        """
+        self.device = wp.get_device(device)
+        self.spacing = float(spacing)
+        self.cell_width = float(cell_width) if cell_width is not None else 4.0 * self.spacing
+        self.id_to_labels = id_to_labels
+        positions = np.asarray(positions, dtype=np.float32).reshape(-1, 3)
+        if positions.shape[0] == 0:
+            raise ValueError("SurfelScene has no surfels")
+        self.bounds = (positions.min(axis=0), positions.max(axis=0))
+
+        self.positions = wp.array(positions, dtype=wp.vec3, device=self.device)
+        self.normals = wp.array(np.asarray(normals, dtype=np.float32).reshape(-1, 3), dtype=wp.vec3, device=self.device)
+        self.semantics = wp.array(np.asarray(semantics, dtype=np.uint32), dtype=wp.uint32, device=self.device)
+        self.grid = wp.HashGrid(grid_dim, grid_dim, grid_dim, device=self.device)
+        self.grid.build(self.positions, self.cell_width)
+
+    @property
+    def num_surfels(self) -> int:
+        return self.positions.shape[0]
+
+    @classmethod
+    def bake(cls, mesh_scene: MeshRayScene, spacing: float = 0.02, seed: int = 0, faces_per_batch: int = 1 << 20, **kwargs):
+        """Sample the triangles of a MeshRayScene (build() not needed) into surfels.
+
+        Every face gets area / spacing^2 surfels on average (stochastically rounded, so small faces
+        are still represented in proportion), uniformly distributed over the face, with the face's
+        geometric normal and semantic id.
+
+        Args:
+            mesh_scene (MeshRayScene): Scene to bake
+            spacing (float, optional): Mean surfel spacing in meters. Defaults to 0.02.
+            seed (int, optional): Sampling seed, the bake is deterministic. Defaults to 0.
+            faces_per_batch (int, optional): Faces sampled at once, bounds the host memory. Defaults to 2^20.
+            **kwargs: cell_width, grid_dim and device of SurfelScene. The device defaults to the mesh scene's.
+        """
+        points, indices, face_semantics = mesh_scene.triangles()
+        triangles = indices.reshape(-1, 3)
+        rng = np.random.default_rng(seed)
+        positions, normals, semantics = [], [], []
+        for start in range(0, triangles.shape[0], faces_per_batch):
+            tri = triangles[start:start + faces_per_batch]
+            a = points[tri[:, 0]].astype(np.float64)
+            e1 = points[tri[:, 1]] - a
+            e2 = points[tri[:, 2]] - a
+            cross = np.cross(e1, e2)
+            double_area = np.linalg.norm(cross, axis=1)
+            counts = np.floor(0.5 * double_area / spacing ** 2 + rng.random(tri.shape[0])).astype(np.int64)
+            face = np.repeat(np.arange(tri.shape[0]), counts)
+            if face.size == 0:
+                continue
+            # Uniform barycentric sampling
+            r1 = np.sqrt(rng.random(face.size))
+            r2 = rng.random(face.size)
+            w1 = (r1 * (1.0 - r2))[:, None]
+            w2 = (r1 * r2)[:, None]
+            positions.append((a[face] + w1 * e1[face] + w2 * e2[face]).astype(np.float32))
+            normals.append((cross[face] / double_area[face, None]).astype(np.float32))
+            semantics.append(face_semantics[start:start + faces_per_batch][face])
+        if not positions:
+            raise ValueError(f"No surfels at spacing {spacing}, the scene is too small")
+        kwargs.setdefault("device", mesh_scene.device)
+        return cls(np.concatenate(positions), np.concatenate(normals), np.concatenate(semantics),
+                   dict(mesh_scene.id_to_labels), spacing, **kwargs)
+
+    @classmethod
+    def from_heightmap(cls, heightmap: np.ndarray, scale=(100.0, 100.0, 10.0), labels: dict = None, spacing: float = 0.02, **kwargs):
+        """Bake a terrain heightmap, laid out like generate_usd_terrain_from_heightmap()."""
+        mesh_scene = MeshRayScene(device=kwargs.get("device"))
+        mesh_scene.add_heightmap(heightmap, scale=scale, labels=labels)
+        return cls.bake(mesh_scene, spacing=spacing, **kwargs)
+
+    def save(self, path: str):
+        """Write the bake to a .npz file."""
+        np.savez(path,
+                 positions=self.positions.numpy(),
+                 normals=self.normals.numpy(),
+                 semantics=self.semantics.numpy(),
+                 id_to_labels=json.dumps(self.id_to_labels),
+                 spacing=self.spacing,
+                 cell_width=self.cell_width)
+
+    @classmethod
+    def load(cls, path: str, device=None, **kwargs):
+        """Read a bake written by save(). kwargs override the saved cell_width or set grid_dim."""
+        data = np.load(path)
+        kwargs.setdefault("cell_width", float(data["cell_width"]))
+        return cls(data["positions"], data["normals"], data["semantics"], json.loads(str(data["id_to_labels"])),
+                   float(data["spacing"]), device=device, **kwargs)
+
+
+class SurfelGatherer:
+    """Produces the sonar's scan_data from a SurfelScene instead of rendering or ray casting.
+
+    A ping only visits the hash grid cells of the bounding box of the fan (the pyramid from the
+    sensor to max_range), one thread per cell, so its cost follows the swath footprint and not
+    the render resolution. Surfels inside the range annulus and the fan become candidates; a depth
+    buffer at the fan's pixel resolution keeps the nearest range per pixel, and only candidates
+    within depth_tolerance of it are handed on, so acoustic shadows behind objects are kept.
+
+    The fan is the pinhole grid of SonarRayCaster (square pixels, hori_fov across hori_res), and
+    cast() returns the same scan_data layout, so the rest of the ping pipeline is shared. Point
+    density follows the bake spacing rather than the ray density; every ping is normalized by its
+    own maximum, so this changes the speckle statistics and not the overall brightness.
+
+        gatherer = SurfelGatherer(scene, hori_fov=0.2, hori_res=300, vert_res=4096, min_range=8.0, max_range=10.0)
+        scan_data = gatherer.cast(camera_to_world)
+    """
+
+    def __init__(self,
+                 scene: SurfelScene,
+                 hori_fov: float,
+                 hori_res: int,
+                 vert_res: int,
+                 min_range: float,
+                 max_range: float,
+                 depth_tolerance: float = None,
+                 occlusion: bool = True):
+        """
+        Args:
+            scene (SurfelScene): Baked scene, its device is used for the queries
+            hori_fov (float): Horizontal field of view in degrees
+            hori_res (int): Horizontal pixels of the depth buffer
+            vert_res (int): Vertical pixels of the depth buffer
+            min_range (float): Near distance
+            max_range (float): Far distance
+            depth_tolerance (float, optional): Range behind a pixel's nearest surfel still counted as visible.
+                                               Defaults to 2 * the cell width of the scene.
+            occlusion (bool, optional): Drop surfels hidden behind nearer ones. Defaults to True.
+        """
+        self.scene = scene
+        self.device = scene.device
+        self.min_range = min_range
+        self.max_range = max_range
+        self.depth_tolerance = depth_tolerance if depth_tolerance is not None else 2.0 * scene.cell_width
+        self.occlusion = occlusion
+        self._candidate_count = wp.zeros(shape=(1,), dtype=wp.int32, device=self.device)
+        self._hit_count = wp.zeros(shape=(1,), dtype=wp.int32, device=self.device)
+        self.set_fan(hori_fov, hori_res, vert_res)
+
+    def set_fan(self, hori_fov: float, hori_res: int, vert_res: int):
+        """Resize the fan, see SonarRayCaster.set_fan()."""
+        self.hori_fov = hori_fov
+        self.hori_res = hori_res
+        self.vert_res = vert_res
+        self._tan_x = float(np.tan(np.deg2rad(hori_fov) / 2))
+        self._tan_y = self._tan_x * vert_res / hori_res
+        self.vert_fov = np.rad2deg(2 * np.arctan(self._tan_y))
+        self._depth = wp.empty(shape=(hori_res * vert_res,), dtype=wp.float32, device=self.device)
+        # Start with the render's point budget, grown by cast() when a ping needs more
+        self._allocate(hori_res * vert_res)
+
+    def _allocate(self, capacity: int):
+        self.capacity = capacity
+        self._candidate_surfel = wp.empty(shape=(capacity,), dtype=wp.int32, device=self.device)
+        self._candidate_pixel = wp.empty(shape=(capacity,), dtype=wp.int32, device=self.device)
+        self._candidate_range = wp.empty(shape=(capacity,), dtype=wp.float32, device=self.device)
+        self._pcl = wp.empty(shape=(capacity, 3), dtype=wp.float32, device=self.device)
+        self._normals = wp.empty(shape=(capacity, 4), dtype=wp.float32, device=self.device)
+        self._semantics = wp.empty(shape=(capacity,), dtype=wp.uint32, device=self.device)
+
+    def _fan_cells(self, camera_to_world: np.ndarray):
+        """Hash grid cell range (lo, dims) of the fan's bounding box clipped to the scene, or None."""
+        far = self.max_range
+        corners = np.array([[0.0, 0.0, 0.0, 1.0]] + [[sx * self._tan_x * far, sy * self._tan_y * far, -far, 1.0]
+                                                    for sx in (-1, 1) for sy in (-1, 1)])
+        world = (camera_to_world @ corners.T).T[:, :3]
+        lo = np.maximum(world.min(axis=0), self.scene.bounds[0])
+        hi = np.minimum(world.max(axis=0), self.scene.bounds[1])
+        if np.any(lo > hi):
+            return None
+        cell_lo = np.floor(lo / self.scene.cell_width).astype(np.int64)
+        cell_dims = np.floor(hi / self.scene.cell_width).astype(np.int64) - cell_lo + 1
+        return cell_lo, cell_dims
+
+    def cast(self, camera_to_world: np.ndarray) -> dict:
+        """Gather the visible surfels of the fan from a camera pose. Same contract as SonarRayCaster.cast().
+
+        Args:
+            camera_to_world (np.ndarray): 4x4 world transform of the camera prim (column vector convention)
+
+        Returns:
+            dict: scan_data with pcl, normals, semantics (views of internal buffers, valid until the
+                  next cast), viewTransform (4x4 world-to-camera) and idToLabels
+        """
+        camera_to_world = np.asarray(camera_to_world, dtype=np.float64).reshape(4, 4)
+        view_transform = np.linalg.inv(camera_to_world)
+        camera_pos = wp.vec3(*camera_to_world[:3, 3].astype(np.float32))
+        num_hits = 0
+
+        cells = self._fan_cells(camera_to_world)
+        if cells is not None:
+            cell_lo, cell_dims = cells
+            while True:
+                self._depth.fill_(wp.inf)
+                self._candidate_count.zero_()
+                wp.launch(kernel=surfel_gather_candidates,
+                          dim=int(np.prod(cell_dims)),
+                          inputs=[
+                              self.scene.grid.id,
+                              self.scene.cell_width,
+                              wp.vec3i(*cell_lo.tolist()),
+                              wp.vec3i(*cell_dims.tolist()),
+                              self.scene.positions,
+                              wp.mat44(view_transform.astype(np.float32)),
+                              camera_pos,
+                              self._tan_x,
+                              self._tan_y,
+                              self.hori_res,
+                              self.vert_res,
+                              self.min_range,
+                              self.max_range,
+                          ],
+                          outputs=[
+                              self._depth,
+                              self._candidate_count,
+                              self._candidate_surfel,
+                              self._candidate_pixel,
+                              self._candidate_range,
+                          ],
+                          device=self.device)
+                num_candidates = int(self._candidate_count.numpy()[0])
+                if num_candidates <= self.capacity:
+                    break
+                self._allocate(1 << int(num_candidates - 1).bit_length())
+
+            self._hit_count.zero_()
+            wp.launch(kernel=surfel_compact_visible,
+                      dim=num_candidates,
+                      inputs=[
+                          self._candidate_surfel,
+                          self._candidate_pixel,
+                          self._candidate_range,
+                          self._depth,
+                          self.depth_tolerance if self.occlusion else wp.inf,
+                          camera_pos,
+                          self.scene.positions,
+                          self.scene.normals,
+                          self.scene.semantics,
+                      ],
+                      outputs=[
+                          self._hit_count,
+                          self._pcl,
+                          self._normals,
+                          self._semantics,
+                      ],
+                      device=self.device)
+            num_hits = int(self._hit_count.numpy()[0])
+
+        return {
+            "pcl": self._pcl[:num_hits],
+            "normals": self._normals[:num_hits],
+            "semantics": self._semantics[:num_hits],
+            "viewTransform": view_transform.astype(np.float32),
+            "idToLabels": self.scene.id_to_labels,
+        }
@@ -0,0 +1,195 @@
+import json
+import os
+
+import numpy as np
+
+
+# Per-ping metadata column. pose is the sensor pose in world frame: [x, y, z, qw, qx, qy, qz]
+PING_METADATA_DTYPE = np.dtype([
+    ("ping_id", np.int64),
+    ("timestamp", np.float64),
+    ("pose", np.float64, (7,)),
+])
+
+
+class SurveyStore:
+    """Append-only on-disk store for the pings of a survey.
+
+    Pings are written into fixed-size memory-mapped .npy chunks, so RAM use stays bounded by one
+    chunk no matter how long the survey runs. Every ping also gets a metadata record
+    (ping id, timestamp, pose) in a parallel chunk. survey.json indexes the chunks.
+
+    Layout of a survey directory:
+        survey.json            row shape, dtype, chunk size and number of pings
+        pings_000000.npy       (chunk_size, *row_shape) ping rows
+        meta_000000.npy        (chunk_size,) PING_METADATA_DTYPE records
+        ...
+
+    Writing:
+        store = SurveyStore.create(path, row_shape=(num_range_bins, 4))
+        store.append(row, ping_id=..., timestamp=..., pose=...)
+        store.close()
+
+    Reading (analysis tools, no simulator needed):
+        store = SurveyStore.open(path)
+        rows = store.read(1000, 2000)          # only touches the chunks holding that range
+        meta = store.read_metadata(1000, 2000)
+    """
+
+    INDEX_FILE = "survey.json"
+
+    def __init__(self, path: str, row_shape, dtype, chunk_size: int, num_pings: int = 0, writable: bool = False):
+        self.path = path
+        self.row_shape = tuple(int(n) for n in row_shape)
+        self.dtype = np.dtype(dtype)
+        self.chunk_size = int(chunk_size)
+        self.num_pings = int(num_pings)
+        self.writable = writable
+
+        self._chunk_idx = None
+        self._pings = None
+        self._meta = None
+
+    @classmethod
+    def create(cls, path: str, row_shape, dtype=np.uint8, chunk_size: int = 1024):
+        """Start a new survey in ``path`` (created if needed).
+
+        Args:
+            path (str): Survey directory
+            row_shape (tuple): Shape of one ping row, e.g. (num_range_bins, 4)
+            dtype (optional): Row dtype. Defaults to np.uint8.
+            chunk_size (int, optional): Number of pings per chunk file. Defaults to 1024.
+        """
+        os.makedirs(path, exist_ok=True)
+        if os.path.exists(os.path.join(path, cls.INDEX_FILE)):
+            raise FileExistsError(f"A survey already exists in {path}")
+        store = cls(path, row_shape, dtype, chunk_size, writable=True)
+        store._write_index()
+        return store
+
+    @classmethod
+    def open(cls, path: str):
+        """Open an existing survey read-only."""
+        with open(os.path.join(path, cls.INDEX_FILE), "r") as f:
+            index = json.load(f)
+        return cls(path,
+                   row_shape=index["row_shape"],
+                   dtype=index["dtype"],
+                   chunk_size=index["chunk_size"],
+                   num_pings=index["num_pings"])
+
+    def __len__(self):
+        return self.num_pings
+
+    @property
+    def num_chunks(self) -> int:
+        return (self.num_pings + self.chunk_size - 1) // self.chunk_size
+
+    def _chunk_paths(self, chunk_idx: int):
+        return (os.path.join(self.path, f"pings_{chunk_idx:06d}.npy"),
+                os.path.join(self.path, f"meta_{chunk_idx:06d}.npy"))
+
+    def _write_index(self):
+        index = {
+            "row_shape": list(self.row_shape),
+            "dtype": self.dtype.str,
+            "chunk_size": self.chunk_size,
+            "num_pings": self.num_pings,
+        }
+        tmp_path = os.path.join(self.path, self.INDEX_FILE + ".tmp")
+        with open(tmp_path, "w") as f:
+            json.dump(index, f, indent=2)
+        os.replace(tmp_path, os.path.join(self.path, self.INDEX_FILE))
+
+    def _open_write_chunk(self, chunk_idx: int):
+        self._release_write_chunk()
+        pings_path, meta_path = self._chunk_paths(chunk_idx)
+        if os.path.exists(pings_path):
+            # Resuming a partially filled chunk
+            self._pings = np.load(pings_path, mmap_mode="r+")
+            self._meta = np.load(meta_path, mmap_mode="r+")
+        else:
+            self._pings = np.lib.format.open_memmap(pings_path, mode="w+", dtype=self.dtype,
+                                                    shape=(self.chunk_size,) + self.row_shape)
+            self._meta = np.lib.format.open_memmap(meta_path, mode="w+", dtype=PING_METADATA_DTYPE,
+                                                   shape=(self.chunk_size,))
+        self._chunk_idx = chunk_idx
+
+    def _release_write_chunk(self):
+        if self._pings is not None:
+            self._pings.flush()
+            self._meta.flush()
+        self._pings = None
+        self._meta = None
+        self._chunk_idx = None
+
+    def append(self, row: np.ndarray, ping_id: int, timestamp: float, pose=None):
+        """Append one ping.
+
+        Args:
+            row (np.ndarray): Ping row with shape row_shape
+            ping_id (int): Sensor frame id of the ping
+            timestamp (float): Time of the ping in seconds
+            pose (optional): Sensor world pose [x, y, z, qw, qx, qy, qz]. NaN if not given.
+        """
+        if not self.writable:
+            raise IOError(f"Survey {self.path} is opened read-only")
+        chunk_idx, offset = divmod(self.num_pings, self.chunk_size)
+        if chunk_idx != self._chunk_idx:
+            self._open_write_chunk(chunk_idx)
+
+        self._pings[offset] = row
+        self._meta[offset]["ping_id"] = ping_id
+        self._meta[offset]["timestamp"] = timestamp
+        self._meta[offset]["pose"] = np.nan if pose is None else pose
+        self.num_pings += 1
+
+        # A full chunk is flushed and unmapped so its pages can leave memory
+        if offset == self.chunk_size - 1:
+            self._release_write_chunk()
+            self._write_index()
+
+    def flush(self):
+        """Flush the open chunk and update the index, e.g. periodically during a long survey."""
+        if self._pings is not None:
+            self._pings.flush()
+            self._meta.flush()
+        if self.writable:
+            self._write_index()
+
+    def close(self):
+        self._release_write_chunk()
+        if self.writable:
+            self._write_index()
+        self.writable = False
+
+    def _read(self, start: int, stop: int, meta: bool):
+        start, stop, _ = slice(start, stop).indices(self.num_pings)
+        parts = []
+        for chunk_idx in range(start // self.chunk_size, (max(stop, start + 1) - 1) // self.chunk_size + 1):
+            chunk_start = chunk_idx * self.chunk_size
+            lo = max(start, chunk_start) - chunk_start
+            hi = min(stop, chunk_start + self.chunk_size) - chunk_start
+            if hi <= lo:
+                continue
+            path = self._chunk_paths(chunk_idx)[1 if meta else 0]
+            parts.append(np.load(path, mmap_mode="r")[lo:hi])
+        if not parts:
+            shape = (0,) if meta else (0,) + self.row_shape
+            return np.empty(shape, dtype=PING_METADATA_DTYPE if meta else self.dtype)
+        return parts[0] if len(parts) == 1 else np.concatenate(parts)
+
+    def read(self, start: int = 0, stop: int = None) -> np.ndarray:
+        """Ping rows [start, stop). Within a single chunk this is a read-only memmap view, otherwise a copy."""
+        return self._read(start, self.num_pings if stop is None else stop, meta=False)
+
+    def read_metadata(self, start: int = 0, stop: int = None) -> np.ndarray:
+        """Metadata records [start, stop) with fields ping_id, timestamp and pose."""
+        return self._read(start, self.num_pings if stop is None else stop, meta=True)
+
+    def iter_chunks(self):
+        """Yield (start, rows, metadata) per chunk without loading the whole survey."""
+        for chunk_idx in range(self.num_chunks):
+            start = chunk_idx * self.chunk_size
+            stop = min(start + self.chunk_size, self.num_pings)
+            yield start, self.read(start, stop), self.read_metadata(start, stop)
@@ -0,0 +1,157 @@
+"""The optimized side-scan paths against their reference paths, on the Warp CPU device.
+
+Every optimized path claims to produce the same pings as the path it replaces: the fused kernels as
+the original kernel chain, the sensor group as one sensor at a time, the parameter sweep as a replay
+per parameter set and the binning engines as the atomic one. Runs without Isaac Sim on the synthetic
+pings of the benchmark.
+
+    python -m pytest tests
+"""
+import os
+import sys
+
+import numpy as np
+import pytest
+import warp as wp
+
+TESTS_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(TESTS_DIR))
+sys.path.insert(0, os.path.join(os.path.dirname(TESTS_DIR), "benchmarks"))
+
+from benchmark_sonar_kernels import make_synthetic_ping, INDEX_TO_REFL
+from frame_recorder import FrameRecorder, SideScanReplay
+from side_scan_pipeline import SideScanProcessor, SideScanGroupProcessor
+from side_scan_sweep import SideScanSweep, parameter_grid
+
+wp.config.quiet = True
+
+DEVICE = "cpu"
+MIN_RANGE, MAX_RANGE, RANGE_RES = 8.0, 10.0, 0.001
+NUM_POINTS = 50_000
+
+# idToLabels of the synthetic semantic ids, reflectivity as in INDEX_TO_REFL
+ID_TO_LABELS = {
+    "0": {"class": "BACKGROUND"},
+    "1": {"class": "UNLABELLED"},
+    "2": {"reflectivity": float(INDEX_TO_REFL[2])},
+    "3": {"reflectivity": float(INDEX_TO_REFL[3])},
+    "4": {"reflectivity": float(INDEX_TO_REFL[4])},
+}
+
+
+def make_frame(seed: int, num_points: int = NUM_POINTS) -> dict:
+    """Synthetic ping as the processors take it, device arrays plus viewTransform and indexToRefl."""
+    ping = make_synthetic_ping(num_points, MIN_RANGE, MAX_RANGE, seed=seed)
+    return {
+        "pcl": wp.array(ping["pcl"], device=DEVICE),
+        "normals": wp.array(ping["normals"], device=DEVICE),
+        "semantics": wp.array(ping["semantics"], device=DEVICE),
+        "viewTransform": ping["viewTransform"],
+        "indexToRefl": wp.array(INDEX_TO_REFL, device=DEVICE),
+    }
+
+
+def outputs(processor: SideScanProcessor) -> list:
+    return [processor.side_sonar_data.numpy().copy(),
+            processor.out_array.numpy().copy(),
+            processor.side_sonar_image.numpy().copy()]
+
+
+@pytest.mark.parametrize("normalizing_method", ["all", "range"])
+def test_fused_matches_reference(normalizing_method):
+    # Single channel: dual-channel processing has no reference chain
+    processor = SideScanProcessor(MIN_RANGE, MAX_RANGE, RANGE_RES, device=DEVICE)
+    processor.set_normalizing_method(normalizing_method, range_window=4)
+    frames = [make_frame(seed) for seed in range(3)]
+
+    results = {}
+    for fused in (False, True):
+        processor.reset_range_history()
+        results[fused] = []
+        for seed, frame in enumerate(frames):
+            processor.bin_points(attenuation=0.7, fused=fused, **frame)
+            processor.post_process(seed=seed, gau_noise_param=0.1, fused=fused)
+            results[fused].append(outputs(processor))
+
+    for reference, fused in zip(results[False], results[True]):
+        for expected, actual in zip(reference, fused):
+            np.testing.assert_array_equal(actual, expected)
+
+
+@pytest.mark.parametrize("num_channels", [1, 2])
+def test_binning_engines_agree(num_channels):
+    frame = make_frame(seed=1, num_points=200_000)
+    binned = {}
+    for method in ("atomic", "privatized", "sorted"):
+        processor = SideScanProcessor(MIN_RANGE, MAX_RANGE, RANGE_RES, device=DEVICE, num_channels=num_channels)
+        processor.binning.set_method(method)
+        processor.bin_points(**frame)
+        binned[method] = (processor.bin_sum.numpy(), processor.bin_count.numpy())
+
+    bin_sum, bin_count = binned["atomic"]
+    for method in ("privatized", "sorted"):
+        # Only the order of the float additions differs
+        np.testing.assert_array_equal(binned[method][1], bin_count)
+        np.testing.assert_allclose(binned[method][0], bin_sum, rtol=1e-5, atol=1e-6)
+
+
+def test_group_matches_single_sensor():
+    # The third sensor does not ping
+    frames = [make_frame(seed=0), make_frame(seed=1, num_points=20_000), None, make_frame(seed=3, num_points=5_000)]
+    seeds = [11, 12, 13, 14]
+
+    expected = []
+    for frame, seed in zip(frames, seeds):
+        if frame is None:
+            expected.append(None)
+            continue
+        processor = SideScanProcessor(MIN_RANGE, MAX_RANGE, RANGE_RES, device=DEVICE)
+        # The group accumulates with atomics
+        processor.binning.set_method("atomic")
+        processor.bin_points(attenuation=0.7, **frame)
+        processor.post_process(seed=seed, gau_noise_param=0.1)
+        expected.append(outputs(processor) + [processor.bin_count.numpy().copy()])
+
+    processors = [SideScanProcessor(MIN_RANGE, MAX_RANGE, RANGE_RES, device=DEVICE) for _ in frames]
+    group = SideScanGroupProcessor(processors)
+    group.process(frames, seeds=seeds, attenuation=0.7, gau_noise_param=0.1)
+
+    for processor, reference in zip(processors, expected):
+        if reference is None:
+            continue
+        for want, got in zip(reference, outputs(processor) + [processor.bin_count.numpy()]):
+            np.testing.assert_array_equal(got, want)
+
+
+@pytest.fixture(scope="module")
+def recording(tmp_path_factory):
+    path = str(tmp_path_factory.mktemp("side_scan") / "frames")
+    recorder = FrameRecorder.create(path, sensor_config={"min_range": MIN_RANGE,
+                                                         "max_range": MAX_RANGE,
+                                                         "range_res": RANGE_RES,
+                                                         "num_channels": 1,
+                                                         "normalizing_method": "all",
+                                                         "range_window": 3,
+                                                         "fused": True})
+    for seed in range(5):
+        ping = make_synthetic_ping(NUM_POINTS, MIN_RANGE, MAX_RANGE, seed=seed)
+        recorder.append({"pcl": wp.array(ping["pcl"], device=DEVICE),
+                         "normals": wp.array(ping["normals"], device=DEVICE),
+                         "semantics": wp.array(ping["semantics"], device=DEVICE),
+                         "viewTransform": ping["viewTransform"],
+                         "idToLabels": ID_TO_LABELS}, ping_id=100 + seed)
+    recorder.close()
+    return path
+
+
+@pytest.mark.parametrize("normalizing_method", ["all", "range"])
+def test_sweep_matches_replay(recording, normalizing_method):
+    param_sets = parameter_grid(attenuation=[0.5, 1.0], gau_noise_param=[0.05, 0.2], intensity_gain=[1.0, 2.0])
+    sweep = SideScanSweep(recording, param_sets, device=DEVICE, normalizing_method=normalizing_method)
+    rows = sweep.render()
+    # A second run starts from an empty per-range history again
+    np.testing.assert_array_equal(sweep.render(), rows)
+
+    replay = SideScanReplay(recording, device=DEVICE, normalizing_method=normalizing_method)
+    for k, params in enumerate(sweep.param_sets):
+        np.testing.assert_array_equal(rows[k], replay.render(**params))
@@ -0,0 +1,260 @@
+import json
+import os
+import struct
+import zlib
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+import cv2
+import numpy as np
+
+
+class _PyramidLevel:
+    """Row accumulator for one zoom level. Collects rows until a full band of tiles can be cut."""
+
+    def __init__(self, level: int, width: int, tile_size: int):
+        self.level = level
+        self.width = width
+        self.band = np.zeros((tile_size, width), dtype=np.uint8)
+        self.band_rows = 0     # rows filled in the current band
+        self.num_rows = 0      # rows received in total
+        self.num_bands = 0     # bands already cut into tiles
+        self.written_bands = 0 # leading bands whose tiles are all on disk
+        self.written_rows = 0  # rows of those bands
+        self.pending = deque() # (rows, futures) of the bands still being encoded, oldest first
+
+
+def _write_tile(path: str, tile: np.ndarray):
+    # cv2.imwrite reports most failures through its return value only
+    if not cv2.imwrite(path, tile):
+        raise IOError(f"Failed to write tile {path}")
+
+
+class WaterfallTileExporter:
+    """Incremental, tiled and pyramidal export of a survey waterfall.
+
+    Rows are fed one ping at a time (or in blocks) while the survey runs. Each time tile_size
+    rows have arrived at a zoom level, that band is cut into tile_size x tile_size grayscale PNG
+    tiles which are encoded by a worker pool, and a 2x downsampled copy of the band is fed to the
+    next level. Surveys of any length can be exported this way (no PNG size limit, no giant
+    synchronous encode), browsed level by level and fed to SonarFeatureDetector tile by tile.
+    tiles.json only ever lists bands whose tiles are all written. A failed tile write is raised
+    by a later add_rows(), flush() or finalize() call.
+
+    Layout of the output directory:
+        tiles.json                   tile size, and rows/cols/tile counts of every level
+        level_0/{ty:05d}_{tx:03d}.png   full resolution tiles
+        level_1/...                     2x downsampled in both directions
+        ...
+    """
+
+    INDEX_FILE = "tiles.json"
+
+    def __init__(self,
+                 output_dir: str,
+                 width: int,
+                 tile_size: int = 256,
+                 num_levels: int = None,
+                 max_workers: int = 4):
+        """
+        Args:
+            output_dir (str): Directory receiving the tiles and tiles.json
+            width (int): Number of columns of a waterfall row (num_range_bins)
+            tile_size (int, optional): Tile edge in pixels, must be even. Defaults to 256.
+            num_levels (int, optional): Number of zoom levels. Defaults to enough levels for the
+                                        coarsest one to fit in a single tile column.
+            max_workers (int, optional): Encoder threads. Defaults to 4.
+        """
+        if tile_size % 2 != 0:
+            raise ValueError(f"tile_size must be even, got {tile_size}")
+        if num_levels is None:
+            num_levels = 1
+            while (width >> (num_levels - 1)) > tile_size:
+                num_levels += 1
+
+        self.output_dir = output_dir
+        self.tile_size = tile_size
+        self.levels = []
+        level_width = width
+        for level in range(num_levels):
+            os.makedirs(os.path.join(output_dir, f"level_{level}"), exist_ok=True)
+            self.levels.append(_PyramidLevel(level, level_width, tile_size))
+            level_width = (level_width + 1) // 2
+
+        self._pool = ThreadPoolExecutor(max_workers=max_workers)
+        self._closed = False
+
+    @staticmethod
+    def _downsample(band: np.ndarray) -> np.ndarray:
+        # 2x2 box filter; an odd last column is paired with itself
+        if band.shape[1] % 2 == 1:
+            band = np.concatenate([band, band[:, -1:]], axis=1)
+        band = band.astype(np.uint16)
+        return ((band[0::2, 0::2] + band[1::2, 0::2] + band[0::2, 1::2] + band[1::2, 1::2] + 2) // 4).astype(np.uint8)
+
+    def tile_path(self, level: int, ty: int, tx: int) -> str:
+        return os.path.join(self.output_dir, f"level_{level}", f"{ty:05d}_{tx:03d}.png")
+
+    def _emit_band(self, lvl: _PyramidLevel, rows: int):
+        band = lvl.band[:rows].copy()
+        ty = lvl.num_bands
+        futures = []
+        for tx, col in enumerate(range(0, lvl.width, self.tile_size)):
+            tile = band[:, col:col + self.tile_size]
+            futures.append(self._pool.submit(_write_tile, self.tile_path(lvl.level, ty, tx), tile))
+        lvl.pending.append((rows, futures))
+        lvl.num_bands += 1
+        lvl.band_rows = 0
+        # Retire the bands that are done so the queue does not grow with the survey
+        self._collect(lvl, wait=False)
+        return band
+
+    def _collect(self, lvl: _PyramidLevel, wait: bool):
+        """Count the leading bands of a level whose tiles are written, raising the errors of failed writes."""
+        while lvl.pending:
+            rows, futures = lvl.pending[0]
+            if not wait and not all(future.done() for future in futures):
+                return
+            for future in futures:
+                future.result()
+            lvl.pending.popleft()
+            lvl.written_bands += 1
+            lvl.written_rows += rows
+
+    def _push(self, level: int, rows: np.ndarray):
+        lvl = self.levels[level]
+        while rows.shape[0] > 0:
+            n = min(self.tile_size - lvl.band_rows, rows.shape[0])
+            lvl.band[lvl.band_rows:lvl.band_rows + n] = rows[:n]
+            lvl.band_rows += n
+            lvl.num_rows += n
+            rows = rows[n:]
+            if lvl.band_rows == self.tile_size:
+                band = self._emit_band(lvl, self.tile_size)
+                if level + 1 < len(self.levels):
+                    self._push(level + 1, self._downsample(band))
+
+    def add_row(self, row: np.ndarray):
+        """Append one ping row of shape (width,) or (width, C)."""
+        self.add_rows(np.asarray(row)[None])
+
+    def add_rows(self, rows: np.ndarray):
+        """Append a block of waterfall rows.
+
+        Args:
+            rows (np.ndarray): (N, width) or (N, width, C). For RGBA input only the first channel
+                               is kept, the waterfall is grayscale.
+        """
+        if self._closed:
+            raise RuntimeError("Tile export already finalized")
+        rows = np.asarray(rows)
+        if rows.ndim == 3:
+            rows = rows[:, :, 0]
+        self._push(0, rows.astype(np.uint8, copy=False))
+
+    def _write_index(self):
+        index = {
+            "tile_size": self.tile_size,
+            "format": "png",
+            "levels": [{
+                "level": lvl.level,
+                "rows": lvl.written_rows,
+                "cols": lvl.width,
+                "tiles_y": lvl.written_bands,
+                "tiles_x": (lvl.width + self.tile_size - 1) // self.tile_size,
+            } for lvl in self.levels],
+        }
+        with open(os.path.join(self.output_dir, self.INDEX_FILE), "w") as f:
+            json.dump(index, f, indent=2)
+
+    def flush(self, wait: bool = False):
+        """Update tiles.json with the bands written so far, so a running survey can be browsed.
+
+        Args:
+            wait (bool, optional): Wait for the tiles still being encoded. Defaults to False, which
+                                   leaves them to a later flush() and never blocks the caller.
+        """
+        for lvl in self.levels:
+            self._collect(lvl, wait=wait)
+        self._write_index()
+
+    def finalize(self):
+        """Flush the partial bands of every level, wait for the encoders and write tiles.json."""
+        if self._closed:
+            return
+        for level, lvl in enumerate(self.levels):
+            if lvl.band_rows == 0:
+                continue
+            rows = lvl.band_rows
+            band = self._emit_band(lvl, rows)
+            if level + 1 < len(self.levels) and rows > 1:
+                self._push(level + 1, self._downsample(band[:rows - rows % 2]))
+        try:
+            for lvl in self.levels:
+                self._collect(lvl, wait=True)
+        finally:
+            self._pool.shutdown(wait=True)
+            self._closed = True
+            self._write_index()
+
+
+def iter_tiles(tiles_dir: str, level: int = 0):
+    """Yield (ty, tx, path) for every tile of a zoom level written by WaterfallTileExporter.
+
+    Useful to run e.g. SonarFeatureDetector(path).analyze_all() tile by tile.
+    """
+    with open(os.path.join(tiles_dir, WaterfallTileExporter.INDEX_FILE), "r") as f:
+        index = json.load(f)
+    info = index["levels"][level]
+    for ty in range(info["tiles_y"]):
+        for tx in range(info["tiles_x"]):
+            yield ty, tx, os.path.join(tiles_dir, f"level_{level}", f"{ty:05d}_{tx:03d}.png")
+
+
+def export_survey_tiles(store, output_dir: str, tile_size: int = 256, num_levels: int = None, max_workers: int = 4):
+    """Build the tile pyramid of a recorded SurveyStore after the fact, one chunk at a time."""
+    exporter = WaterfallTileExporter(output_dir,
+                                     width=store.row_shape[0],
+                                     tile_size=tile_size,
+                                     num_levels=num_levels,
+                                     max_workers=max_workers)
+    for _, rows, _ in store.iter_chunks():
+        exporter.add_rows(rows)
+    exporter.finalize()
+    return exporter
+
+
+def _png_chunk(f, tag: bytes, data: bytes):
+    f.write(struct.pack(">I", len(data)))
+    f.write(tag)
+    f.write(data)
+    f.write(struct.pack(">I", zlib.crc32(data, zlib.crc32(tag)) & 0xFFFFFFFF))
+
+
+def export_survey_png(store, path: str, compress_level: int = 6):
+    """Write a recorded SurveyStore as one 8-bit grayscale PNG, streamed chunk by chunk.
+
+    cv2.imwrite needs the whole image in memory; here every store chunk is deflated and written
+    as it is read, so memory stays bounded by one chunk. For RGBA rows only the first channel is
+    kept, like the tiles. The PNG format limits both dimensions to 65535 pixels.
+    """
+    height, width = len(store), store.row_shape[0]
+    if height > 65535 or width > 65535:
+        raise ValueError(f"Image dimensions {(height, width)} exceed PNG limits (65535x65535)")
+    compressor = zlib.compressobj(compress_level)
+    with open(path, "wb") as f:
+        f.write(b"\x89PNG\r\n\x1a\n")
+        # Width, height, bit depth 8, color type 0 (grayscale), deflate, adaptive filtering, no interlace
+        _png_chunk(f, b"IHDR", struct.pack(">IIBBBBB", width, height, 8, 0, 0, 0, 0))
+        for _, rows, _ in store.iter_chunks():
+            if rows.ndim == 3:
+                rows = rows[:, :, 0]
+            # Every scanline starts with its filter type, 0 = none
+            lines = np.zeros((rows.shape[0], width + 1), dtype=np.uint8)
+            lines[:, 1:] = rows
+            data = compressor.compress(lines.tobytes())
+            if data:
+                _png_chunk(f, b"IDAT", data)
+        _png_chunk(f, b"IDAT", compressor.flush())
+        _png_chunk(f, b"IEND", b"")
+    return path